@@ -0,0 +1,173 @@
+"""Cost of the vectorized voting analytics on a large storm.
+
+Builds a storm with 10k participants and 1k ideas (each participant
+spreads a 5 blue / 3 red budget over a few ideas, popular ideas drawing
+more votes), then times loading the votes into arrays, each analytics
+stage, the whole endpoint (uncached, then cached once the storm is in
+``results``), and a plain Python loop doing the same bootstrap as a
+baseline.
+
+    python benchmarks/bench_analytics.py [--participants 10000] [--ideas 1000] [--resamples 200]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from flask import Flask
+from sqlalchemy import insert
+
+import src.config  # noqa: F401  (WAL and busy timeout for SQLite connections)
+from src.json_provider import StormJSONProvider
+from src.migrations import upgrade
+from src.models.user import db
+from src.models.storm import Storm, Idea, Vote
+from src.routes.storm import storm_bp
+from src.services import analytics
+
+STORM_ID = 'BENCH1'
+BLUE, RED = 5, 3
+
+
+def make_app(path):
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'bench'
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    app.json = StormJSONProvider(app)
+    app.register_blueprint(storm_bp, url_prefix='/api')
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        upgrade(db.engine)
+    return app
+
+
+def populate(participants, ideas):
+    db.session.add(Storm(id=STORM_ID, title='analytics', status='voting', moderator_id='session-moderator',
+                         token_budget_json=json.dumps({'blue': BLUE, 'red': RED})))
+    start = datetime.utcnow()
+    idea_ids = [str(uuid.uuid4()) for _ in range(ideas)]
+    db.session.execute(insert(Idea), [
+        {'id': idea_id, 'storm_id': STORM_ID, 'title': f'idea {i}', 'author_id': 'session-moderator',
+         'author_username': 'moderator', 'created_at': start + timedelta(microseconds=i)}
+        for i, idea_id in enumerate(idea_ids)
+    ])
+
+    # Zipf-like popularity so the top of the ranking is contested
+    popularity = [1 / (i + 1) ** 0.8 for i in range(ideas)]
+    votes = []
+    for p in range(participants):
+        user_id = f'session-{p}'
+        blue, red = random.randint(2, BLUE), random.randint(0, RED)
+        chosen = set()
+        while len(chosen) < min(ideas, 6):
+            chosen.add(random.choices(range(ideas), popularity)[0])
+        chosen = list(chosen)
+        random.shuffle(chosen)
+        for idea in chosen:
+            if blue:
+                spend = random.randint(1, blue)
+                blue -= spend
+                votes.append((idea, user_id, spend, 0))
+            elif red:
+                spend = random.randint(1, red)
+                red -= spend
+                votes.append((idea, user_id, 0, spend))
+    db.session.execute(insert(Vote), [
+        {'id': str(uuid.uuid4()), 'idea_id': idea_ids[idea], 'storm_id': STORM_ID, 'user_id': user_id,
+         'blue_tokens': blue, 'red_tokens': red, 'comment': ''}
+        for idea, user_id, blue, red in votes
+    ])
+    db.session.commit()
+    return len(votes)
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def python_bootstrap(idea_index, user_index, net, n_ideas, n_users, resamples):
+    """Row-by-row reference: resample participants, rescore, rerank."""
+    by_user = [[] for _ in range(n_users)]
+    for idea, user, value in zip(idea_index.tolist(), user_index.tolist(), net.tolist()):
+        by_user[user].append((idea, value))
+    for _ in range(resamples):
+        scores = [0] * n_ideas
+        for _ in range(n_users):
+            for idea, value in by_user[random.randrange(n_users)]:
+                scores[idea] += value
+        order = sorted(range(n_ideas), key=lambda i: -scores[i])
+        ranks = [0] * n_ideas
+        for position, idea in enumerate(order, start=1):
+            ranks[idea] = position
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--participants', type=int, default=10000)
+    parser.add_argument('--ideas', type=int, default=1000)
+    parser.add_argument('--resamples', type=int, default=200)
+    parser.add_argument('--baseline-resamples', type=int, default=5,
+                        help='Resamples for the Python baseline (extrapolated to --resamples)')
+    args = parser.parse_args()
+    random.seed(7)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'analytics.db'))
+        with app.app_context():
+            vote_count, elapsed = timed(populate, args.participants, args.ideas)
+            print(f'{args.participants} participants, {args.ideas} ideas, {vote_count} votes '
+                  f'(setup {elapsed:.1f}s)\n')
+
+            arrays, load = timed(analytics.load_vote_arrays, STORM_ID)
+            idea_ids, user_ids, idea_index, user_index, blue, red = arrays
+            net = blue - red
+            print(f'{"load votes into arrays":<32}{load * 1000:9.1f} ms')
+
+            _, stats = timed(analytics.analyze, *arrays, resamples=0)
+            print(f'{"scores, consensus, influence":<32}{stats * 1000:9.1f} ms')
+
+            _, boot = timed(analytics.bootstrap_ranks, idea_index, user_index, net,
+                            len(idea_ids), len(user_ids), args.resamples, 1)
+            print(f'{f"bootstrap ({args.resamples} resamples)":<32}{boot * 1000:9.1f} ms')
+
+            _, baseline = timed(python_bootstrap, idea_index, user_index, net,
+                                len(idea_ids), len(user_ids), args.baseline_resamples)
+            baseline *= args.resamples / args.baseline_resamples
+            print(f'{"python loop bootstrap (est.)":<32}{baseline * 1000:9.1f} ms  '
+                  f'({baseline / boot:.0f}x slower)\n')
+
+        client = app.test_client()
+        url = f'/api/storms/{STORM_ID}/analytics?resamples={args.resamples}'
+        response, live = timed(client.get, url)
+        assert response.status_code == 200, response.get_json()
+        print(f'{"endpoint, voting phase":<32}{live * 1000:9.1f} ms')
+
+        with app.app_context():
+            db.session.get(Storm, STORM_ID).status = 'results'
+            db.session.commit()
+        _, first = timed(client.get, url)
+        response, cached = timed(client.get, url)
+        print(f'{"endpoint, results (first)":<32}{first * 1000:9.1f} ms')
+        print(f'{"endpoint, results (cached)":<32}{cached * 1000:9.1f} ms')
+
+        body = response.get_json()
+        widths = [idea['rankHigh'] - idea['rankLow'] for idea in body['ideas'][:10]]
+        print(f'\ntop 10 rank interval widths: {widths}')
+        print(f'most influential participant: {body["participants"][0]["influence"]} places moved')
+        np.testing.assert_array_equal([idea['rank'] for idea in body['ideas']],
+                                      np.arange(1, len(body['ideas']) + 1))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Encoding throughput of a 1,000-idea storm snapshot.
+
+Compares the previous path (to_dict() formatting every datetime with
+isoformat(), then Flask's default provider) with StormJSONProvider, with
+and without orjson installed.
+
+    python benchmarks/bench_json.py
+"""
+import os
+import sys
+import time
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from src import json_provider
+from src.models.storm import Storm, Idea, Vote, AnonymousUser
+
+IDEAS = 1000
+VOTES_PER_IDEA = 5
+ROUNDS = 20
+
+
+def build_storm():
+    now = datetime.utcnow()
+    storm = Storm(id='STORM-BENCH1', title='bench', description='', status='results',
+                  moderator_id='session-mod', revision=0, created_at=now, updated_at=now,
+                  token_budget={'maxBlue': 5, 'maxRed': 3})
+    for i in range(IDEAS):
+        idea = Idea(id=str(uuid.uuid4()), title=f'Idea {i}', description='Some description ' * 4,
+                    author_id=f'session-{i % 50}', author_username=f'user {i % 50}',
+                    created_at=now, updated_at=now)
+        storm.ideas.append(idea)
+        for v in range(VOTES_PER_IDEA):
+            storm.votes.append(Vote(id=str(uuid.uuid4()), idea_id=idea.id, user_id=f'session-{v}',
+                                    blue_tokens=1, red_tokens=0, comment='looks good', created_at=now))
+    for u in range(50):
+        storm.participants.append(AnonymousUser(session_id=f'session-{u}', username=f'user {u}',
+                                                role='participant', created_at=now))
+    return storm
+
+
+def previous_to_dict(storm):
+    """Storm.to_dict() as it was before datetimes were left to the provider."""
+    data = storm.to_dict()
+    for key in ('createdAt', 'updatedAt'):
+        data[key] = data[key].isoformat()
+    for item in data['ideas']:
+        item['createdAt'] = item['createdAt'].isoformat()
+        item['updatedAt'] = item['updatedAt'].isoformat()
+    for item in data['votes'] + data['participants']:
+        item['createdAt'] = item['createdAt'].isoformat()
+    return data
+
+
+def measure(label, encode):
+    size = len(encode())
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        encode()
+    elapsed = (time.perf_counter() - start) / ROUNDS
+    print(f'{label:<32} {elapsed * 1000:>8.2f} ms {size / elapsed / 1e6:>8.1f} MB/s')
+
+
+def main():
+    app = Flask(__name__)
+    default = DefaultJSONProvider(app)
+    storm = build_storm()
+
+    print(f'{"path":<32} {"per encode":>11} {"throughput":>11}')
+    measure('previous (isoformat + default)',
+            lambda: default.dumps(previous_to_dict(storm)).encode())
+    if json_provider.orjson is not None:
+        measure('StormJSONProvider (orjson)', lambda: json_provider.dumps_bytes(storm.to_dict()))
+    orjson, json_provider.orjson = json_provider.orjson, None
+    try:
+        measure('StormJSONProvider (stdlib)', lambda: json_provider.dumps_bytes(storm.to_dict()))
+    finally:
+        json_provider.orjson = orjson
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+"""Vote throughput of the in-memory live engine against the ORM path, and crash recovery.
+
+Runs the same vote workload (participants voting one token at a time on
+random ideas, votes replacing each other) twice on one SQLite file: once
+through the database path, once with ``LIVE_VOTING``. It reports votes/s
+through the Flask test client and the cost of the vote logic alone,
+waits for the write-behind writer, then checks budgets, ledger and
+uniqueness on the database.
+
+Then a child process votes with the writer stalled and kills itself with
+SIGKILL; the parent restarts the engine on the same files and checks that
+exactly the acknowledged votes are in the database.
+
+    python benchmarks/bench_live_votes.py [--votes 5000] [--participants 200] [--ideas 20]
+"""
+import argparse
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stress_votes import MAX_BLUE, MAX_RED, check_invariants, make_app
+
+from src.models.storm import db, Storm, Vote
+from src.services.ledger import open_ledger
+from src.services.live import live_engine
+from src.services.locks import storm_write_lock
+from src.services.voting import cast_votes, parse_allocation
+
+
+def setup_storm(app, participants, ideas):
+    moderator = app.test_client()
+    storm_id = moderator.post('/api/storms', json={
+        'title': 'live', 'blueTokens': MAX_BLUE, 'redTokens': MAX_RED
+    }).get_json()['storm']['id']
+    idea_ids = [moderator.post(f'/api/storms/{storm_id}/ideas', json={'title': f'idea {i}'}).get_json()['id']
+                for i in range(ideas)]
+    clients = []
+    for i in range(participants):
+        client = app.test_client()
+        client.post(f'/api/storms/{storm_id}/join', json={'username': f'user {i}'})
+        clients.append(client)
+    moderator.post(f'/api/storms/{storm_id}/advance-phase')
+    return storm_id, idea_ids, clients
+
+
+def random_vote():
+    if random.random() < 0.6:
+        return {'blueTokens': 1, 'redTokens': 0, 'comment': 'go'}
+    return {'blueTokens': 0, 'redTokens': 1, 'comment': 'no'}
+
+
+def http_votes(idea_ids, clients, count):
+    """Return (votes/s, acknowledged votes) for ``count`` single-vote requests."""
+    acknowledged = []
+    start = time.perf_counter()
+    for _ in range(count):
+        client = random.choice(clients)
+        response = client.post(f'/api/ideas/{random.choice(idea_ids)}/vote', json=random_vote())
+        if response.status_code == 201:
+            acknowledged.append(response.get_json())
+    return count / (time.perf_counter() - start), acknowledged
+
+
+def vote_logic_us(app, storm_id, idea_ids, live, count):
+    """Cost of checking and applying one vote, without HTTP: ORM + commit, or the engine."""
+    user_ids = [f'session-direct-{i}' for i in range(50)]
+    with app.app_context():
+        for user_id in user_ids:
+            open_ledger(storm_id, user_id)
+        db.session.commit()
+        storm = db.session.get(Storm, storm_id)
+        start = time.perf_counter()
+        for i in range(count):
+            allocation = parse_allocation(dict(random_vote(), ideaId=random.choice(idea_ids)))
+            user_id = user_ids[i % len(user_ids)]
+            try:
+                if live:
+                    live_engine.storm(storm_id).cast_votes(live_engine, user_id, [allocation])
+                else:
+                    with storm_write_lock(storm_id):
+                        cast_votes(storm, user_id, [allocation], check_ideas=False)
+                        db.session.commit()
+            except Exception:
+                db.session.rollback()
+        return (time.perf_counter() - start) / count * 1e6
+
+
+def crash_child(db_path, log_path, out_path, votes):
+    """Vote with the writer stalled, record what was acknowledged, then die without cleanup."""
+    live_engine.enabled = True
+    live_engine.log_path = log_path
+    live_engine.flush_interval = 3600
+    app = make_app(db_path)
+    live_engine.start(app)
+    storm_id, idea_ids, clients = setup_storm(app, 20, 10)
+    final = {}
+    for _ in range(votes):
+        client = random.choice(clients)
+        response = client.post(f'/api/ideas/{random.choice(idea_ids)}/vote', json=random_vote())
+        if response.status_code == 201:
+            vote = response.get_json()
+            final[(vote['userId'], vote['ideaId'])] = vote['id']
+    with open(out_path, 'w') as f:
+        json.dump({'stormId': storm_id, 'voteIds': sorted(final.values())}, f)
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+def crash_test(tmp, votes):
+    db_path, log_path, out_path = (os.path.join(tmp, name) for name in ('crash.db', 'crash.log', 'crash.json'))
+    child = subprocess.run([sys.executable, __file__, '--crash-child', tmp, '--votes', str(votes)])
+    assert child.returncode == -signal.SIGKILL, child.returncode
+    with open(out_path) as f:
+        expected = json.load(f)
+    log_lines = sum(1 for _ in open(log_path, 'rb'))
+
+    app = make_app(db_path)
+    with app.app_context():
+        persisted_before = Vote.query.filter_by(storm_id=expected['stormId']).count()
+    live_engine.enabled = True
+    live_engine.log_path = log_path
+    live_engine.start(app)
+    with app.app_context():
+        found = sorted(vote_id for (vote_id,) in db.session.query(Vote.id).filter_by(storm_id=expected['stormId']))
+        violations = check_invariants()
+    live_engine.stop()
+
+    print(f'\ncrash test: {log_lines} acknowledged vote requests in the log, '
+          f'{persisted_before} votes in the database at the crash')
+    print(f'after recovery: {len(found)} votes, expected {len(expected["voteIds"])}, '
+          f'{"match" if found == expected["voteIds"] else "MISMATCH"}')
+    return found == expected['voteIds'] and not violations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--votes', type=int, default=5000)
+    parser.add_argument('--participants', type=int, default=200)
+    parser.add_argument('--ideas', type=int, default=20)
+    parser.add_argument('--crash-child', metavar='DIR', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    random.seed(11)
+
+    if args.crash_child:
+        crash_child(*(os.path.join(args.crash_child, name) for name in ('crash.db', 'crash.log', 'crash.json')),
+                    min(args.votes, 500))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'live.db'))
+        results = {}
+        for live in (False, True):
+            if live:
+                live_engine.enabled = True
+                live_engine.log_path = os.path.join(tmp, 'live.log')
+                live_engine.start(app)
+            storm_id, idea_ids, clients = setup_storm(app, args.participants, args.ideas)
+            rate, acknowledged = http_votes(idea_ids, clients, args.votes)
+            logic = vote_logic_us(app, storm_id, idea_ids, live, args.votes)
+            results[live] = (rate, logic)
+            print(f'{"live engine" if live else "database path":<14} {rate:8.0f} votes/s over HTTP '
+                  f'({len(acknowledged)} accepted), vote logic {logic:8.1f} us/vote')
+
+        start = time.perf_counter()
+        live_engine.stop()
+        print(f'\nwrite-behind drained in {(time.perf_counter() - start) * 1000:.0f} ms')
+        print(f'speed-up: {results[True][0] / results[False][0]:.1f}x over HTTP, '
+              f'{results[False][1] / results[True][1]:.1f}x for the vote logic')
+
+        with app.app_context():
+            violations = check_invariants()
+        if violations:
+            print(f'{len(violations)} violations after persisting:', *violations[:20], sep='\n  ')
+            sys.exit(1)
+        print('Database consistent after persisting: budgets, ledger and one vote per idea')
+
+        if not crash_test(tmp, args.votes):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Per-request cost of the rate limiter.
+
+Times the bucket check on its own (spread over many clients and storms),
+then the same trivial view with and without the decorator through the
+Flask test client, and the cost of a rejected (429) request.
+
+    python benchmarks/bench_rate_limit.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, jsonify
+
+from src.services.ratelimit import MemoryStore, RateLimiter
+
+REQUESTS = 20000
+CHECKS = 200000
+CLIENTS = 10000
+STORMS = 500
+
+
+def per_call_us(fn, count):
+    start = time.perf_counter()
+    for i in range(count):
+        fn(i)
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def main():
+    generous = {rule: {'client': (1e9, 10 ** 9), 'storm': (1e9, 10 ** 9)}
+                for rule in ('join', 'idea', 'vote', 'advance')}
+    limiter = RateLimiter(store=MemoryStore(), limits=generous)
+    check_us = per_call_us(
+        lambda i: limiter.check('vote', f'session-{i % CLIENTS}', f'STORM-{i % STORMS}'), CHECKS)
+    print(f'check() alone:          {check_us:8.2f} us  ({CLIENTS} clients, {STORMS} storms)')
+
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'bench'
+
+    @app.route('/plain/<storm_id>', methods=['POST'])
+    def plain(storm_id):
+        return jsonify({'ok': True})
+
+    @app.route('/limited/<storm_id>', methods=['POST'])
+    @limiter.limit('vote')
+    def limited(storm_id):
+        return jsonify({'ok': True})
+
+    strict = RateLimiter(store=MemoryStore(), limits=dict(generous, vote={'client': (0.001, 1), 'storm': (1e9, 10 ** 9)}))
+
+    @app.route('/rejected/<storm_id>', methods=['POST'])
+    @strict.limit('vote')
+    def rejected(storm_id):
+        return jsonify({'ok': True})
+
+    client = app.test_client()
+    results = {}
+    for name in ('plain', 'limited', 'rejected'):
+        client.post(f'/{name}/STORM-000000')  # warm up
+        results[name] = per_call_us(lambda i: client.post(f'/{name}/STORM-{i % STORMS}'), REQUESTS)
+        print(f'{name + " request":<24}{results[name]:8.2f} us')
+
+    overhead = results['limited'] - results['plain']
+    print(f'\nlimiter overhead per admitted request: {overhead:.2f} us ({overhead / 1000:.4f} ms)')
+
+
+if __name__ == '__main__':
+    main()
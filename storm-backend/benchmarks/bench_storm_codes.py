@@ -0,0 +1,140 @@
+"""Storm creation throughput with 1M existing storms: random codes vs the allocator.
+
+The old path drew a random code and looked it up until it found a free
+one, then inserted. The allocator hands out codes from a block-reserved
+sequence shuffled by a Feistel permutation, so the insert is the only
+statement per storm (plus one UPDATE per block). Also checks that
+several processes allocating at once never issue the same code.
+
+    python benchmarks/bench_storm_codes.py [--existing 1000000] [--creations 2000]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import event, insert
+from sqlalchemy.exc import IntegrityError
+
+from src.migrations import upgrade
+from src.models.user import db
+from src.models.storm import Storm
+from src.services.codes import StormCodeAllocator
+
+SEED_CHUNK = 50000
+
+
+def make_app(path):
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'bench'
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        upgrade(db.engine)
+    return app
+
+
+def random_code():
+    return 'STORM-' + ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
+
+
+def seed(existing):
+    """``existing`` storms under random legacy codes."""
+    codes = set()
+    while len(codes) < existing:
+        codes.add(random_code())
+    codes = list(codes)
+    for start in range(0, existing, SEED_CHUNK):
+        db.session.execute(insert(Storm), [
+            {'id': code, 'title': 'seed', 'status': 'results', 'moderator_id': 'session-seed'}
+            for code in codes[start:start + SEED_CHUNK]
+        ])
+        db.session.commit()
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+
+def create_storms(creations, next_code):
+    counter = QueryCounter()
+    event.listen(db.engine, 'before_cursor_execute', counter)
+    collisions = 0
+    start = time.perf_counter()
+    for _ in range(creations):
+        while True:
+            db.session.add(Storm(id=next_code(), title='bench', moderator_id='session-bench'))
+            try:
+                db.session.commit()
+                break
+            except IntegrityError:
+                # A legacy random code, as in create_storm
+                db.session.rollback()
+                collisions += 1
+    elapsed = time.perf_counter() - start
+    event.remove(db.engine, 'before_cursor_execute', counter)
+    return creations / elapsed, counter.count / creations, collisions
+
+
+def legacy_code():
+    code = random_code()
+    while db.session.get(Storm, code):
+        code = random_code()
+    return code
+
+
+def allocate_in_process(args):
+    path, count = args
+    app = make_app(path)
+    allocator = StormCodeAllocator(block_size=100)
+    with app.app_context():
+        return [allocator.allocate() for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--existing', type=int, default=1000000)
+    parser.add_argument('--creations', type=int, default=2000)
+    parser.add_argument('--processes', type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        app = make_app(path)
+        with app.app_context():
+            start = time.perf_counter()
+            seed(args.existing)
+            print(f'Seeded {args.existing} storms in {time.perf_counter() - start:.1f}s\n')
+
+            allocator = StormCodeAllocator(block_size=100)
+            print(f'{"strategy":<22} {"storms/s":>10} {"queries/storm":>14} {"collisions":>11}')
+            for name, next_code in (('random + lookup', legacy_code), ('allocator', allocator.allocate)):
+                rate, queries, collisions = create_storms(args.creations, next_code)
+                print(f'{name:<22} {rate:>10.0f} {queries:>14.2f} {collisions:>11}')
+
+            start = time.perf_counter()
+            for _ in range(100000):
+                allocator.allocate()
+            print(f'\nallocate() alone: {100000 / (time.perf_counter() - start):.0f} codes/s')
+
+        per_process = 5000
+        with multiprocessing.Pool(args.processes) as pool:
+            batches = pool.map(allocate_in_process, [(path, per_process)] * args.processes)
+        issued = [code for batch in batches for code in batch]
+        print(f'{args.processes} processes issued {len(issued)} codes, {len(set(issued))} distinct')
+
+
+if __name__ == '__main__':
+    main()
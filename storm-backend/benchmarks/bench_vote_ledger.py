@@ -0,0 +1,83 @@
+"""Vote submission latency as a participant's vote count grows.
+
+With the token ledger the budget check is a single conditional UPDATE, so
+the time per vote should stay flat whatever the number of votes the
+participant already holds in the storm.
+
+    python benchmarks/bench_vote_ledger.py
+"""
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from src.models.user import db
+from src.models.storm import Storm, Idea, Vote, AnonymousUser, TokenLedger
+from src.routes.storm import storm_bp
+from src.services.ratelimit import rate_limiter
+
+VOTE_COUNTS = [10, 100, 1000, 10000]
+SAMPLES = 200
+
+
+def make_app(path):
+    # This measures the vote path, not admission control
+    rate_limiter.enabled = False
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'bench'
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    app.register_blueprint(storm_bp, url_prefix='/api')
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def seed(existing_votes):
+    """A voting storm where one participant already holds ``existing_votes`` votes."""
+    storm_id = 'STORM-' + uuid.uuid4().hex[:6].upper()
+    user_id = 'session-' + str(uuid.uuid4())
+    db.session.add(Storm(
+        id=storm_id, title='bench', status='voting', moderator_id=user_id,
+        token_budget={'maxBlue': 10 ** 9, 'maxRed': 10 ** 9}
+    ))
+    db.session.add(AnonymousUser(session_id=user_id, username='bench', storm_id=storm_id))
+    ideas = [{'id': str(uuid.uuid4()), 'title': f'idea {i}', 'storm_id': storm_id,
+              'author_id': user_id, 'author_username': 'bench'}
+             for i in range(existing_votes + SAMPLES)]
+    db.session.execute(db.insert(Idea), ideas)
+    db.session.execute(db.insert(Vote), [
+        {'id': str(uuid.uuid4()), 'idea_id': idea['id'], 'storm_id': storm_id, 'user_id': user_id,
+         'blue_tokens': 1, 'red_tokens': 0, 'comment': 'seed'}
+        for idea in ideas[:existing_votes]
+    ])
+    db.session.add(TokenLedger(storm_id=storm_id, user_id=user_id, blue_spent=existing_votes, red_spent=0))
+    db.session.commit()
+    return user_id, [idea['id'] for idea in ideas[existing_votes:]]
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'bench.db'))
+        print(f'{"existing votes":>15} {"ms/vote":>10}')
+        for count in VOTE_COUNTS:
+            with app.app_context():
+                user_id, free_ideas = seed(count)
+            client = app.test_client()
+            with client.session_transaction() as sess:
+                sess['user_id'] = user_id
+
+            start = time.perf_counter()
+            for idea_id in free_ideas:
+                response = client.post(f'/api/ideas/{idea_id}/vote', json={'blueTokens': 1, 'comment': 'bench'})
+                assert response.status_code == 201, response.get_json()
+            elapsed = time.perf_counter() - start
+            print(f'{count:>15} {elapsed / SAMPLES * 1000:>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
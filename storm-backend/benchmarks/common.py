@@ -0,0 +1,34 @@
+"""Helpers shared by the benchmark scripts."""
+import math
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers (0 < pct <= 100)."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def latency_summary(samples):
+    """count / p50 / p90 / p99 / max in milliseconds for samples in seconds."""
+    if not samples:
+        return {'count': 0}
+    return {
+        'count': len(samples),
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p90_ms': round(percentile(samples, 90) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+        'max_ms': round(max(samples) * 1000, 3),
+    }
+
+
+def print_latency_table(results):
+    print(f'{"operation":<14} {"count":>7} {"p50 ms":>9} {"p90 ms":>9} {"p99 ms":>9} {"max ms":>9}')
+    for name, summary in results.items():
+        if not summary.get('count'):
+            print(f'{name:<14} {0:>7}')
+            continue
+        print(f'{name:<14} {summary["count"]:>7} {summary["p50_ms"]:>9} '
+              f'{summary["p90_ms"]:>9} {summary["p99_ms"]:>9} {summary["max_ms"]:>9}')
@@ -0,0 +1,233 @@
+"""Replay a full storm lifecycle against the real app on a local SQLite file.
+
+create_storm -> N concurrent join_storm -> M submit_idea ->
+advance_phase -> token-constrained submit_vote bursts -> advance_phase ->
+results reads. For every endpoint it records throughput, latency
+percentiles and SQL queries per request, plus the peak memory of the
+run (max RSS, or traced Python allocations with --tracemalloc), and writes it all as JSON so runs can be compared across commits:
+
+    python benchmarks/lifecycle.py --out before.json
+    git checkout <other commit>
+    python benchmarks/lifecycle.py --out after.json --compare before.json
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import latency_summary, print_latency_table
+
+
+class Recorder:
+    """Latency samples and SQL query counts per operation, thread-safe."""
+
+    def __init__(self):
+        self.timings = defaultdict(list)
+        self.queries = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.phase_seconds = {}
+        self._current = threading.local()
+        self._lock = threading.Lock()
+
+    def on_query(self, *args, **kwargs):
+        operation = getattr(self._current, 'operation', None)
+        if operation:
+            with self._lock:
+                self.queries[operation] += 1
+
+    def call(self, client, operation, method, path, **kwargs):
+        self._current.operation = operation
+        start = time.perf_counter()
+        try:
+            response = client.open(path, method=method, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            self._current.operation = None
+        with self._lock:
+            self.timings[operation].append(elapsed)
+            self.statuses[operation][response.status_code] += 1
+        return response
+
+    def phase(self, name):
+        recorder = self
+
+        class _Phase:
+            def __enter__(self):
+                self.start = time.perf_counter()
+
+            def __exit__(self, *exc):
+                recorder.phase_seconds[name] = time.perf_counter() - self.start
+
+        return _Phase()
+
+    def report(self):
+        operations = {}
+        for name, samples in self.timings.items():
+            summary = latency_summary(samples)
+            summary['queries_per_request'] = round(self.queries[name] / len(samples), 2)
+            summary['statuses'] = {str(code): count for code, count in self.statuses[name].items()}
+            operations[name] = summary
+        return operations
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=BACKEND_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    random.seed(args.seed)
+    tmp = tempfile.mkdtemp(prefix='storm-bench-')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+    # The whole room shares one address; measure the app, not the limiter
+    os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+
+    import main
+    from sqlalchemy import event
+    from src.models.user import db
+
+    app = main.app
+    recorder = Recorder()
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', recorder.on_query)
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    started = time.perf_counter()
+
+    moderator = app.test_client()
+    with recorder.phase('create'):
+        storm = recorder.call(moderator, 'create_storm', 'POST', '/api/storms', json={
+            'title': 'Lifecycle benchmark', 'blueTokens': args.blue, 'redTokens': args.red
+        }).get_json()['storm']
+    storm_id = storm['id']
+
+    participants = [app.test_client() for _ in range(args.participants)]
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        with recorder.phase('join'):
+            list(pool.map(lambda client: recorder.call(
+                client, 'join_storm', 'POST', f'/api/storms/{storm_id}/join',
+                json={'username': 'bench'}), participants))
+
+        idea_ids = []
+        idea_lock = threading.Lock()
+
+        def submit_ideas(client):
+            for i in range(args.ideas // args.participants + 1):
+                response = recorder.call(client, 'submit_idea', 'POST', f'/api/storms/{storm_id}/ideas',
+                                         json={'title': f'Idea {i}', 'description': 'benchmark'})
+                if response.status_code == 201:
+                    with idea_lock:
+                        if len(idea_ids) < args.ideas:
+                            idea_ids.append(response.get_json()['id'])
+
+        with recorder.phase('ideation'):
+            list(pool.map(submit_ideas, participants))
+
+        recorder.call(moderator, 'advance_phase', 'POST', f'/api/storms/{storm_id}/advance-phase')
+
+        def vote_burst(client):
+            # More attempts than the budget allows: the surplus must be rejected
+            for idea_id in random.sample(idea_ids, min(len(idea_ids), args.blue + args.red + 2)):
+                blue = random.random() < 0.7
+                recorder.call(client, 'submit_vote', 'POST', f'/api/ideas/{idea_id}/vote', json={
+                    'blueTokens': 1 if blue else 0, 'redTokens': 0 if blue else 1, 'comment': 'bench'
+                })
+
+        with recorder.phase('voting'):
+            list(pool.map(vote_burst, participants))
+
+        recorder.call(moderator, 'advance_phase', 'POST', f'/api/storms/{storm_id}/advance-phase')
+
+        def read_results(client):
+            recorder.call(client, 'get_storm', 'GET', f'/api/storms/{storm_id}')
+            recorder.call(client, 'get_results', 'GET', f'/api/storms/{storm_id}/results?top=10')
+            recorder.call(client, 'get_changes', 'GET', f'/api/storms/{storm_id}/changes?since=0')
+
+        with recorder.phase('results'):
+            list(pool.map(read_results, participants))
+
+    elapsed = time.perf_counter() - started
+    if args.tracemalloc:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    else:
+        # ru_maxrss is in KiB on Linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    operations = recorder.report()
+    total = sum(op['count'] for op in operations.values())
+    return {
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'params': vars(args) | {'out': None, 'compare': None},
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(total / elapsed, 1),
+        'peak_memory_mb': round(peak / 1e6, 2),
+        'phases_s': {name: round(seconds, 3) for name, seconds in recorder.phase_seconds.items()},
+        'operations': operations,
+    }
+
+
+def compare(current, baseline):
+    print(f'\nvs {baseline.get("revision")}:')
+    print(f'{"operation":<14} {"p50 ms":>16} {"p99 ms":>16} {"queries/req":>16}')
+    for name, op in current['operations'].items():
+        base = baseline['operations'].get(name)
+        if not base:
+            continue
+
+        def delta(key):
+            return f'{base.get(key)} -> {op.get(key)}'
+
+        print(f'{name:<14} {delta("p50_ms"):>16} {delta("p99_ms"):>16} {delta("queries_per_request"):>16}')
+    print(f'throughput: {baseline["throughput_rps"]} -> {current["throughput_rps"]} req/s, '
+          f'peak memory: {baseline["peak_memory_mb"]} -> {current["peak_memory_mb"]} MB')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--participants', type=int, default=100)
+    parser.add_argument('--ideas', type=int, default=300)
+    parser.add_argument('--blue', type=int, default=5, help='blue tokens per participant')
+    parser.add_argument('--red', type=int, default=3, help='red tokens per participant')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help='measure peak Python allocations instead of RSS (slows the run down)')
+    parser.add_argument('--out', help='write the JSON report here')
+    parser.add_argument('--compare', help='baseline JSON report to compare against')
+    args = parser.parse_args()
+
+    report = run(args)
+    print_latency_table(report['operations'])
+    print(f"\n{report['throughput_rps']} req/s overall, peak memory {report['peak_memory_mb']} MB")
+    for name, op in report['operations'].items():
+        print(f"{name:<14} {op['queries_per_request']:>6} queries/request  statuses {op['statuses']}")
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""Load test a running server with join, submit-idea and vote traffic.
+
+Start the server first (e.g. ``RATE_LIMIT_ENABLED=0 gunicorn -c
+gunicorn.conf.py wsgi:app``; with the rate limiter on, all simulated
+clients share one address and a storm, so most joins get 429), then:
+
+    python benchmarks/loadtest.py --url http://localhost:5000 --clients 200
+
+Each simulated participant joins the same storm, submits ideas, and once
+the moderator opens the voting phase spends its blue tokens. Latency
+percentiles are reported per operation.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import latency_summary, print_latency_table
+
+
+class Client:
+    """One participant: keeps its own session cookie.
+
+    The session cookie is marked Secure, so it is carried by hand rather
+    than through a cookie jar, which would drop it over plain HTTP.
+    """
+
+    def __init__(self, base_url, timings, errors):
+        self.base_url = base_url.rstrip('/')
+        self.cookie = None
+        self.timings = timings
+        self.errors = errors
+
+    def call(self, operation, method, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self.base_url + '/api' + path, data=data, method=method)
+        request.add_header('Content-Type', 'application/json')
+        if self.cookie:
+            request.add_header('Cookie', self.cookie)
+
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                payload = response.read()
+                set_cookie = response.headers.get('Set-Cookie')
+        except urllib.error.HTTPError as e:
+            self.errors[operation][e.code] += 1
+            return None
+        except OSError as e:
+            self.errors[operation][type(e).__name__] += 1
+            return None
+        finally:
+            self.timings[operation].append(time.perf_counter() - start)
+
+        if set_cookie:
+            self.cookie = set_cookie.split(';', 1)[0]
+        return json.loads(payload) if payload else None
+
+
+def run(args):
+    timings = defaultdict(list)
+    errors = defaultdict(lambda: defaultdict(int))
+    lock = threading.Lock()
+
+    moderator = Client(args.url, timings, errors)
+    created = moderator.call('create', 'POST', '/storms', {
+        'title': 'Load test', 'blueTokens': args.votes, 'redTokens': 0
+    })
+    if not created:
+        sys.exit('Could not create a storm: is the server running?')
+    storm_id = created['storm']['id']
+
+    clients = [Client(args.url, timings, errors) for _ in range(args.clients)]
+    idea_ids = []
+
+    def participate_ideation(client):
+        client.call('join', 'POST', f'/storms/{storm_id}/join', {'username': 'load'})
+        for i in range(args.ideas):
+            idea = client.call('submit_idea', 'POST', f'/storms/{storm_id}/ideas',
+                               {'title': f'Idea {i}', 'description': 'load test'})
+            if idea:
+                with lock:
+                    idea_ids.append(idea['id'])
+
+    def participate_voting(client):
+        for idea_id in random.sample(idea_ids, min(args.votes, len(idea_ids))):
+            client.call('vote', 'POST', f'/ideas/{idea_id}/vote',
+                        {'blueTokens': 1, 'comment': 'load test'})
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(participate_ideation, clients))
+        moderator.call('advance_phase', 'POST', f'/storms/{storm_id}/advance-phase')
+        list(pool.map(participate_voting, clients))
+    elapsed = time.perf_counter() - started
+
+    results = {name: latency_summary(samples) for name, samples in timings.items()}
+    total = sum(len(samples) for samples in timings.values())
+    print_latency_table(results)
+    print(f'\n{total} requests in {elapsed:.2f}s ({total / elapsed:.1f} req/s)')
+    if errors:
+        print('errors:', {op: dict(codes) for op, codes in errors.items()})
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'elapsed_s': elapsed, 'requests': total, 'operations': results,
+                       'errors': {op: dict(codes) for op, codes in errors.items()}}, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--clients', type=int, default=100, help='simulated participants')
+    parser.add_argument('--concurrency', type=int, default=50, help='requests in flight')
+    parser.add_argument('--ideas', type=int, default=2, help='ideas per participant')
+    parser.add_argument('--votes', type=int, default=3, help='votes per participant')
+    parser.add_argument('--json', help='also write the results to this file')
+    run(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main()
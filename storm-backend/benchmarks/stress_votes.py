@@ -0,0 +1,161 @@
+"""Fire thousands of concurrent votes and check that no token budget is exceeded.
+
+Every participant of several storms sends many votes at once from a
+thread pool (single votes and batches, on overlapping ideas so some
+replace each other). Afterwards, for every participant, the votes must
+fit the storm's budget, the token ledger must match the votes and there
+must be at most one vote per idea. Exits non-zero on any violation.
+
+    python benchmarks/stress_votes.py [--storms 8] [--participants 25] [--votes 12] [--threads 64]
+"""
+import argparse
+import collections
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import func
+
+import src.config  # noqa: F401  (WAL and busy timeout for SQLite connections)
+from src.json_provider import StormJSONProvider
+from src.migrations import upgrade
+from src.models.user import db
+from src.models.storm import Vote, TokenLedger
+from src.routes.storm import storm_bp
+from src.services.locks import lock_wait
+from src.services.ratelimit import rate_limiter
+
+IDEAS = 20
+MAX_BLUE, MAX_RED = 5, 3
+
+
+def make_app(path):
+    # This checks write consistency under load, not admission control
+    rate_limiter.enabled = False
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'bench'
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    app.json = StormJSONProvider(app)
+    app.register_blueprint(storm_bp, url_prefix='/api')
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        upgrade(db.engine)
+    return app
+
+
+def setup_storm(app, participants):
+    moderator = app.test_client()
+    storm_id = moderator.post('/api/storms', json={
+        'title': 'stress', 'blueTokens': MAX_BLUE, 'redTokens': MAX_RED
+    }).get_json()['storm']['id']
+    idea_ids = [
+        moderator.post(f'/api/storms/{storm_id}/ideas', json={'title': f'idea {i}'}).get_json()['id']
+        for i in range(IDEAS)
+    ]
+    clients = []
+    for i in range(participants):
+        client = app.test_client()
+        client.post(f'/api/storms/{storm_id}/join', json={'username': f'user {i}'})
+        clients.append(client)
+    moderator.post(f'/api/storms/{storm_id}/advance-phase')
+    return storm_id, idea_ids, clients
+
+
+def random_allocation(idea_id):
+    if random.random() < 0.6:
+        return {'ideaId': idea_id, 'blueTokens': random.randint(1, 3), 'redTokens': 0, 'comment': 'go'}
+    return {'ideaId': idea_id, 'blueTokens': 0, 'redTokens': random.randint(1, 2), 'comment': 'no'}
+
+
+def vote_tasks(storm_id, idea_ids, client, count):
+    tasks = []
+    for _ in range(count):
+        if random.random() < 0.2:
+            ideas = random.sample(idea_ids, 2)
+            body = {'votes': [random_allocation(idea_id) for idea_id in ideas]}
+            tasks.append((client, f'/api/storms/{storm_id}/votes:batch', body))
+        else:
+            # A small pool of ideas per participant, so votes replace each other
+            idea_id = random.choice(idea_ids[:6])
+            tasks.append((client, f'/api/ideas/{idea_id}/vote', random_allocation(idea_id)))
+    return tasks
+
+
+def check_invariants():
+    violations = []
+    totals = {
+        (row.storm_id, row.user_id): (row.blue, row.red)
+        for row in db.session.query(
+            Vote.storm_id, Vote.user_id,
+            func.sum(Vote.blue_tokens).label('blue'), func.sum(Vote.red_tokens).label('red')
+        ).group_by(Vote.storm_id, Vote.user_id)
+    }
+    for ledger in TokenLedger.query:
+        blue, red = totals.get((ledger.storm_id, ledger.user_id), (0, 0))
+        if blue > MAX_BLUE or red > MAX_RED:
+            violations.append(f'{ledger.user_id} over budget: {blue} blue, {red} red')
+        if (blue, red) != (ledger.blue_spent, ledger.red_spent):
+            violations.append(f'{ledger.user_id} ledger {ledger.blue_spent}/{ledger.red_spent} '
+                              f'!= votes {blue}/{red}')
+    duplicates = (
+        db.session.query(Vote.idea_id, Vote.user_id)
+        .group_by(Vote.idea_id, Vote.user_id)
+        .having(func.count() > 1)
+        .count()
+    )
+    if duplicates:
+        violations.append(f'{duplicates} duplicate votes')
+    return violations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--storms', type=int, default=8)
+    parser.add_argument('--participants', type=int, default=25)
+    parser.add_argument('--votes', type=int, default=12, help='Requests per participant')
+    parser.add_argument('--threads', type=int, default=64)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'stress.db'))
+        tasks = []
+        for _ in range(args.storms):
+            storm_id, idea_ids, clients = setup_storm(app, args.participants)
+            for client in clients:
+                tasks.extend(vote_tasks(storm_id, idea_ids, client, args.votes))
+        random.shuffle(tasks)
+
+        def send(task):
+            client, url, body = task
+            return client.post(url, json=body).status_code
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.threads) as pool:
+            statuses = collections.Counter(pool.map(send, tasks))
+        elapsed = time.perf_counter() - start
+
+        print(f'{len(tasks)} vote requests in {elapsed:.2f}s ({len(tasks) / elapsed:.0f}/s) '
+              f'on {args.threads} threads')
+        print('statuses:', dict(sorted(statuses.items())))
+        waits = [line for line in lock_wait.expose() if line.startswith('storm_write_lock_wait_seconds_sum')]
+        print('lock wait:', waits[0].split()[-1] + 's total' if waits else 'n/a')
+
+        with app.app_context():
+            violations = check_invariants()
+        if violations:
+            print(f'{len(violations)} violations:')
+            for violation in violations[:20]:
+                print('  ' + violation)
+            sys.exit(1)
+        print('No budget exceeded, ledger consistent, one vote per idea and participant')
+
+
+if __name__ == '__main__':
+    main()
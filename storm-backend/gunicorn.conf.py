@@ -0,0 +1,40 @@
+"""Gunicorn settings for the production server, all overridable from the environment.
+
+Socket.IO runs in threading mode: WebSocket connections are served by
+simple-websocket on the gthread worker's threads, and each open
+connection holds a thread for its whole lifetime. A worker therefore
+serves at most WEB_SOCKET_CLIENTS live clients (default 200); its
+threads are sized for those plus WEB_HTTP_THREADS for ordinary requests
+(default 32), and connections past the cap are refused (clients fall back
+to polling), so sockets never starve HTTP requests. For bigger rooms add
+workers, or raise WEB_SOCKET_CLIENTS: an idle thread costs little memory
+but the cap is the hard limit per worker. With more than one
+worker, put the workers behind a load balancer with sticky sessions (for
+Socket.IO) and run ``python -m src.services.state_server`` with
+SHARED_STATE_URL=tcp://host:7390 in every worker: events, cached
+snapshots, rate limit buckets and SQLite write locks are then shared, and
+each worker relays every storm event to its own Socket.IO clients. Do not
+also set SOCKETIO_MESSAGE_QUEUE, or clients receive each event twice.
+"""
+import os
+
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', '5000')}")
+workers = int(os.environ.get('WEB_CONCURRENCY', '1'))
+worker_class = 'gthread'
+socket_clients = int(os.environ.get('WEB_SOCKET_CLIENTS', '200'))
+threads = int(os.environ.get('WEB_THREADS', socket_clients + int(os.environ.get('WEB_HTTP_THREADS', '32'))))
+timeout = int(os.environ.get('WEB_TIMEOUT', '60'))
+# On SIGTERM workers stop accepting, finish in-flight requests for up to
+# this long, then run the shutdown hooks.
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.environ.get('WEB_KEEPALIVE', '5'))
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', '0'))
+max_requests_jitter = int(os.environ.get('WEB_MAX_REQUESTS_JITTER', '0'))
+accesslog = os.environ.get('WEB_ACCESS_LOG', '-')
+loglevel = os.environ.get('WEB_LOG_LEVEL', 'info')
+
+
+def worker_exit(server, worker):
+    from src.lifecycle import run_shutdown_hooks
+
+    run_shutdown_hooks()
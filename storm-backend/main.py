@@ -6,13 +6,24 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 from flask import Flask, send_from_directory
 from flasgger import Swagger
 from flask_cors import CORS
+from src.config import configure_database
+from src.json_provider import StormJSONProvider
+from src.lifecycle import on_shutdown
 from src.models.user import db
+from src.migrations import upgrade
 from src.models.storm import Storm, Idea, Vote, AnonymousUser
 from src.routes.user import user_bp
 from src.routes.storm import storm_bp
+from src.routes.realtime import socketio, init_realtime
+from src.routes.metrics import metrics_bp
+from src.services.metrics import init_metrics
+from src.services.live import live_engine
+from src.services.phases import phase_scheduler
+from src.services.shared_state import connect, use_shared_state
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
+app.json = StormJSONProvider(app)
 
 # Enable CORS for all routes
 CORS(app, supports_credentials=True)
@@ -20,17 +31,62 @@ Swagger(app)
 
 app.register_blueprint(user_bp, url_prefix='/api')
 app.register_blueprint(storm_bp, url_prefix='/api')
+app.register_blueprint(metrics_bp)
+init_metrics(app, slow_query_ms=int(os.environ.get('SLOW_QUERY_MS', '200')))
 
-# uncomment if you need to use database
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
+# Database URI and pool settings come from the environment (see src/config.py)
+configure_database(app, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database', 'app.db'))
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config.update(
     SESSION_COOKIE_SAMESITE='None',
     SESSION_COOKIE_SECURE=True
 )
 db.init_app(app)
+# Events, snapshot cache and rate limits shared by every worker (see src/services/shared_state.py)
+use_shared_state(connect(os.environ.get('SHARED_STATE_URL')))
+init_realtime(
+    app,
+    max_clients=int(os.environ.get('WEB_SOCKET_CLIENTS', '200')),
+    cors_allowed_origins='*',
+    message_queue=os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+)
 with app.app_context():
     db.create_all()
+    upgrade(db.engine)
+
+# Votes of storms in the voting phase served from memory (see src/services/live.py)
+live_engine.configure(app.config['SQLALCHEMY_DATABASE_URI'],
+                      os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database'))
+
+
+_background_started = False
+
+
+def start_background_services():
+    """Start the threads owned by the serving process: the live vote writer
+    and the phase scheduler.
+
+    Only the server entry points (wsgi.py, ``python main.py``) call this, so
+    ``flask storm ...`` commands and scripts importing the app start none.
+    """
+    global _background_started
+    if _background_started:
+        return
+    _background_started = True
+    live_engine.start(app)
+    on_shutdown(live_engine.stop)
+    # Auto-advance storms whose phase time limit has run out
+    if os.environ.get('PHASE_SCHEDULER', '1') != '0':
+        phase_scheduler.refill_interval = int(os.environ.get('PHASE_SCHEDULER_REFILL_SECONDS', '30'))
+        phase_scheduler.start(app)
+        on_shutdown(phase_scheduler.stop)
+
+
+@on_shutdown
+def _close_database_connections():
+    with app.app_context():
+        db.engine.dispose()
+
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
@@ -50,5 +106,9 @@ def serve(path):
 
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5001, debug=True)
+    # Development server; production runs through gunicorn (see gunicorn.conf.py).
+    # With the reloader only the child process serves.
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_services()
+    socketio.run(app, host='0.0.0.0', port=5001, debug=True, allow_unsafe_werkzeug=True)
 
@@ -0,0 +1,53 @@
+import json
+from datetime import date, datetime
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional speed-up, the stdlib encoder is the fallback
+    orjson = None
+
+
+def _default(obj):
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def dumps_bytes(obj):
+    """Encode to UTF-8 JSON bytes; datetimes become ISO 8601 strings."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default)
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def dumps(obj):
+    return dumps_bytes(obj).decode()
+
+
+class StormJSONProvider(DefaultJSONProvider):
+    """JSON provider used for every API response.
+
+    Uses orjson when it is installed and the stdlib encoder otherwise.
+    Both write datetimes as ISO 8601 (Flask's default is an HTTP date), so
+    models can hand datetimes over as-is instead of formatting each one.
+    """
+
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            kwargs.setdefault('default', _default)
+            return json.dumps(obj, **kwargs)
+        return dumps(obj)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        # Skip the str round trip of the default implementation
+        return self._app.response_class(dumps_bytes(obj), mimetype=self.mimetype)
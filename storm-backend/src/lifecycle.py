@@ -0,0 +1,26 @@
+import logging
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+_hooks = []
+_lock = Lock()
+
+
+def on_shutdown(fn):
+    """Register ``fn`` to run when the worker shuts down gracefully."""
+    with _lock:
+        _hooks.append(fn)
+    return fn
+
+
+def run_shutdown_hooks():
+    """Run registered hooks, most recently registered first, once."""
+    with _lock:
+        hooks = list(reversed(_hooks))
+        _hooks.clear()
+    for hook in hooks:
+        try:
+            hook()
+        except Exception:
+            logger.exception('Shutdown hook %r failed', hook)
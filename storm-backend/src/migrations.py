@@ -0,0 +1,216 @@
+"""Versioned schema migrations.
+
+``db.create_all()`` creates missing tables (with their indexes) but never
+alters existing ones, so every schema change to an existing table is
+added here as a numbered migration. Migrations must be idempotent: on a
+fresh database ``create_all`` has already built the current schema and
+they only get recorded as applied.
+"""
+import logging
+from datetime import datetime
+
+import click
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+
+from src.models.user import db
+
+logger = logging.getLogger(__name__)
+
+
+def _add_column(conn, table, column, ddl):
+    columns = {c['name'] for c in inspect(conn).get_columns(table)}
+    if column not in columns:
+        conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+
+
+def _create_index(conn, name, table, columns, unique=False):
+    unique_sql = 'UNIQUE ' if unique else ''
+    conn.execute(text(f'CREATE {unique_sql}INDEX IF NOT EXISTS {name} ON {table} ({columns})'))
+
+
+def _revisions_and_listing(conn):
+    for table in ('storms', 'ideas', 'votes', 'anonymous_users'):
+        _add_column(conn, table, 'revision', 'INTEGER NOT NULL DEFAULT 0')
+    _create_index(conn, 'ix_storms_created_at_id', 'storms', 'created_at, id')
+    _create_index(conn, 'ix_storms_status_created_at_id', 'storms', 'status, created_at, id')
+    _create_index(conn, 'ix_ideas_storm_id_revision', 'ideas', 'storm_id, revision')
+    _create_index(conn, 'ix_votes_storm_id_revision', 'votes', 'storm_id, revision')
+    _create_index(conn, 'ix_anonymous_users_storm_id_revision', 'anonymous_users', 'storm_id, revision')
+
+
+def _hot_lookup_indexes(conn):
+    _create_index(conn, 'ix_votes_storm_id_user_id', 'votes', 'storm_id, user_id')
+
+    # Concurrent votes could have left several rows per (idea, user);
+    # keep the newest before enforcing uniqueness.
+    removed = conn.execute(text(
+        'DELETE FROM votes WHERE EXISTS ('
+        ' SELECT 1 FROM votes newer'
+        ' WHERE newer.idea_id = votes.idea_id AND newer.user_id = votes.user_id'
+        ' AND (newer.created_at > votes.created_at'
+        '  OR (newer.created_at = votes.created_at AND newer.id > votes.id)))'
+    )).rowcount
+    if removed:
+        logger.warning('Removed %s duplicate votes; rebuilding the token ledger', removed)
+        conn.execute(text('DELETE FROM token_ledger'))
+        conn.execute(text(
+            'INSERT INTO token_ledger (storm_id, user_id, blue_spent, red_spent)'
+            ' SELECT storm_id, user_id, SUM(blue_tokens), SUM(red_tokens)'
+            ' FROM votes GROUP BY storm_id, user_id'
+        ))
+    _create_index(conn, 'uq_votes_idea_id_user_id', 'votes', 'idea_id, user_id', unique=True)
+
+
+def _phase_deadlines(conn):
+    _create_index(conn, 'ix_storms_expires_at', 'storms', 'expires_at')
+
+
+def _storm_archives(conn):
+    # The storm_archives table itself is created by create_all
+    _add_column(conn, 'storms', 'archived_at', 'TIMESTAMP')
+
+
+def _storm_code_sequence(conn):
+    # The sequences table itself is created by create_all
+    conn.execute(text(
+        "INSERT INTO sequences (name, next_value)"
+        " SELECT 'storm_code', 0 WHERE NOT EXISTS (SELECT 1 FROM sequences WHERE name = 'storm_code')"
+    ))
+
+
+def _idea_search(conn):
+    # idea_signatures and idea_bands are created by create_all
+    dialect = conn.dialect.name
+    if dialect == 'sqlite':
+        options = {row[0] for row in conn.execute(text('PRAGMA compile_options'))}
+        if 'ENABLE_FTS5' not in options:
+            logger.warning('SQLite was built without FTS5; idea search falls back to LIKE')
+            return
+        conn.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS ideas_fts USING fts5("
+            " title, description, content='ideas', content_rowid='rowid',"
+            " tokenize='unicode61 remove_diacritics 2')"
+        ))
+        conn.execute(text(
+            'CREATE TRIGGER IF NOT EXISTS ideas_fts_insert AFTER INSERT ON ideas BEGIN'
+            ' INSERT INTO ideas_fts (rowid, title, description) VALUES (new.rowid, new.title, new.description);'
+            ' END'
+        ))
+        conn.execute(text(
+            'CREATE TRIGGER IF NOT EXISTS ideas_fts_delete AFTER DELETE ON ideas BEGIN'
+            " INSERT INTO ideas_fts (ideas_fts, rowid, title, description)"
+            " VALUES ('delete', old.rowid, old.title, old.description);"
+            ' END'
+        ))
+        conn.execute(text(
+            'CREATE TRIGGER IF NOT EXISTS ideas_fts_update AFTER UPDATE OF title, description ON ideas BEGIN'
+            " INSERT INTO ideas_fts (ideas_fts, rowid, title, description)"
+            " VALUES ('delete', old.rowid, old.title, old.description);"
+            ' INSERT INTO ideas_fts (rowid, title, description) VALUES (new.rowid, new.title, new.description);'
+            ' END'
+        ))
+        conn.execute(text("INSERT INTO ideas_fts (ideas_fts) VALUES ('rebuild')"))
+    elif dialect == 'postgresql':
+        conn.execute(text(
+            'ALTER TABLE ideas ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ('
+            " to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(description, ''))) STORED"
+        ))
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_ideas_search_vector ON ideas USING gin (search_vector)'))
+
+
+def _idea_search_key(conn):
+    # ideas has no INTEGER PRIMARY KEY, so VACUUM may renumber its rowids
+    # and leave ideas_fts pointing at other ideas. Key the index by a
+    # search_id column of its own instead, set when an idea is inserted.
+    if conn.dialect.name != 'sqlite' or not inspect(conn).has_table('ideas_fts'):
+        return
+    for trigger in ('ideas_fts_insert', 'ideas_fts_delete', 'ideas_fts_update'):
+        conn.execute(text(f'DROP TRIGGER IF EXISTS {trigger}'))
+    conn.execute(text('DROP TABLE ideas_fts'))
+    _add_column(conn, 'ideas', 'search_id', 'INTEGER')
+    conn.execute(text('UPDATE ideas SET search_id = rowid WHERE search_id IS NULL'))
+    _create_index(conn, 'uq_ideas_search_id', 'ideas', 'search_id', unique=True)
+    conn.execute(text(
+        "CREATE VIRTUAL TABLE ideas_fts USING fts5("
+        " title, description, content='ideas', content_rowid='search_id',"
+        " tokenize='unicode61 remove_diacritics 2')"
+    ))
+    conn.execute(text(
+        'CREATE TRIGGER ideas_fts_insert AFTER INSERT ON ideas BEGIN'
+        ' UPDATE ideas SET search_id = (SELECT coalesce(max(search_id), 0) + 1 FROM ideas)'
+        '  WHERE rowid = new.rowid AND search_id IS NULL;'
+        ' INSERT INTO ideas_fts (rowid, title, description)'
+        '  SELECT search_id, title, description FROM ideas WHERE rowid = new.rowid;'
+        ' END'
+    ))
+    conn.execute(text(
+        'CREATE TRIGGER ideas_fts_delete AFTER DELETE ON ideas BEGIN'
+        " INSERT INTO ideas_fts (ideas_fts, rowid, title, description)"
+        " VALUES ('delete', old.search_id, old.title, old.description);"
+        ' END'
+    ))
+    conn.execute(text(
+        'CREATE TRIGGER ideas_fts_update AFTER UPDATE OF title, description ON ideas BEGIN'
+        " INSERT INTO ideas_fts (ideas_fts, rowid, title, description)"
+        " VALUES ('delete', old.search_id, old.title, old.description);"
+        ' INSERT INTO ideas_fts (rowid, title, description) VALUES (new.search_id, new.title, new.description);'
+        ' END'
+    ))
+    conn.execute(text("INSERT INTO ideas_fts (ideas_fts) VALUES ('rebuild')"))
+
+
+MIGRATIONS = [
+    (1, 'revision columns and storm listing indexes', _revisions_and_listing),
+    (2, 'hot lookup indexes and unique vote per idea and user', _hot_lookup_indexes),
+    (3, 'phase deadline index', _phase_deadlines),
+    (4, 'storm archival', _storm_archives),
+    (5, 'storm code sequence', _storm_code_sequence),
+    (6, 'idea full-text search', _idea_search),
+    (7, 'idea search keyed by search_id', _idea_search_key),
+]
+
+
+def _applied_versions(conn):
+    conn.execute(text(
+        'CREATE TABLE IF NOT EXISTS schema_migrations ('
+        ' version INTEGER PRIMARY KEY,'
+        ' name VARCHAR(200) NOT NULL,'
+        ' applied_at TIMESTAMP NOT NULL)'
+    ))
+    return {row[0] for row in conn.execute(text('SELECT version FROM schema_migrations'))}
+
+
+def upgrade(engine):
+    """Apply pending migrations in order, each in its own transaction.
+
+    Returns the versions applied by this call.
+    """
+    with engine.begin() as conn:
+        applied = _applied_versions(conn)
+
+    newly_applied = []
+    for version, name, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        try:
+            with engine.begin() as conn:
+                # Another worker may have applied it since we looked
+                if version in _applied_versions(conn):
+                    continue
+                migrate(conn)
+                conn.execute(
+                    text('INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :t)'),
+                    {'v': version, 'n': name, 't': datetime.utcnow()}
+                )
+        except IntegrityError:
+            continue
+        logger.info('Applied migration %s: %s', version, name)
+        newly_applied.append(version)
+    return newly_applied
+
+
+def migrate_command():
+    """Apply pending schema migrations."""
+    applied = upgrade(db.engine)
+    click.echo(f"Applied migrations: {', '.join(map(str, applied))}" if applied else 'Schema is up to date')
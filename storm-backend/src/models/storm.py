@@ -1,9 +1,19 @@
 from src.models.user import db
+from sqlalchemy import update
+from sqlalchemy.orm import selectinload
 from datetime import datetime
 import json
+import zlib
 
 class Storm(db.Model):
     __tablename__ = 'storms'
+    __table_args__ = (
+        # Keyset pagination of the storm listing, with and without a status filter
+        db.Index('ix_storms_created_at_id', 'created_at', 'id'),
+        db.Index('ix_storms_status_created_at_id', 'status', 'created_at', 'id'),
+        # Upcoming phase deadlines, read by the auto-advance scheduler
+        db.Index('ix_storms_expires_at', 'expires_at'),
+    )
     
     id = db.Column(db.String(20), primary_key=True)
     title = db.Column(db.String(200), nullable=False)
@@ -14,24 +24,54 @@ class Storm(db.Model):
     ideation_time_limit = db.Column(db.Integer)  # minutes
     voting_time_limit = db.Column(db.Integer)  # minutes
     moderator_id = db.Column(db.String(50), nullable=False)
+    revision = db.Column(db.Integer, nullable=False, default=0)  # bumped by every change to the storm or its children
+    archived_at = db.Column(db.DateTime)  # set once the storm is frozen into a StormArchive
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     ideas = db.relationship('Idea', backref='storm', lazy=True, cascade='all, delete-orphan')
     votes = db.relationship('Vote', backref='storm', lazy=True, cascade='all, delete-orphan')
+    participants = db.relationship('AnonymousUser', backref='storm', lazy=True, cascade='all, delete-orphan')
+    
+    @classmethod
+    def eager_query(cls):
+        """Query that batch-loads ideas, votes and participants for every storm
+        returned, in a fixed number of queries regardless of how many storms."""
+        return cls.query.options(
+            selectinload(cls.ideas),
+            selectinload(cls.votes),
+            selectinload(cls.participants)
+        )
     
     @property
     def token_budget(self):
+        # Parsed once per instance and re-parsed only if the JSON column changes
+        cached = self.__dict__.get('_token_budget_cache')
+        if cached is not None and cached[0] == self.token_budget_json:
+            return cached[1]
         if self.token_budget_json:
-            return json.loads(self.token_budget_json)
-        return {'maxBlue': 5, 'maxRed': 3}
+            budget = json.loads(self.token_budget_json)
+        else:
+            budget = {'maxBlue': 5, 'maxRed': 3}
+        self._token_budget_cache = (self.token_budget_json, budget)
+        return budget
     
     @token_budget.setter
     def token_budget(self, value):
         self.token_budget_json = json.dumps(value)
     
     def to_dict(self):
+        ideas = []
+        votes = []
+        participant_ids = set()
+        for idea in self.ideas:
+            ideas.append(idea.to_dict())
+            participant_ids.add(idea.author_id)
+        for vote in self.votes:
+            votes.append(vote.to_dict())
+            participant_ids.add(vote.user_id)
+
         return {
             'id': self.id,
             'code': self.id,
@@ -39,21 +79,26 @@ class Storm(db.Model):
             'description': self.description,
             'status': self.status,
             'tokenBudget': self.token_budget,
-            'expiresAt': self.expires_at.isoformat() if self.expires_at else None,
+            'expiresAt': self.expires_at,
             'ideationTimeLimit': self.ideation_time_limit,
             'votingTimeLimit': self.voting_time_limit,
             'moderatorId': self.moderator_id,
-            'createdAt': self.created_at.isoformat(),
-            'updatedAt': self.updated_at.isoformat(),
-            'ideas': [idea.to_dict() for idea in self.ideas],
-            'votes': [vote.to_dict() for vote in self.votes],
-            'participantCount': len(set([idea.author_id for idea in self.ideas] + [vote.user_id for vote in self.votes])),
-            'participants': [user.to_dict() for user in AnonymousUser.query.filter_by(storm_id=self.id).all()]
+            'revision': self.revision,
+            'archivedAt': self.archived_at,
+            'createdAt': self.created_at,
+            'updatedAt': self.updated_at,
+            'ideas': ideas,
+            'votes': votes,
+            'participantCount': len(participant_ids),
+            'participants': [user.to_dict() for user in self.participants]
         }
 
 
 class Idea(db.Model):
     __tablename__ = 'ideas'
+    __table_args__ = (
+        db.Index('ix_ideas_storm_id_revision', 'storm_id', 'revision'),
+    )
     
     id = db.Column(db.String(50), primary_key=True)
     title = db.Column(db.String(200), nullable=False)
@@ -61,6 +106,7 @@ class Idea(db.Model):
     storm_id = db.Column(db.String(20), db.ForeignKey('storms.id'), nullable=False)
     author_id = db.Column(db.String(50), nullable=False)
     author_username = db.Column(db.String(100), nullable=False)
+    revision = db.Column(db.Integer, nullable=False, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -72,13 +118,20 @@ class Idea(db.Model):
             'stormId': self.storm_id,
             'authorId': self.author_id,
             'authorUsername': self.author_username,
-            'createdAt': self.created_at.isoformat(),
-            'updatedAt': self.updated_at.isoformat()
+            'createdAt': self.created_at,
+            'updatedAt': self.updated_at
         }
 
 
 class Vote(db.Model):
     __tablename__ = 'votes'
+    __table_args__ = (
+        db.Index('ix_votes_storm_id_revision', 'storm_id', 'revision'),
+        # Budget rebuilds and per-participant lookups
+        db.Index('ix_votes_storm_id_user_id', 'storm_id', 'user_id'),
+        # One vote per participant and idea; also serves the existing-vote lookup
+        db.Index('uq_votes_idea_id_user_id', 'idea_id', 'user_id', unique=True),
+    )
     
     id = db.Column(db.String(50), primary_key=True)
     idea_id = db.Column(db.String(50), db.ForeignKey('ideas.id'), nullable=False)
@@ -87,6 +140,7 @@ class Vote(db.Model):
     blue_tokens = db.Column(db.Integer, default=0)
     red_tokens = db.Column(db.Integer, default=0)
     comment = db.Column(db.Text, nullable=False)
+    revision = db.Column(db.Integer, nullable=False, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     def to_dict(self):
@@ -97,17 +151,21 @@ class Vote(db.Model):
             'blueTokens': self.blue_tokens,
             'redTokens': self.red_tokens,
             'comment': self.comment,
-            'createdAt': self.created_at.isoformat()
+            'createdAt': self.created_at
         }
 
 
 class AnonymousUser(db.Model):
     __tablename__ = 'anonymous_users'
+    __table_args__ = (
+        db.Index('ix_anonymous_users_storm_id_revision', 'storm_id', 'revision'),
+    )
     
     session_id = db.Column(db.String(50), primary_key=True)
     username = db.Column(db.String(100), nullable=False)
     storm_id = db.Column(db.String(20), db.ForeignKey('storms.id'), nullable=False)
     role = db.Column(db.String(20), default='participant')  # participant, moderator
+    revision = db.Column(db.Integer, nullable=False, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     def to_dict(self):
@@ -116,7 +174,115 @@ class AnonymousUser(db.Model):
             'username': self.username,
             'stormId': self.storm_id,
             'role': self.role,
-            'createdAt': self.created_at.isoformat()
+            'createdAt': self.created_at
         }
 
 
+class IdeaSignature(db.Model):
+    """MinHash signature of an idea's text, for near-duplicate detection."""
+    __tablename__ = 'idea_signatures'
+    __table_args__ = (
+        db.Index('ix_idea_signatures_duplicate_of', 'duplicate_of'),
+    )
+    
+    idea_id = db.Column(db.String(50), db.ForeignKey('ideas.id'), primary_key=True)
+    storm_id = db.Column(db.String(20), db.ForeignKey('storms.id'), nullable=False)
+    signature = db.Column(db.LargeBinary, nullable=False)
+    duplicate_of = db.Column(db.String(50))  # most similar earlier idea, if above the threshold
+    similarity = db.Column(db.Float)
+
+
+class IdeaBand(db.Model):
+    """LSH bucket of one band of an idea's signature; ideas sharing a bucket are candidates."""
+    __tablename__ = 'idea_bands'
+    __table_args__ = (
+        db.Index('ix_idea_bands_idea_id', 'idea_id'),
+    )
+    
+    storm_id = db.Column(db.String(20), primary_key=True)
+    band = db.Column(db.SmallInteger, primary_key=True)
+    bucket = db.Column(db.BigInteger, primary_key=True)
+    idea_id = db.Column(db.String(50), db.ForeignKey('ideas.id'), primary_key=True)
+
+
+class Tombstone(db.Model):
+    """Records a hard-deleted idea or vote so delta sync can report it."""
+    __tablename__ = 'tombstones'
+    __table_args__ = (
+        db.Index('ix_tombstones_storm_id_revision', 'storm_id', 'revision'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    storm_id = db.Column(db.String(20), db.ForeignKey('storms.id'), nullable=False)
+    entity = db.Column(db.String(20), nullable=False)  # idea, vote
+    entity_id = db.Column(db.String(50), nullable=False)
+    revision = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class StormArchive(db.Model):
+    """Frozen copy of a finished storm: its encoded snapshot and final results.
+
+    Both documents are zlib-compressed JSON. Once a storm is archived its
+    votes may be dropped, so reads are served from here instead of being
+    rebuilt from the child tables.
+    """
+    __tablename__ = 'storm_archives'
+    
+    storm_id = db.Column(db.String(20), db.ForeignKey('storms.id'), primary_key=True)
+    revision = db.Column(db.Integer, nullable=False)
+    snapshot = db.Column(db.LargeBinary, nullable=False)  # Storm.to_dict()
+    results = db.Column(db.LargeBinary, nullable=False)  # ranked result rows
+    vote_count = db.Column(db.Integer, nullable=False, default=0)
+    votes_dropped = db.Column(db.Boolean, nullable=False, default=False)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def snapshot_bytes(self):
+        return zlib.decompress(self.snapshot)
+    
+    def result_rows(self):
+        return json.loads(zlib.decompress(self.results))
+
+
+class Sequence(db.Model):
+    """Named counters handed out in blocks (see src/services/codes.py)."""
+    __tablename__ = 'sequences'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    next_value = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class Setting(db.Model):
+    """Values generated once per database, such as the storm code key."""
+    __tablename__ = 'settings'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.String(200), nullable=False)
+
+
+class TokenLedger(db.Model):
+    """Tokens a participant currently has spent in a storm.
+
+    Kept in step with ``votes`` by the vote routes, so budget checks never
+    have to sum the participant's votes.
+    """
+    __tablename__ = 'token_ledger'
+    
+    storm_id = db.Column(db.String(20), db.ForeignKey('storms.id'), primary_key=True)
+    user_id = db.Column(db.String(50), primary_key=True)
+    blue_spent = db.Column(db.Integer, nullable=False, default=0)
+    red_spent = db.Column(db.Integer, nullable=False, default=0)
+
+
+def next_revision(storm_id):
+    """Atomically bump and return the storm's revision counter.
+
+    Runs inside the caller's transaction, so the new revision commits (or
+    rolls back) together with the change it stamps.
+    """
+    return db.session.execute(
+        update(Storm)
+        .where(Storm.id == storm_id)
+        .values(revision=Storm.revision + 1, updated_at=Storm.updated_at)
+        .returning(Storm.revision)
+    ).scalar_one()
@@ -0,0 +1,88 @@
+"""Query-plan regression check for the hot queries.
+
+Each hot query is run through EXPLAIN and rejected if the plan reads a
+whole table instead of going through an index. Run it after schema
+changes with ``flask storm check-query-plans`` (non-zero exit on failure).
+"""
+import re
+import sys
+
+import click
+from sqlalchemy import and_, func, or_, select, text, tuple_
+
+from src.models.storm import db, Storm, Idea, Vote, AnonymousUser, TokenLedger, Tombstone, IdeaBand
+
+
+def hot_queries():
+    """(name, statement) pairs with representative bound values."""
+    storm_id, user_id, idea_id = 'STORM-PLAN00', 'session-plan', 'idea-plan'
+    blue = func.coalesce(func.sum(Vote.blue_tokens), 0)
+    return [
+        ('ledger lookup', select(TokenLedger).where(
+            TokenLedger.storm_id == storm_id, TokenLedger.user_id == user_id)),
+        ('existing vote lookup', select(Vote.id).where(
+            Vote.idea_id == idea_id, Vote.user_id == user_id)),
+        ('participant votes', select(blue).where(
+            Vote.storm_id == storm_id, Vote.user_id == user_id)),
+        ('storm participants', select(AnonymousUser).where(AnonymousUser.storm_id == storm_id)),
+        ('storm ideas', select(Idea).where(Idea.storm_id == storm_id)),
+        ('storm votes', select(Vote).where(Vote.storm_id == storm_id)),
+        ('storm listing by status', select(Storm.id).where(Storm.status == 'voting')
+            .order_by(Storm.created_at.desc(), Storm.id.desc()).limit(50)),
+        ('storm listing page', select(Storm.id)
+            .where(tuple_(Storm.created_at, Storm.id) < tuple_(func.current_timestamp(), storm_id))
+            .order_by(Storm.created_at.desc(), Storm.id.desc()).limit(50)),
+        ('results rollup', select(Idea.id, blue).outerjoin(Vote, Vote.idea_id == Idea.id)
+            .where(Idea.storm_id == storm_id).group_by(Idea.id)),
+        ('changed ideas', select(Idea).where(Idea.storm_id == storm_id, Idea.revision > 0)),
+        ('due phase deadlines', select(Storm.id, Storm.status).where(
+            Storm.expires_at <= func.current_timestamp(), Storm.status.in_(('ideation', 'voting')))),
+        ('duplicate candidates', select(IdeaBand.idea_id).distinct().where(or_(*(
+            and_(IdeaBand.storm_id == storm_id, IdeaBand.band == band, IdeaBand.bucket == band)
+            for band in range(4))))),
+        ('tombstones', select(Tombstone).where(Tombstone.storm_id == storm_id, Tombstone.revision > 0)),
+    ]
+
+
+_SQLITE_FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+_POSTGRES_FULL_SCAN = re.compile(r'Seq Scan on (\w+)')
+
+
+def full_table_scans(session=None):
+    """Return ``[(query name, table, plan)]`` for every hot query that scans a table."""
+    session = session or db.session
+    dialect = session.get_bind().dialect
+    failures = []
+
+    if dialect.name == 'postgresql':
+        # Tiny test tables make a sequential scan look cheap; ask whether an index *can* be used
+        session.execute(text('SET LOCAL enable_seqscan = off'))
+
+    for name, statement in hot_queries():
+        compiled = statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True})
+        if dialect.name == 'sqlite':
+            rows = session.execute(text(f'EXPLAIN QUERY PLAN {compiled}')).all()
+            plan = [row[-1] for row in rows]
+            scanned = [m.group(1) for m in map(_SQLITE_FULL_SCAN.match, plan) if m]
+        else:
+            rows = session.execute(text(f'EXPLAIN {compiled}')).all()
+            plan = [row[0] for row in rows]
+            scanned = [m.group(1) for line in plan for m in [_POSTGRES_FULL_SCAN.search(line)] if m]
+        for table in scanned:
+            failures.append((name, table, plan))
+
+    session.rollback()
+    return failures
+
+
+def check_query_plans_command():
+    """Fail if a hot query falls back to a full table scan."""
+    failures = full_table_scans()
+    if not failures:
+        click.echo('All hot queries use an index')
+        return
+    for name, table, plan in failures:
+        click.echo(f'{name}: full scan of {table}', err=True)
+        for line in plan:
+            click.echo(f'    {line}', err=True)
+    sys.exit(1)
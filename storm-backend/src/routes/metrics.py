@@ -0,0 +1,28 @@
+from flask import Blueprint, Response
+
+from src.services.cache import snapshot_cache
+from src.services.metrics import CounterFunc, registry
+
+metrics_bp = Blueprint('metrics', __name__)
+
+for _name, _doc in (
+    ('hits', 'Storm snapshot cache hits'),
+    ('misses', 'Storm snapshot cache misses'),
+    ('invalidations', 'Storm snapshot cache invalidations'),
+    ('evictions', 'Storm snapshot cache evictions'),
+):
+    registry.register(CounterFunc(
+        f'storm_snapshot_cache_{_name}_total', _doc,
+        lambda key=_name: snapshot_cache.stats()[key]
+    ))
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics
+    ---
+    responses:
+      200:
+        description: Metrics in Prometheus text exposition format
+    """
+    return Response(registry.expose(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,73 @@
+import json
+from threading import Lock
+
+from flask import request
+from flask_socketio import SocketIO, join_room, leave_room
+
+from src.services.events import broker
+from src.services.metrics import Gauge, registry
+
+socketio = SocketIO()
+
+# Under gunicorn's gthread worker every connected client holds a worker
+# thread for as long as it stays connected; past ``max_clients``
+# connections are refused so ordinary requests always find a thread.
+# Refused clients fall back to polling.
+_clients = {'max': None, 'sids': set()}
+_clients_lock = Lock()
+
+
+def _forward_to_room(storm_id, message):
+    """Relay a broker event to the Socket.IO clients watching that storm."""
+    socketio.emit('storm_event', json.loads(message), to=storm_id)
+
+
+def init_realtime(app, max_clients=None, **options):
+    """Attach Socket.IO to the app and start relaying storm events.
+
+    ``max_clients`` caps the Socket.IO connections of this process (see
+    ``WEB_SOCKET_CLIENTS`` in gunicorn.conf.py); None for no cap.
+
+    With several worker processes, either share the broker (see
+    ``shared_state``), so every worker relays every event to its own
+    clients, or pass ``message_queue`` (e.g. a Redis URL) so that an emit
+    from one worker reaches clients of the others; not both.
+    """
+    _clients['max'] = max_clients
+    socketio.init_app(app, **options)
+    broker.subscribe_all(_forward_to_room)
+
+
+registry.register(Gauge(
+    'storm_socketio_clients', 'Socket.IO clients connected to this worker', lambda: len(_clients['sids'])))
+
+
+@socketio.on('connect')
+def on_connect(auth=None):
+    with _clients_lock:
+        if _clients['max'] is not None and len(_clients['sids']) >= _clients['max']:
+            return False
+        _clients['sids'].add(request.sid)
+
+
+@socketio.on('disconnect')
+def on_disconnect():
+    with _clients_lock:
+        _clients['sids'].discard(request.sid)
+
+
+@socketio.on('subscribe')
+def on_subscribe(data):
+    storm_id = (data or {}).get('stormId')
+    if not storm_id:
+        return {'error': 'stormId is required'}
+    join_room(storm_id, sid=request.sid)
+    return {'subscribed': storm_id}
+
+
+@socketio.on('unsubscribe')
+def on_unsubscribe(data):
+    storm_id = (data or {}).get('stormId')
+    if storm_id:
+        leave_room(storm_id, sid=request.sid)
+    return {'unsubscribed': storm_id}
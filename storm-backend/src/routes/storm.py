@@ -1,15 +1,46 @@
-from flask import Blueprint, request, jsonify, session
-from src.models.storm import db, Storm, Idea, Vote, AnonymousUser
+from flask import Blueprint, Response, abort, current_app, request, jsonify, stream_with_context
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import HTTPException
+from src.json_provider import dumps_bytes
+from src.migrations import migrate_command
+from src.query_plans import check_query_plans_command
+from src.models.storm import db, Storm, Idea, IdeaSignature, AnonymousUser, Tombstone, StormArchive, next_revision
+from src.services import analytics, events
+from src.services.auth import current_principal, forget, is_moderator, remember
+from src.services.cache import snapshot_cache
+from src.services.codes import storm_codes
+from src.services.duplicates import forget_idea, index_idea
+from src.services.events import publish_storm_event
+from src.services.idea_transfer import InvalidImport, export_ideas, import_ideas
+from src.services.ledger import InsufficientTokens, open_ledger, rebuild_ledger_command
+from src.services.locks import storm_write_lock
+from src.services.ratelimit import rate_limited
+from src.services.live import LiveStormClosed, live_engine
+from src.services.listing import InvalidListingRequest, list_storm_summaries, parse_fields, parse_limit
+from src.services.phases import advance_storm_phase, phase_advanced_event, phase_deadline, phase_scheduler
+from src.services.results import get_storm_results
+from src.services.retention import archive_command, purge_sessions_command
+from src.services.search import rebuild_search_command, search_ideas
+from src.services.sync import get_changes, get_storm_version
+from src.services.voting import VoteError, cast_votes, parse_allocation, votes_accepted
 import uuid
-import random
-import string
 from datetime import datetime
 
 storm_bp = Blueprint('storm', __name__)
+storm_bp.cli.command('rebuild-ledger')(rebuild_ledger_command)
+storm_bp.cli.command('migrate')(migrate_command)
+storm_bp.cli.command('check-query-plans')(check_query_plans_command)
+storm_bp.cli.command('archive')(archive_command)
+storm_bp.cli.command('purge-sessions')(purge_sessions_command)
+storm_bp.cli.command('rebuild-search')(rebuild_search_command)
 
-def generate_storm_code():
-    """Generate a unique storm code"""
-    return 'STORM-' + ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
+# Only codes issued before the allocator can collide, so a few attempts are plenty
+CODE_ATTEMPTS = 5
+
+@storm_bp.errorhandler(404)
+def not_found(e):
+    """get_or_404/abort(404) in these routes answer in the API's JSON error shape"""
+    return jsonify({'error': 'Not found'}), 404
 
 def generate_session_id():
     """Generate a unique session ID"""
@@ -19,9 +50,42 @@ def generate_id():
     """Generate a unique ID"""
     return str(uuid.uuid4())
 
+def _storm_changed(storm_id, event_type, data):
+    """Drop the cached snapshot and notify subscribers after a committed change"""
+    snapshot_cache.invalidate(storm_id)
+    publish_storm_event(storm_id, event_type, data)
+
+def _duplicates_to_dict(duplicates):
+    """``[(idea id, similarity)]`` from duplicate detection, with the ideas' titles"""
+    if not duplicates:
+        return []
+    titles = dict(
+        db.session.query(Idea.id, Idea.title).filter(Idea.id.in_([idea_id for idea_id, _ in duplicates]))
+    )
+    return [
+        {'ideaId': idea_id, 'title': titles.get(idea_id), 'similarity': round(score, 2)}
+        for idea_id, score in duplicates
+    ]
+
+def _storm_snapshot(storm_id):
+    """Encoded JSON of Storm.to_dict(), served from the snapshot cache when current"""
+    live_engine.sync(storm_id)
+    version = get_storm_version(storm_id)
+    if version is None:
+        abort(404)
+    body = snapshot_cache.get(storm_id, version.revision)
+    if body is None and version.archived_at is not None:
+        body = db.session.get(StormArchive, storm_id).snapshot_bytes()
+        snapshot_cache.set(storm_id, version.revision, body)
+    elif body is None:
+        storm = Storm.eager_query().filter_by(id=storm_id).first_or_404()
+        body = dumps_bytes(storm.to_dict())
+        snapshot_cache.set(storm_id, storm.revision, body)
+    return body
+
 @storm_bp.route('/storms', methods=['GET'])
 def list_storms():
-    """List storms
+    """List storms, newest first, one page at a time
     ---
     parameters:
       - name: status
@@ -29,19 +93,40 @@ def list_storms():
         type: string
         required: false
         description: Filter by storm status
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        description: Page size (default 50, max 200)
+      - name: cursor
+        in: query
+        type: string
+        required: false
+        description: nextCursor value returned by the previous page
+      - name: fields
+        in: query
+        type: string
+        required: false
+        description: Comma-separated fields to return (e.g. id,title,status,ideaCount,voteCount)
     responses:
       200:
-        description: A list of storms
+        description: A page of storms and the cursor of the next page
+      400:
+        description: Invalid cursor, limit or fields
       500:
         description: Server error
     """
     try:
-        status = request.args.get('status')
-        query = Storm.query
-        if status:
-            query = query.filter_by(status=status)
-        storms = query.order_by(Storm.created_at.desc()).all()
-        return jsonify([storm.to_dict() for storm in storms])
+        return jsonify(list_storm_summaries(
+            status=request.args.get('status'),
+            fields=parse_fields(request.args.get('fields')),
+            limit=parse_limit(request.args.get('limit')),
+            cursor=request.args.get('cursor')
+        ))
+    except InvalidListingRequest as e:
+        return jsonify({'error': str(e)}), 400
+    except HTTPException:
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -81,27 +166,39 @@ def create_storm():
     try:
         data = request.get_json()
         
-        # Generate unique storm code
-        storm_code = generate_storm_code()
-        while Storm.query.get(storm_code):
-            storm_code = generate_storm_code()
-        
         # Generate moderator session
         moderator_id = generate_session_id()
         
-        # Create storm
-        storm = Storm(
-            id=storm_code,
-            title=data['title'],
-            description=data.get('description', ''),
-            token_budget={
-                'maxBlue': data.get('blueTokens', 5),
-                'maxRed': data.get('redTokens', 3)
-            },
-            ideation_time_limit=data.get('ideationTimeLimit'),
-            voting_time_limit=data.get('votingTimeLimit'),
-            moderator_id=moderator_id
-        )
+        # Create storm under a freshly allocated code; the ideation clock starts now
+        now = datetime.utcnow()
+        for _ in range(CODE_ATTEMPTS):
+            storm_code = storm_codes.allocate()
+            storm = Storm(
+                id=storm_code,
+                title=data['title'],
+                description=data.get('description', ''),
+                token_budget={
+                    'maxBlue': data.get('blueTokens', 5),
+                    'maxRed': data.get('redTokens', 3)
+                },
+                ideation_time_limit=data.get('ideationTimeLimit'),
+                voting_time_limit=data.get('votingTimeLimit'),
+                expires_at=phase_deadline(
+                    'ideation', data.get('ideationTimeLimit'), data.get('votingTimeLimit'), now
+                ),
+                moderator_id=moderator_id,
+                created_at=now,
+                updated_at=now
+            )
+            db.session.add(storm)
+            try:
+                db.session.flush()
+                break
+            except IntegrityError:
+                # Taken by a code issued before the allocator existed
+                db.session.rollback()
+        else:
+            return jsonify({'error': 'Could not allocate a storm code'}), 500
         
         # Create moderator user
         moderator = AnonymousUser(
@@ -111,19 +208,21 @@ def create_storm():
             role='moderator'
         )
         
-        db.session.add(storm)
         db.session.add(moderator)
+        open_ledger(storm_code, moderator_id)
         db.session.commit()
+        phase_scheduler.schedule(storm.id, storm.status, storm.expires_at)
         
-        # Set session
-        session['user_id'] = moderator_id
-        session['storm_id'] = storm_code
+        token = remember(moderator)
         
         return jsonify({
             'storm': storm.to_dict(),
-            'user': moderator.to_dict()
+            'user': moderator.to_dict(),
+            'token': token
         }), 201
         
+    except HTTPException:
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -146,13 +245,178 @@ def get_storm(storm_id):
       500:
         description: Server error
     """
+    try:
+        return Response(_storm_snapshot(storm_id), mimetype='application/json')
+    except HTTPException:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@storm_bp.route('/storms/<storm_id>/results', methods=['GET'])
+def get_results(storm_id):
+    """Get aggregated per-idea scores for a storm
+    ---
+    parameters:
+      - name: storm_id
+        in: path
+        type: string
+        required: true
+        description: The storm ID
+      - name: top
+        in: query
+        type: integer
+        required: false
+        description: Only return the N best ranked ideas
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        description: Page size
+      - name: offset
+        in: query
+        type: integer
+        required: false
+        description: Number of ranked ideas to skip
+    responses:
+      200:
+        description: Ranked ideas with blue, red and net scores
+      400:
+        description: Invalid pagination parameters
+      404:
+        description: Not found
+      500:
+        description: Server error
+    """
     try:
         storm = Storm.query.get_or_404(storm_id)
-        return jsonify(storm.to_dict())
+
+        top = request.args.get('top', type=int)
+        limit = top if top is not None else request.args.get('limit', type=int)
+        offset = 0 if top is not None else request.args.get('offset', 0, type=int)
+
+        if (limit is not None and limit < 0) or offset < 0:
+            return jsonify({'error': 'limit and offset must be positive'}), 400
+
+        return jsonify(get_storm_results(storm, limit=limit, offset=offset))
+    except HTTPException:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@storm_bp.route('/storms/<storm_id>/analytics', methods=['GET'])
+def get_analytics(storm_id):
+    """Get consensus, polarization and ranking confidence for a storm's ideas
+    ---
+    parameters:
+      - name: storm_id
+        in: path
+        type: string
+        required: true
+        description: The storm ID
+      - name: resamples
+        in: query
+        type: integer
+        required: false
+        description: Bootstrap resamples for the rank intervals (default 200, 0 to skip)
+      - name: participants
+        in: query
+        type: integer
+        required: false
+        description: Number of most influential participants to list (default 20)
+    responses:
+      200:
+        description: Per-idea statistics in rank order and the most influential participants
+      400:
+        description: Invalid parameters
+      404:
+        description: Not found
+      410:
+        description: The storm's votes were dropped when it was archived
+      500:
+        description: Server error
+      501:
+        description: NumPy is not installed
+    """
+    try:
+        # Votes accepted in memory must be in the database the statistics read
+        live_engine.sync(storm_id)
+        storm = Storm.query.get_or_404(storm_id)
+        if not analytics.available():
+            return jsonify({'error': 'Analytics require numpy'}), 501
+
+        resamples = request.args.get('resamples', analytics.DEFAULT_RESAMPLES, type=int)
+        participants = request.args.get('participants', 20, type=int)
+        if not 0 <= resamples <= analytics.MAX_RESAMPLES or participants < 0:
+            return jsonify({'error': f'resamples must be between 0 and {analytics.MAX_RESAMPLES} '
+                                     'and participants positive'}), 400
+
+        return jsonify(analytics.get_storm_analytics(storm, resamples=resamples, participants=participants))
+    except analytics.VotesUnavailable as e:
+        return jsonify({'error': str(e)}), 410
+    except HTTPException:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@storm_bp.route('/storms/<storm_id>/changes', methods=['GET'])
+def get_storm_changes(storm_id):
+    """Get what changed in a storm since a given version
+    ---
+    parameters:
+      - name: storm_id
+        in: path
+        type: string
+        required: true
+        description: The storm ID
+      - name: since
+        in: query
+        type: integer
+        required: false
+        description: Last version seen by the client (0 or omitted for everything)
+      - name: If-None-Match
+        in: header
+        type: string
+        required: false
+        description: ETag of the previous response for the same since value
+    responses:
+      200:
+        description: Created/updated ideas, votes and participants, deleted ids and the new version
+      304:
+        description: Nothing changed since the previous response
+      400:
+        description: Invalid since value
+      404:
+        description: Not found
+      500:
+        description: Server error
+    """
+    try:
+        since = request.args.get('since', 0, type=int)
+        if since < 0:
+            return jsonify({'error': 'since must be positive'}), 400
+
+        # Votes accepted in memory must be in the revision the ETag names
+        live_engine.sync(storm_id)
+        version = get_storm_version(storm_id)
+        if version is None:
+            return jsonify({'error': 'Storm not found'}), 404
+
+        etag = f'{storm_id}-{version.revision}-{since}'
+        if request.if_none_match.contains(etag):
+            response = current_app.response_class(status=304)
+            response.set_etag(etag)
+            return response
+
+        response = jsonify(get_changes(storm_id, since, version))
+        response.set_etag(etag)
+        return response
+    except HTTPException:
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @storm_bp.route('/storms/<storm_id>/join', methods=['POST'])
+@rate_limited('join')
 def join_storm(storm_id):
     """Join a storm as anonymous user
     ---
@@ -178,6 +442,12 @@ def join_storm(storm_id):
         description: Bad request
       401:
         description: Unauthorized
+      404:
+        description: Not found
+      409:
+        description: Storm is archived
+      429:
+        description: Rate limited or overloaded; retry after Retry-After seconds
       500:
         description: Server error
     """
@@ -189,6 +459,8 @@ def join_storm(storm_id):
             return jsonify({'error': 'Username is required'}), 400
         
         storm = Storm.query.get_or_404(storm_id)
+        if storm.archived_at is not None:
+            return jsonify({'error': 'Storm is archived'}), 409
         
         # Generate session ID
         session_id = generate_session_id()
@@ -198,26 +470,104 @@ def join_storm(storm_id):
             session_id=session_id,
             username=username,
             storm_id=storm_id,
-            role='participant'
+            role='participant',
+            revision=next_revision(storm_id)
         )
         
         db.session.add(user)
+        open_ledger(storm_id, session_id)
         db.session.commit()
         
-        # Set session
-        session['user_id'] = session_id
-        session['storm_id'] = storm_id
+        _storm_changed(storm_id, events.PARTICIPANT_JOINED, user.to_dict())
+        
+        token = remember(user)
         
         return jsonify({
             'storm': storm.to_dict(),
-            'user': user.to_dict()
+            'user': user.to_dict(),
+            'token': token
         })
         
+    except HTTPException:
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@storm_bp.route('/storms/<storm_id>/ideas', methods=['GET'])
+def list_storm_ideas(storm_id):
+    """Search a storm's ideas, or list them when no query is given
+    ---
+    parameters:
+      - name: storm_id
+        in: path
+        type: string
+        required: true
+      - name: q
+        in: query
+        type: string
+        required: false
+        description: Words to search for in titles and descriptions (best matches first)
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        description: Page size (default 50, max 200)
+      - name: offset
+        in: query
+        type: integer
+        required: false
+    responses:
+      200:
+        description: Matching ideas, each with duplicateOf/similarity when flagged as a near-duplicate
+      400:
+        description: Invalid paging parameters
+      404:
+        description: Not found
+      500:
+        description: Server error
+    """
+    try:
+        limit = request.args.get('limit', 50, type=int)
+        offset = request.args.get('offset', 0, type=int)
+        if limit < 1 or limit > 200 or offset < 0:
+            return jsonify({'error': 'limit must be 1-200 and offset positive'}), 400
+        
+        if get_storm_version(storm_id) is None:
+            return jsonify({'error': 'Storm not found'}), 404
+        
+        q = request.args.get('q', '').strip()
+        if q:
+            ideas = [idea for idea, _ in search_ideas(storm_id, q, limit=limit, offset=offset)]
+        else:
+            ideas = (
+                Idea.query.filter(Idea.storm_id == storm_id)
+                .order_by(Idea.created_at, Idea.id)
+                .limit(limit).offset(offset).all()
+            )
+        
+        flagged = {
+            row.idea_id: row for row in db.session.query(
+                IdeaSignature.idea_id, IdeaSignature.duplicate_of, IdeaSignature.similarity
+            ).filter(IdeaSignature.idea_id.in_([idea.id for idea in ideas]))
+        }
+        results = []
+        for idea in ideas:
+            idea_data = idea.to_dict()
+            signature = flagged.get(idea.id)
+            idea_data['duplicateOf'] = signature.duplicate_of if signature else None
+            idea_data['similarity'] = signature.similarity if signature else None
+            results.append(idea_data)
+        
+        return jsonify({'stormId': storm_id, 'q': q, 'limit': limit, 'offset': offset, 'ideas': results})
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @storm_bp.route('/storms/<storm_id>/ideas', methods=['POST'])
+@rate_limited('idea')
 def submit_idea(storm_id):
     """Submit a new idea
     ---
@@ -240,23 +590,29 @@ def submit_idea(storm_id):
               type: string
     responses:
       201:
-        description: Idea created
+        description: Idea created, with possibleDuplicates (near-duplicate ideas of the storm)
       400:
         description: Invalid phase or data
       401:
         description: Not authenticated
+      403:
+        description: Not a participant of this storm
+      429:
+        description: Rate limited or overloaded; retry after Retry-After seconds
       500:
         description: Server error
     """
     try:
         data = request.get_json()
-        user_id = session.get('user_id')
+        principal = current_principal()
         
-        if not user_id:
+        if not principal:
             return jsonify({'error': 'Not authenticated'}), 401
         
+        if principal.storm_id != storm_id:
+            return jsonify({'error': 'Not a participant of this storm'}), 403
+        
         storm = Storm.query.get_or_404(storm_id)
-        user = AnonymousUser.query.get_or_404(user_id)
         
         if storm.status != 'ideation':
             return jsonify({'error': 'Storm is not in ideation phase'}), 400
@@ -267,19 +623,140 @@ def submit_idea(storm_id):
             title=data['title'],
             description=data.get('description', ''),
             storm_id=storm_id,
-            author_id=user_id,
-            author_username=user.username
+            author_id=principal.session_id,
+            author_username=principal.username,
+            revision=next_revision(storm_id)
         )
         
         db.session.add(idea)
+        db.session.flush()
+        duplicates = index_idea(idea)
         db.session.commit()
         
-        return jsonify(idea.to_dict()), 201
+        idea_data = idea.to_dict()
+        _storm_changed(storm_id, events.IDEA_CREATED, idea_data)
+        
+        return jsonify(dict(idea_data, possibleDuplicates=_duplicates_to_dict(duplicates))), 201
         
+    except HTTPException:
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@storm_bp.route('/storms/<storm_id>/ideas:import', methods=['POST'])
+def import_storm_ideas(storm_id):
+    """Bulk import ideas from NDJSON or CSV (moderator only)
+    ---
+    consumes:
+      - application/x-ndjson
+      - text/csv
+    parameters:
+      - name: storm_id
+        in: path
+        type: string
+        required: true
+      - name: format
+        in: query
+        type: string
+        required: false
+        description: ndjson or csv (defaults from the Content-Type)
+      - in: body
+        name: body
+        required: true
+        description: One idea per line/row with title, optional description and authorUsername
+        schema:
+          type: string
+    responses:
+      201:
+        description: Ideas imported
+      400:
+        description: Invalid phase or malformed record; nothing was imported
+      401:
+        description: Not authenticated
+      403:
+        description: Not authorized
+      500:
+        description: Server error
+    """
+    try:
+        principal = current_principal()
+        
+        if not principal:
+            return jsonify({'error': 'Not authenticated'}), 401
+        
+        if not is_moderator(principal, storm_id):
+            return jsonify({'error': 'Not authorized'}), 403
+        
+        storm = Storm.query.get_or_404(storm_id)
+        
+        if storm.status != 'ideation':
+            return jsonify({'error': 'Storm is not in ideation phase'}), 400
+        
+        fmt = request.args.get('format') or ('csv' if request.mimetype == 'text/csv' else 'ndjson')
+        if fmt not in ('csv', 'ndjson'):
+            return jsonify({'error': 'format must be csv or ndjson'}), 400
+        
+        try:
+            count = import_ideas(storm, principal.session_id, principal.username, request.stream, fmt)
+        except (InvalidImport, UnicodeDecodeError) as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 400
+        
+        _storm_changed(storm_id, events.IDEAS_IMPORTED, {'count': count})
+        
+        return jsonify({'imported': count}), 201
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@storm_bp.route('/storms/<storm_id>/ideas:export', methods=['GET'])
+def export_storm_ideas(storm_id):
+    """Stream all ideas of a storm with their scores
+    ---
+    parameters:
+      - name: storm_id
+        in: path
+        type: string
+        required: true
+      - name: format
+        in: query
+        type: string
+        required: false
+        description: ndjson (default) or csv
+    responses:
+      200:
+        description: Ranked ideas, one per line/row
+      400:
+        description: Unknown format
+      404:
+        description: Not found
+      500:
+        description: Server error
+    """
+    try:
+        # Votes accepted in memory must be in the scores exported from the database
+        live_engine.sync(storm_id)
+        storm = Storm.query.get_or_404(storm_id)
+        
+        fmt = request.args.get('format', 'ndjson')
+        if fmt not in ('csv', 'ndjson'):
+            return jsonify({'error': 'format must be csv or ndjson'}), 400
+        
+        mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+        return Response(
+            stream_with_context(export_ideas(storm.id, fmt)),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename={storm.id}-ideas.{fmt}'}
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @storm_bp.route('/ideas/<idea_id>', methods=['PUT'])
 def update_idea(idea_id):
     """Update an idea
@@ -303,26 +780,28 @@ def update_idea(idea_id):
               type: string
     responses:
       200:
-        description: Idea updated
+        description: Idea updated, with possibleDuplicates
       400:
         description: Not editable in current phase
       401:
         description: Not authenticated
       403:
         description: Not authorized
+      404:
+        description: Not found
       500:
         description: Server error
     """
     try:
         data = request.get_json()
-        user_id = session.get('user_id')
+        principal = current_principal()
         
-        if not user_id:
+        if not principal:
             return jsonify({'error': 'Not authenticated'}), 401
         
         idea = Idea.query.get_or_404(idea_id)
         
-        if idea.author_id != user_id:
+        if idea.author_id != principal.session_id:
             return jsonify({'error': 'Not authorized'}), 403
         
         storm = Storm.query.get_or_404(idea.storm_id)
@@ -332,11 +811,18 @@ def update_idea(idea_id):
         idea.title = data.get('title', idea.title)
         idea.description = data.get('description', idea.description)
         idea.updated_at = datetime.utcnow()
+        idea.revision = next_revision(storm.id)
+        duplicates = index_idea(idea)
         
         db.session.commit()
         
-        return jsonify(idea.to_dict())
+        idea_data = idea.to_dict()
+        _storm_changed(storm.id, events.IDEA_UPDATED, idea_data)
+        
+        return jsonify(dict(idea_data, possibleDuplicates=_duplicates_to_dict(duplicates)))
         
+    except HTTPException:
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -359,39 +845,50 @@ def delete_idea(idea_id):
         description: Not authenticated
       403:
         description: Not authorized
+      404:
+        description: Not found
       500:
         description: Server error
     """
     try:
-        user_id = session.get('user_id')
+        principal = current_principal()
 
-        if not user_id:
+        if not principal:
             return jsonify({'error': 'Not authenticated'}), 401
 
         idea = Idea.query.get_or_404(idea_id)
-        storm = Storm.query.get_or_404(idea.storm_id)
 
         # Determine permissions: idea author or the storm moderator
-        user = AnonymousUser.query.get_or_404(user_id)
-        is_author = idea.author_id == user_id
-        is_moderator = user.role == 'moderator' and storm.moderator_id == user_id
-
-        if not (is_author or is_moderator):
+        if not (idea.author_id == principal.session_id or is_moderator(principal, idea.storm_id)):
             return jsonify({'error': 'Not authorized'}), 403
 
+        storm = Storm.query.get_or_404(idea.storm_id)
+
         if storm.status != 'ideation':
             return jsonify({'error': 'Cannot delete ideas after ideation phase'}), 400
 
+        db.session.add(Tombstone(
+            storm_id=storm.id,
+            entity='idea',
+            entity_id=idea_id,
+            revision=next_revision(storm.id)
+        ))
+        forget_idea(idea_id)
         db.session.delete(idea)
         db.session.commit()
 
+        _storm_changed(storm.id, events.IDEA_DELETED, {'ideaId': idea_id})
+
         return '', 204
 
+    except HTTPException:
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @storm_bp.route('/ideas/<idea_id>/vote', methods=['POST'])
+@rate_limited('vote')
 def submit_vote(idea_id):
     """Submit a vote for an idea
     ---
@@ -421,69 +918,193 @@ def submit_vote(idea_id):
         description: Validation error or insufficient tokens
       401:
         description: Not authenticated
+      403:
+        description: Not a participant of this storm
+      404:
+        description: Not found
+      409:
+        description: Concurrent conflicting vote, or the phase is changing
+      429:
+        description: Rate limited or overloaded; retry after Retry-After seconds
       500:
         description: Server error
     """
     try:
         data = request.get_json()
-        user_id = session.get('user_id')
+        principal = current_principal()
         
-        if not user_id:
+        if not principal:
             return jsonify({'error': 'Not authenticated'}), 401
         
+        live = live_engine.storm(principal.storm_id) if live_engine.running else None
+        if live is not None:
+            try:
+                allocation = parse_allocation(data, idea_id=idea_id)
+                votes, replaced = live.cast_votes(live_engine, principal.session_id, [allocation])
+            except (VoteError, InsufficientTokens) as e:
+                return jsonify({'error': str(e)}), 400
+            except LiveStormClosed:
+                return jsonify({'error': 'Phase is changing, please retry'}), 409
+            votes_accepted.inc('live')
+            publish_storm_event(live.id, events.VOTE_CAST, {
+                'vote': votes[0],
+                'replacedVoteId': replaced.get(idea_id)
+            })
+            return jsonify(votes[0]), 201
+        
         idea = Idea.query.get_or_404(idea_id)
-        storm = Storm.query.get_or_404(idea.storm_id)
         
-        if storm.status != 'voting':
-            return jsonify({'error': 'Storm is not in voting phase'}), 400
+        if principal.storm_id != idea.storm_id:
+            return jsonify({'error': 'Not a participant of this storm'}), 403
         
-        blue_tokens = data.get('blueTokens', 0)
-        red_tokens = data.get('redTokens', 0)
-        comment = data.get('comment', '')
+        with storm_write_lock(idea.storm_id):
+            storm = Storm.query.get_or_404(idea.storm_id)
         
-        if not comment.strip():
-            return jsonify({'error': 'Comment is required'}), 400
+            if storm.status != 'voting':
+                return jsonify({'error': 'Storm is not in voting phase'}), 400
         
-        if blue_tokens > 0 and red_tokens > 0:
-            return jsonify({'error': 'Cannot use both blue and red tokens on the same idea'}), 400
+            try:
+                allocation = parse_allocation(data, idea_id=idea_id)
+                votes, replaced = cast_votes(storm, principal.session_id, [allocation], check_ideas=False)
+            except (VoteError, InsufficientTokens) as e:
+                db.session.rollback()
+                return jsonify({'error': str(e)}), 400
         
-        # Check token budget
-        user_votes = Vote.query.filter_by(storm_id=storm.id, user_id=user_id).all()
-        total_blue = sum(vote.blue_tokens for vote in user_votes)
-        total_red = sum(vote.red_tokens for vote in user_votes)
+            db.session.commit()
         
-        if total_blue + blue_tokens > storm.token_budget['maxBlue']:
-            return jsonify({'error': 'Insufficient blue tokens'}), 400
+        votes_accepted.inc('database')
+        vote_data = votes[0]
+        _storm_changed(storm.id, events.VOTE_CAST, {
+            'vote': vote_data,
+            'replacedVoteId': replaced.get(idea_id)
+        })
         
-        if total_red + red_tokens > storm.token_budget['maxRed']:
-            return jsonify({'error': 'Insufficient red tokens'}), 400
+        return jsonify(vote_data), 201
         
-        # Remove existing vote for this idea
-        existing_vote = Vote.query.filter_by(idea_id=idea_id, user_id=user_id).first()
-        if existing_vote:
-            db.session.delete(existing_vote)
+    except IntegrityError:
+        # A concurrent vote by the same participant on the same idea won the race
+        db.session.rollback()
+        return jsonify({'error': 'Conflicting vote, please retry'}), 409
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@storm_bp.route('/storms/<storm_id>/votes:batch', methods=['POST'])
+@rate_limited('vote')
+def submit_votes_batch(storm_id):
+    """Submit several votes at once, all or nothing
+    ---
+    consumes:
+      - application/json
+    parameters:
+      - name: storm_id
+        in: path
+        type: string
+        required: true
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          properties:
+            votes:
+              type: array
+              items:
+                type: object
+                properties:
+                  ideaId:
+                    type: string
+                  blueTokens:
+                    type: integer
+                  redTokens:
+                    type: integer
+                  comment:
+                    type: string
+    responses:
+      201:
+        description: All votes submitted
+      400:
+        description: Validation error or insufficient tokens; no vote was applied
+      401:
+        description: Not authenticated
+      403:
+        description: Not a participant of this storm
+      409:
+        description: Concurrent conflicting vote, or the phase is changing; no vote was applied
+      429:
+        description: Rate limited or overloaded; retry after Retry-After seconds
+      500:
+        description: Server error
+    """
+    try:
+        data = request.get_json()
+        principal = current_principal()
         
-        # Create new vote
-        vote = Vote(
-            id=generate_id(),
-            idea_id=idea_id,
-            storm_id=storm.id,
-            user_id=user_id,
-            blue_tokens=blue_tokens,
-            red_tokens=red_tokens,
-            comment=comment
-        )
+        if not principal:
+            return jsonify({'error': 'Not authenticated'}), 401
         
-        db.session.add(vote)
-        db.session.commit()
+        if principal.storm_id != storm_id:
+            return jsonify({'error': 'Not a participant of this storm'}), 403
+        
+        entries = data if isinstance(data, list) else (data or {}).get('votes')
+        if not isinstance(entries, list) or not entries:
+            return jsonify({'error': 'votes must be a non-empty list'}), 400
+        
+        live = live_engine.storm(storm_id) if live_engine.running else None
+        if live is not None:
+            try:
+                allocations = [parse_allocation(entry) for entry in entries]
+                votes, replaced = live.cast_votes(live_engine, principal.session_id, allocations)
+            except (VoteError, InsufficientTokens) as e:
+                return jsonify({'error': str(e)}), 400
+            except LiveStormClosed:
+                return jsonify({'error': 'Phase is changing, please retry'}), 409
+            votes_accepted.inc('live', amount=len(votes))
+            for vote_data in votes:
+                publish_storm_event(storm_id, events.VOTE_CAST, {
+                    'vote': vote_data,
+                    'replacedVoteId': replaced.get(vote_data['ideaId'])
+                })
+            return jsonify({'votes': votes, 'replacedVoteIds': list(replaced.values())}), 201
+        
+        with storm_write_lock(storm_id):
+            storm = Storm.query.get_or_404(storm_id)
         
-        return jsonify(vote.to_dict()), 201
+            if storm.status != 'voting':
+                return jsonify({'error': 'Storm is not in voting phase'}), 400
         
+            try:
+                allocations = [parse_allocation(entry) for entry in entries]
+                votes, replaced = cast_votes(storm, principal.session_id, allocations)
+            except (VoteError, InsufficientTokens) as e:
+                db.session.rollback()
+                return jsonify({'error': str(e)}), 400
+        
+            db.session.commit()
+        
+        votes_accepted.inc('database', amount=len(votes))
+        for vote_data in votes:
+            _storm_changed(storm.id, events.VOTE_CAST, {
+                'vote': vote_data,
+                'replacedVoteId': replaced.get(vote_data['ideaId'])
+            })
+        
+        return jsonify({'votes': votes, 'replacedVoteIds': list(replaced.values())}), 201
+        
+    except IntegrityError:
+        # A concurrent vote by the same participant on the same idea won the race
+        db.session.rollback()
+        return jsonify({'error': 'Conflicting vote, please retry'}), 409
+    except HTTPException:
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @storm_bp.route('/storms/<storm_id>/advance-phase', methods=['POST'])
+@rate_limited('advance')
 def advance_phase(storm_id):
     """Advance storm to next phase (moderator only)
     ---
@@ -497,37 +1118,48 @@ def advance_phase(storm_id):
         description: Phase advanced
       400:
         description: Cannot advance further
+      409:
+        description: The phase was advanced concurrently
       401:
         description: Not authenticated
       403:
         description: Not authorized
+      429:
+        description: Rate limited or overloaded; retry after Retry-After seconds
       500:
         description: Server error
     """
     try:
-        user_id = session.get('user_id')
+        principal = current_principal()
         
-        if not user_id:
+        if not principal:
             return jsonify({'error': 'Not authenticated'}), 401
         
-        storm = Storm.query.get_or_404(storm_id)
-        user = AnonymousUser.query.get_or_404(user_id)
-        
-        if user.role != 'moderator' or storm.moderator_id != user_id:
+        if not is_moderator(principal, storm_id):
             return jsonify({'error': 'Not authorized'}), 403
         
-        if storm.status == 'ideation':
-            storm.status = 'voting'
-        elif storm.status == 'voting':
-            storm.status = 'results'
-        else:
+        storm = Storm.query.get_or_404(storm_id)
+        
+        if storm.status == 'results':
             return jsonify({'error': 'Cannot advance from results phase'}), 400
         
-        storm.updated_at = datetime.utcnow()
-        db.session.commit()
+        try:
+            advanced = advance_storm_phase(storm.id, storm.status)
+            if advanced is None:
+                db.session.rollback()
+                return jsonify({'error': 'Phase already advanced'}), 409
+            db.session.commit()
+        finally:
+            # Committed or rolled back: votes may load the storm from the database again
+            live_engine.release_storm(storm_id)
+        
+        phase_advanced_event(storm_id, *advanced)
+        phase_scheduler.schedule(storm_id, advanced.status, advanced.expires_at)
         
         return jsonify(storm.to_dict())
         
+    except HTTPException:
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -544,20 +1176,22 @@ def get_session():
       500:
         description: Server error
     """
-    user_id = session.get('user_id')
-    storm_id = session.get('storm_id')
+    principal = current_principal()
     
-    if not user_id or not storm_id:
+    if not principal or not principal.storm_id:
         return jsonify({'error': 'No active session'}), 401
     
     try:
-        user = AnonymousUser.query.get_or_404(user_id)
-        storm = Storm.query.get_or_404(storm_id)
+        user = AnonymousUser.query.get_or_404(principal.session_id)
+        storm_body = _storm_snapshot(principal.storm_id)
+        user_body = dumps_bytes(user.to_dict())
         
-        return jsonify({
-            'user': user.to_dict(),
-            'storm': storm.to_dict()
-        })
+        return Response(
+            b'{"storm":' + storm_body + b',"user":' + user_body + b'}',
+            mimetype='application/json'
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -573,9 +1207,10 @@ def clear_session():
         description: Server error
     """
     try:
-        session.pop('user_id', None)
-        session.pop('storm_id', None)
+        forget()
         return jsonify({'message': 'Session cleared'})
+    except HTTPException:
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
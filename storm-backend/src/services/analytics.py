@@ -0,0 +1,281 @@
+"""Voting analytics: consensus, polarization and ranking confidence.
+
+A storm's votes are loaded as columns (idea index, participant index,
+blue tokens, red tokens) and every statistic is computed with NumPy over
+those arrays instead of row by row:
+
+* net score, supporters and opponents per idea;
+* ``consensus``: how much the idea's voters agree on its sign
+  (1 when everyone voted the same way, 0 for an even split);
+* ``polarization``: the same balance measured in tokens, and
+  ``controversy`` = tokens ** (smaller side / larger side), which only gets
+  large for ideas that drew many tokens from both sides;
+* ``rankLow``/``rankHigh``: a 95% bootstrap interval on each idea's rank,
+  resampling participants with replacement;
+* per-participant ``influence``: for each of a participant's votes, how many
+  places the idea would move if that vote were withdrawn, summed.
+
+NumPy is optional; ``available()`` is false without it and the endpoint
+answers 501. Storms in the ``results`` phase can no longer change, so
+their analytics are computed once and cached.
+"""
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+
+from sqlalchemy import select
+
+try:
+    import numpy as np
+except ImportError:  # optional, only the analytics endpoint needs it
+    np = None
+
+from src.models.storm import db, AnonymousUser, Idea, StormArchive, Vote
+from src.services.live import live_engine
+
+DEFAULT_RESAMPLES = 200
+MAX_RESAMPLES = 1000
+CONFIDENCE = 0.95
+# Bootstrap resamples are processed in batches of at most this many
+# (resample, vote) cells, which bounds the working memory (~8 bytes each)
+BATCH_CELLS = 4_000_000
+
+FINISHED_CACHE_SIZE = 64
+_finished_analytics = OrderedDict()
+_finished_lock = Lock()
+
+
+class VotesUnavailable(Exception):
+    """The storm was archived with its votes dropped."""
+
+
+def available():
+    return np is not None
+
+
+def load_vote_arrays(storm_id):
+    """Return ``(idea_ids, user_ids, idea_index, user_index, blue, red)``.
+
+    ``idea_ids`` holds every idea of the storm in ranking tie-break order
+    (creation time, then id), so index order breaks ties the same way as
+    ``results_query``. The other four arrays have one entry per vote.
+    """
+    idea_ids = db.session.execute(
+        select(Idea.id).where(Idea.storm_id == storm_id).order_by(Idea.created_at, Idea.id)
+    ).scalars().all()
+    rows = db.session.execute(
+        select(Vote.idea_id, Vote.user_id, Vote.blue_tokens, Vote.red_tokens)
+        .where(Vote.storm_id == storm_id)
+    ).all()
+
+    position = {idea_id: i for i, idea_id in enumerate(idea_ids)}
+    rows = [row for row in rows if row[0] in position]
+    if not rows:
+        empty = np.zeros(0, dtype=np.int64)
+        return idea_ids, [], empty, empty, empty, empty
+
+    vote_ideas, vote_users, blue, red = zip(*rows)
+    idea_index = np.fromiter((position[idea_id] for idea_id in vote_ideas), dtype=np.int64, count=len(rows))
+    user_ids, user_index = np.unique(np.array(vote_users, dtype=object), return_inverse=True)
+    return (
+        idea_ids,
+        list(user_ids),
+        idea_index,
+        user_index.astype(np.int64),
+        np.array([b or 0 for b in blue], dtype=np.int64),
+        np.array([r or 0 for r in red], dtype=np.int64),
+    )
+
+
+def _ranks(scores):
+    """1-based rank of every column of ``scores`` (last axis), best score first, ties by index."""
+    order = np.argsort(-scores, axis=-1, kind='stable')
+    ranks = np.empty_like(order)
+    positions = np.broadcast_to(np.arange(1, scores.shape[-1] + 1), order.shape)
+    np.put_along_axis(ranks, order, positions, axis=-1)
+    return ranks
+
+
+def bootstrap_ranks(idea_index, user_index, net, n_ideas, n_users, resamples, seed):
+    """``(resamples, n_ideas)`` ranks with participants resampled with replacement."""
+    rng = np.random.default_rng(seed)
+    if len(net) == 0:
+        return np.tile(np.arange(1, n_ideas + 1), (resamples, 1))
+
+    # Sort votes by idea once so per-idea sums are contiguous segment sums
+    order = np.argsort(idea_index, kind='stable')
+    idea_sorted = idea_index[order]
+    user_sorted = user_index[order]
+    net_sorted = net[order].astype(np.float64)
+    voted_ideas, starts = np.unique(idea_sorted, return_index=True)
+
+    batch = max(1, min(resamples, BATCH_CELLS // len(net)))
+    ranks = np.empty((resamples, n_ideas), dtype=np.int64)
+    for begin in range(0, resamples, batch):
+        size = min(batch, resamples - begin)
+        # How many times each participant is drawn in each resample
+        weights = rng.multinomial(n_users, np.full(n_users, 1.0 / n_users), size=size)
+        contributions = weights[:, user_sorted] * net_sorted
+        scores = np.zeros((size, n_ideas))
+        scores[:, voted_ideas] = np.add.reduceat(contributions, starts, axis=1)
+        ranks[begin:begin + size] = _ranks(scores)
+    return ranks
+
+
+def vote_displacement(idea_index, net, net_score):
+    """Places each vote's idea would move in the ranking if only that vote were withdrawn."""
+    ascending = np.sort(net_score)
+    n_ideas = len(net_score)
+    before = net_score[idea_index]
+    after = before - net
+
+    def ideas_above(value):
+        return n_ideas - np.searchsorted(ascending, value, side='right')
+
+    # The idea itself counts as "above" its own new score when that score drops
+    above_after = ideas_above(after) - (before > after)
+    return np.abs(above_after - ideas_above(before))
+
+
+def analyze(idea_ids, user_ids, idea_index, user_index, blue, red,
+            resamples=DEFAULT_RESAMPLES, seed=0):
+    """Compute idea and participant statistics from vote arrays (see module docstring)."""
+    n_ideas = len(idea_ids)
+    n_users = len(user_ids)
+    net = blue - red
+
+    blue_score = np.bincount(idea_index, weights=blue, minlength=n_ideas)
+    red_score = np.bincount(idea_index, weights=red, minlength=n_ideas)
+    net_score = blue_score - red_score
+    vote_count = np.bincount(idea_index, minlength=n_ideas)
+    supporters = np.bincount(idea_index, weights=net > 0, minlength=n_ideas)
+    opponents = np.bincount(idea_index, weights=net < 0, minlength=n_ideas)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sided = supporters + opponents
+        consensus = np.where(sided > 0, np.abs(supporters - opponents) / sided, 1.0)
+        tokens = blue_score + red_score
+        polarization = np.where(tokens > 0, 1 - np.abs(net_score) / tokens, 0.0)
+        balance = np.where(tokens > 0,
+                           np.minimum(blue_score, red_score) / np.maximum(blue_score, red_score), 0.0)
+        controversy = np.where(tokens > 0, tokens ** balance, 0.0) * (balance > 0)
+
+    rank = _ranks(net_score)
+    tail = (1 - CONFIDENCE) / 2 * 100
+    if resamples:
+        sampled = bootstrap_ranks(idea_index, user_index, net, n_ideas, n_users, resamples, seed)
+        rank_low, rank_high = np.percentile(sampled, [tail, 100 - tail], axis=0, method='nearest')
+    else:
+        rank_low = rank_high = rank
+
+    displacement = vote_displacement(idea_index, net, net_score)
+    influence = np.bincount(user_index, weights=displacement, minlength=n_users)
+    blue_spent = np.bincount(user_index, weights=blue, minlength=n_users)
+    red_spent = np.bincount(user_index, weights=red, minlength=n_users)
+    user_votes = np.bincount(user_index, minlength=n_users)
+
+    idea_order = np.argsort(rank, kind='stable')
+    user_order = np.lexsort((np.arange(n_users), -influence))
+    return {
+        'ideas': [
+            {
+                'ideaId': idea_ids[i],
+                'rank': int(rank[i]),
+                'rankLow': int(rank_low[i]),
+                'rankHigh': int(rank_high[i]),
+                'blueScore': int(blue_score[i]),
+                'redScore': int(red_score[i]),
+                'netScore': int(net_score[i]),
+                'voteCount': int(vote_count[i]),
+                'supporters': int(supporters[i]),
+                'opponents': int(opponents[i]),
+                'consensus': round(float(consensus[i]), 4),
+                'polarization': round(float(polarization[i]), 4),
+                'controversy': round(float(controversy[i]), 4),
+            }
+            for i in idea_order.tolist()
+        ],
+        'participants': [
+            {
+                'userId': user_ids[u],
+                'influence': int(influence[u]),
+                'blueSpent': int(blue_spent[u]),
+                'redSpent': int(red_spent[u]),
+                'voteCount': int(user_votes[u]),
+            }
+            for u in user_order.tolist()
+        ],
+        'participantCount': n_users,
+        'voteCount': int(len(net)),
+        'resamples': resamples,
+    }
+
+
+def _storm_seed(storm_id):
+    # Stable per storm, so repeated (uncached) computations agree
+    return int.from_bytes(hashlib.blake2b(storm_id.encode(), digest_size=8).digest(), 'big')
+
+
+def _compute(storm_id, resamples):
+    archive = db.session.get(StormArchive, storm_id)
+    if archive is not None and archive.votes_dropped:
+        raise VotesUnavailable(f'Votes of storm {storm_id} were dropped when it was archived')
+
+    idea_ids, user_ids, idea_index, user_index, blue, red = load_vote_arrays(storm_id)
+    analytics = analyze(idea_ids, user_ids, idea_index, user_index, blue, red,
+                        resamples=resamples, seed=_storm_seed(storm_id))
+
+    titles = dict(db.session.execute(select(Idea.id, Idea.title).where(Idea.storm_id == storm_id)).all())
+    for idea in analytics['ideas']:
+        idea['title'] = titles.get(idea['ideaId'])
+    usernames = dict(db.session.execute(
+        select(AnonymousUser.session_id, AnonymousUser.username).where(AnonymousUser.storm_id == storm_id)
+    ).all())
+    for participant in analytics['participants']:
+        participant['username'] = usernames.get(participant['userId'])
+    return analytics
+
+
+@live_engine.on_persisted
+def forget_finished_analytics(storm_id):
+    with _finished_lock:
+        for key in [key for key in _finished_analytics if key[0] == storm_id]:
+            del _finished_analytics[key]
+
+
+def _finished_analytics_for(storm_id, resamples):
+    key = (storm_id, resamples)
+    with _finished_lock:
+        analytics = _finished_analytics.get(key)
+        if analytics is not None:
+            _finished_analytics.move_to_end(key)
+            return analytics
+
+    analytics = _compute(storm_id, resamples)
+
+    with _finished_lock:
+        _finished_analytics[key] = analytics
+        _finished_analytics.move_to_end(key)
+        while len(_finished_analytics) > FINISHED_CACHE_SIZE:
+            _finished_analytics.popitem(last=False)
+    return analytics
+
+
+def get_storm_analytics(storm, resamples=DEFAULT_RESAMPLES, participants=20):
+    """Analytics for a storm; only the ``participants`` most influential are listed."""
+    if storm.status == 'results':
+        analytics = _finished_analytics_for(storm.id, resamples)
+    else:
+        analytics = _compute(storm.id, resamples)
+
+    return {
+        'stormId': storm.id,
+        'status': storm.status,
+        'confidence': CONFIDENCE,
+        'resamples': analytics['resamples'],
+        'ideaCount': len(analytics['ideas']),
+        'participantCount': analytics['participantCount'],
+        'voteCount': analytics['voteCount'],
+        'ideas': analytics['ideas'],
+        'participants': analytics['participants'][:participants],
+    }
@@ -0,0 +1,149 @@
+"""Who is calling: signed session tokens and the current principal.
+
+Joining or creating a storm returns a compact signed token carrying the
+participant's session id, storm id, role and username. Clients send it
+as ``Authorization: Bearer <token>``; browsers keep using the session
+cookie, which now holds the same fields. Either way the write endpoints
+learn who is calling and what they may do without reading
+``anonymous_users``.
+
+Tokens are signed with itsdangerous (already a Flask dependency) and
+expire after ``AUTH_TOKEN_MAX_AGE`` seconds (default one day).
+``AUTH_TOKEN_KEYS`` lists the signing keys, comma separated and newest
+last: tokens are signed with the newest and accepted under any of them,
+so a key is rotated by appending a new one and dropping the oldest once
+its tokens have expired. Without it the app's ``SECRET_KEY`` is used.
+
+Verified tokens are kept in an LRU (until they expire), so a busy
+client's token is checked once per worker rather than on every request.
+Tokens cannot be revoked individually; they lapse when they expire or
+when their key leaves ``AUTH_TOKEN_KEYS``.
+"""
+import os
+import time
+from collections import OrderedDict, namedtuple
+from threading import Lock
+
+from flask import current_app, g, request, session
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+from src.models.storm import db, AnonymousUser
+
+DEFAULT_MAX_AGE = 24 * 3600
+SALT = 'storm-session'
+
+Principal = namedtuple('Principal', 'session_id storm_id role username')
+
+
+class TokenSigner:
+    def __init__(self, keys=None, max_age=DEFAULT_MAX_AGE, cache_size=10000):
+        self.keys = keys
+        self.max_age = max_age
+        self.cache_size = cache_size
+        self._serializer = None
+        self._serializer_keys = None
+        self._verified = OrderedDict()
+        self._lock = Lock()
+
+    def configure(self, environ=None):
+        """Read ``AUTH_TOKEN_KEYS`` and ``AUTH_TOKEN_MAX_AGE`` from the environment."""
+        environ = os.environ if environ is None else environ
+        keys = [key for key in environ.get('AUTH_TOKEN_KEYS', '').split(',') if key]
+        self.keys = keys or None
+        self.max_age = int(environ.get('AUTH_TOKEN_MAX_AGE', DEFAULT_MAX_AGE))
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._verified.clear()
+
+    def _get_serializer(self):
+        keys = self.keys or [current_app.config['SECRET_KEY']]
+        if self._serializer is None or self._serializer_keys != keys:
+            # itsdangerous signs with the last key and accepts all of them
+            self._serializer = URLSafeTimedSerializer(keys, salt=SALT)
+            self._serializer_keys = keys
+        return self._serializer
+
+    def issue(self, user):
+        """Token for an ``AnonymousUser``."""
+        return self._get_serializer().dumps([user.session_id, user.storm_id, user.role, user.username])
+
+    def verify(self, token):
+        """Return the token's ``Principal``, or None if it is forged, malformed or expired."""
+        now = time.time()
+        with self._lock:
+            entry = self._verified.get(token)
+            if entry is not None:
+                principal, expires_at = entry
+                if expires_at > now:
+                    self._verified.move_to_end(token)
+                    return principal
+                del self._verified[token]
+
+        try:
+            fields, signed_at = self._get_serializer().loads(token, max_age=self.max_age, return_timestamp=True)
+            principal = Principal(*fields)
+        except (BadSignature, TypeError, ValueError):
+            return None
+
+        with self._lock:
+            self._verified[token] = (principal, signed_at.timestamp() + self.max_age)
+            while len(self._verified) > self.cache_size:
+                self._verified.popitem(last=False)
+        return principal
+
+
+def _bearer_token():
+    header = request.headers.get('Authorization', '')
+    scheme, _, token = header.partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return None
+    return token.strip()
+
+
+def _session_principal():
+    user_id = session.get('user_id')
+    if not user_id:
+        return None
+    if 'role' not in session:
+        # Cookie issued before the principal was stored in it: look it up once
+        user = db.session.get(AnonymousUser, user_id)
+        if user is None:
+            return None
+        remember(user)
+    return Principal(user_id, session.get('storm_id'), session['role'], session.get('username'))
+
+
+def current_principal():
+    """The caller's ``Principal`` (bearer token first, then session cookie), or None.
+
+    Resolved once per request. A request carrying an invalid bearer token
+    is anonymous even if it also has a session cookie.
+    """
+    if 'storm_principal' not in g:
+        token = _bearer_token()
+        g.storm_principal = token_signer.verify(token) if token else _session_principal()
+    return g.storm_principal
+
+
+def remember(user):
+    """Log ``user`` in on the session cookie and return a bearer token for them."""
+    session['user_id'] = user.session_id
+    session['storm_id'] = user.storm_id
+    session['role'] = user.role
+    session['username'] = user.username
+    return token_signer.issue(user)
+
+
+def forget():
+    for key in ('user_id', 'storm_id', 'role', 'username'):
+        session.pop(key, None)
+
+
+def is_moderator(principal, storm_id):
+    return principal.role == 'moderator' and principal.storm_id == storm_id
+
+
+token_signer = TokenSigner()
+token_signer.configure()
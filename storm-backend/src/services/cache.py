@@ -0,0 +1,94 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+class LRUCache:
+    """In-process LRU with a per-entry time to live.
+
+    Backends only need ``get(key)``, ``set(key, value)`` and ``delete(key)``,
+    so a shared store can replace this one when several workers run.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SnapshotCache:
+    """Pre-encoded JSON snapshots of storms, keyed by storm id and revision.
+
+    Every change bumps the storm revision, so a snapshot stored for an
+    older revision is never served; mutating routes also invalidate the
+    entry explicitly so it does not linger until it ages out.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or LRUCache()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def set_backend(self, backend):
+        self.backend = backend
+
+    @staticmethod
+    def _key(storm_id):
+        return f'storm:{storm_id}'
+
+    def get(self, storm_id, revision):
+        entry = self.backend.get(self._key(storm_id))
+        if entry is not None and entry[0] == revision:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return None
+
+    def set(self, storm_id, revision, body):
+        self.backend.set(self._key(storm_id), (revision, body))
+
+    def invalidate(self, storm_id):
+        self.invalidations += 1
+        self.backend.delete(self._key(storm_id))
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'evictions': getattr(self.backend, 'evictions', 0),
+            'size': len(self.backend) if hasattr(self.backend, '__len__') else None,
+        }
+
+
+snapshot_cache = SnapshotCache()
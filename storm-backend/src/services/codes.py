@@ -0,0 +1,142 @@
+"""Collision-free storm codes.
+
+Codes keep the ``STORM-XXXXXX`` format (6 characters of A-Z0-9). Instead
+of drawing random codes and checking each one against the database, every
+code is a position of a shared counter pushed through a keyed bijective
+shuffle of the 36^6 code space:
+
+* the counter lives in the ``sequences`` table and each process reserves
+  a block of ``block_size`` values with a single UPDATE ... RETURNING, so
+  processes never hand out the same value and no lookup is needed per code;
+* a 4-round Feistel network over two base-46656 halves (36^6 = 46656^2)
+  maps each value to a distinct code, so codes never repeat and, without
+  the key, consecutive codes do not reveal each other.
+
+The key comes from ``STORM_CODE_KEY`` or, failing that, a random key
+generated on first use and kept in the ``settings`` table, so every
+deployment shuffles differently; it is never derived from a value in the
+source. Changing it changes the mapping, and codes issued under the old
+key may then collide. Codes from before this allocator were random, so
+a new code can still hit an old one: the insert's primary key catches it
+and the caller simply takes the next code.
+"""
+import hashlib
+import os
+import secrets
+from threading import Lock
+
+from sqlalchemy import insert, select, text, update
+from sqlalchemy.exc import IntegrityError
+
+from src.models.storm import db, Sequence, Setting
+
+ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+CODE_LENGTH = 6
+PREFIX = 'STORM-'
+HALF = len(ALPHABET) ** (CODE_LENGTH // 2)
+SPACE = HALF * HALF
+ROUNDS = 4
+SEQUENCE_NAME = 'storm_code'
+KEY_SETTING = 'storm_code_key'
+
+
+class CodeSpaceExhausted(RuntimeError):
+    pass
+
+
+def _round_value(key, round_index, value):
+    digest = hashlib.blake2b(
+        round_index.to_bytes(1, 'big') + value.to_bytes(4, 'big'), key=key, digest_size=8
+    ).digest()
+    return int.from_bytes(digest, 'big') % HALF
+
+
+def permute(value, key):
+    """Bijection of ``range(SPACE)`` onto itself, keyed by ``key`` (bytes, up to 64)."""
+    left, right = divmod(value, HALF)
+    for round_index in range(ROUNDS):
+        left, right = right, (left + _round_value(key, round_index, right)) % HALF
+    return left * HALF + right
+
+
+def unpermute(value, key):
+    """Inverse of ``permute``."""
+    left, right = divmod(value, HALF)
+    for round_index in reversed(range(ROUNDS)):
+        left, right = (right - _round_value(key, round_index, left)) % HALF, left
+    return left * HALF + right
+
+
+def format_code(value):
+    chars = []
+    for _ in range(CODE_LENGTH):
+        value, digit = divmod(value, len(ALPHABET))
+        chars.append(ALPHABET[digit])
+    return PREFIX + ''.join(reversed(chars))
+
+
+class StormCodeAllocator:
+    def __init__(self, block_size=100):
+        self.block_size = block_size
+        self._next = 0
+        self._end = 0
+        self._key = None
+        self._lock = Lock()
+
+    def _load_key(self):
+        secret = os.environ.get('STORM_CODE_KEY') or self._stored_key()
+        # blake2b keys are at most 64 bytes
+        return hashlib.blake2b(secret.encode(), digest_size=32).digest()
+
+    def _stored_key(self):
+        """The database's random key, generated by the first process that needs it."""
+        with db.engine.connect() as conn:
+            key = conn.execute(select(Setting.value).where(Setting.name == KEY_SETTING)).scalar()
+        if key is not None:
+            return key
+        key = secrets.token_hex(32)
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(insert(Setting).values(name=KEY_SETTING, value=key))
+        except IntegrityError:
+            # Another process stored one first
+            return self._stored_key()
+        return key
+
+    def _reserve_block(self):
+        """Claim the next ``block_size`` counter values, committed on a connection of its own."""
+        try:
+            with db.engine.begin() as conn:
+                end = conn.execute(
+                    update(Sequence)
+                    .where(Sequence.name == SEQUENCE_NAME)
+                    .values(next_value=Sequence.next_value + self.block_size)
+                    .returning(Sequence.next_value)
+                ).scalar()
+                if end is None:
+                    # Database created before the sequence was seeded
+                    conn.execute(text(
+                        'INSERT INTO sequences (name, next_value) VALUES (:name, :value)'
+                    ), {'name': SEQUENCE_NAME, 'value': self.block_size})
+                    end = self.block_size
+        except IntegrityError:
+            # Another process seeded it first
+            return self._reserve_block()
+        if end - self.block_size >= SPACE:
+            raise CodeSpaceExhausted('All storm codes have been issued')
+        return end - self.block_size, min(end, SPACE)
+
+    def allocate(self):
+        """Return a storm code no other call (in any process) has returned."""
+        with self._lock:
+            if self._key is None:
+                self._key = self._load_key()
+            if self._next >= self._end:
+                self._next, self._end = self._reserve_block()
+            value = self._next
+            self._next += 1
+            key = self._key
+        return format_code(permute(value, key))
+
+
+storm_codes = StormCodeAllocator(block_size=int(os.environ.get('STORM_CODE_BLOCK_SIZE', '100')))
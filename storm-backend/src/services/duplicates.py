@@ -0,0 +1,147 @@
+"""Incremental near-duplicate detection for ideas.
+
+Each idea's text (title and description, lower-cased, punctuation
+dropped) is cut into overlapping character shingles and summarised by a
+MinHash signature; the fraction of equal signature positions between two
+ideas estimates the Jaccard similarity of their shingle sets.
+
+Signatures are split into bands, and each band is hashed into an
+``idea_bands`` bucket. When an idea is submitted or edited, only the
+ideas sharing at least one bucket with it are compared (an indexed
+lookup), never the whole storm. With 16 bands of 4 rows, pairs at 0.6
+similarity are found ~90% of the time and pairs under 0.3 rarely
+become candidates at all.
+"""
+import hashlib
+import os
+import random
+import re
+from array import array
+
+from sqlalchemy import and_, delete, insert, or_, select, update
+
+from src.models.storm import db, IdeaBand, IdeaSignature
+
+NUM_HASHES = 64
+BANDS = 16
+ROWS = NUM_HASHES // BANDS
+SHINGLE_SIZE = 4
+MAX_CANDIDATES = 200
+THRESHOLD = float(os.environ.get('DUPLICATE_THRESHOLD', '0.6'))
+
+_PRIME = (1 << 61) - 1
+# Fixed seed: stored signatures must stay comparable across restarts
+_rng = random.Random(0x5707)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_HASHES)]
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def shingles(text):
+    normalized = ' '.join(_WORD.findall(text.lower()))
+    if len(normalized) <= SHINGLE_SIZE:
+        return {normalized}
+    return {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+
+
+def _hash64(value):
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+
+
+def signature(text):
+    hashes = [_hash64(shingle) for shingle in shingles(text)]
+    return [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def band_buckets(sig):
+    """One bucket id per band (63-bit, so it fits a signed BIGINT)."""
+    buckets = []
+    for band in range(BANDS):
+        rows = array('Q', sig[band * ROWS:(band + 1) * ROWS]).tobytes()
+        digest = hashlib.blake2b(rows, digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, 'big') & ((1 << 63) - 1))
+    return buckets
+
+
+def similarity(sig_a, sig_b):
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / NUM_HASHES
+
+
+def _idea_text(title, description):
+    return f'{title or ""} {description or ""}'
+
+
+def find_duplicates(storm_id, idea_id, sig, buckets):
+    """``[(idea id, similarity)]`` above the threshold, most similar first."""
+    candidate_ids = db.session.execute(
+        select(IdeaBand.idea_id).distinct()
+        .where(
+            # storm_id repeated in every term so each one is a primary key lookup
+            or_(*(and_(IdeaBand.storm_id == storm_id, IdeaBand.band == band, IdeaBand.bucket == bucket)
+                  for band, bucket in enumerate(buckets))),
+            IdeaBand.idea_id != idea_id
+        )
+        .limit(MAX_CANDIDATES)
+    ).scalars().all()
+    if not candidate_ids:
+        return []
+
+    matches = []
+    for candidate_id, blob in db.session.execute(
+        select(IdeaSignature.idea_id, IdeaSignature.signature)
+        .where(IdeaSignature.idea_id.in_(candidate_ids))
+    ):
+        score = similarity(sig, array('Q', blob))
+        if score >= THRESHOLD:
+            matches.append((candidate_id, score))
+    matches.sort(key=lambda match: -match[1])
+    return matches
+
+
+def index_idea(idea):
+    """(Re)index one idea and return its near-duplicates. Nothing is committed."""
+    sig = signature(_idea_text(idea.title, idea.description))
+    buckets = band_buckets(sig)
+    matches = find_duplicates(idea.storm_id, idea.id, sig, buckets)
+
+    db.session.execute(delete(IdeaBand).where(IdeaBand.idea_id == idea.id))
+    db.session.execute(delete(IdeaSignature).where(IdeaSignature.idea_id == idea.id))
+    db.session.execute(insert(IdeaSignature), [{
+        'idea_id': idea.id,
+        'storm_id': idea.storm_id,
+        'signature': array('Q', sig).tobytes(),
+        'duplicate_of': matches[0][0] if matches else None,
+        'similarity': matches[0][1] if matches else None,
+    }])
+    db.session.execute(insert(IdeaBand), [
+        {'storm_id': idea.storm_id, 'band': band, 'bucket': bucket, 'idea_id': idea.id}
+        for band, bucket in enumerate(buckets)
+    ])
+    return matches
+
+
+def index_idea_rows(rows):
+    """Index freshly inserted idea rows (dicts) in bulk, without duplicate lookup."""
+    signatures = []
+    bands = []
+    for row in rows:
+        sig = signature(_idea_text(row['title'], row.get('description')))
+        signatures.append({'idea_id': row['id'], 'storm_id': row['storm_id'],
+                           'signature': array('Q', sig).tobytes()})
+        bands.extend(
+            {'storm_id': row['storm_id'], 'band': band, 'bucket': bucket, 'idea_id': row['id']}
+            for band, bucket in enumerate(band_buckets(sig))
+        )
+    if signatures:
+        db.session.execute(insert(IdeaSignature), signatures)
+        db.session.execute(insert(IdeaBand), bands)
+
+
+def forget_idea(idea_id):
+    """Drop an idea's index rows before the idea is deleted. Nothing is committed."""
+    db.session.execute(delete(IdeaBand).where(IdeaBand.idea_id == idea_id))
+    db.session.execute(delete(IdeaSignature).where(IdeaSignature.idea_id == idea_id))
+    db.session.execute(
+        update(IdeaSignature)
+        .where(IdeaSignature.duplicate_of == idea_id)
+        .values(duplicate_of=None, similarity=None)
+    )
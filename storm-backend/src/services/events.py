@@ -0,0 +1,93 @@
+import logging
+import time
+from collections import defaultdict
+from threading import Lock
+
+from src.json_provider import dumps
+
+logger = logging.getLogger(__name__)
+
+# Event types pushed on a storm's channel
+IDEA_CREATED = 'idea_created'
+IDEA_UPDATED = 'idea_updated'
+IDEA_DELETED = 'idea_deleted'
+IDEAS_IMPORTED = 'ideas_imported'
+VOTE_CAST = 'vote_cast'
+PARTICIPANT_JOINED = 'participant_joined'
+PHASE_ADVANCED = 'phase_advanced'
+
+ALL_CHANNELS = '*'
+
+
+class InProcessBackend:
+    """Fans messages out to callbacks registered in this process.
+
+    A backend only has to provide ``publish(channel, message)`` and
+    ``subscribe(channel, callback)`` (returning an unsubscribe callable),
+    with ``message`` an already encoded JSON string, so that a shared
+    backend can carry the same messages between worker processes.
+    """
+
+    def __init__(self):
+        self._subscribers = defaultdict(list)
+        self._lock = Lock()
+
+    def publish(self, channel, message):
+        with self._lock:
+            callbacks = self._subscribers.get(channel, []) + self._subscribers.get(ALL_CHANNELS, [])
+        for callback in callbacks:
+            try:
+                callback(channel, message)
+            except Exception:
+                logger.exception('Event subscriber failed on channel %s', channel)
+
+    def subscribe(self, channel, callback):
+        with self._lock:
+            self._subscribers[channel].append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                callbacks = self._subscribers.get(channel)
+                if callbacks and callback in callbacks:
+                    callbacks.remove(callback)
+                    if not callbacks:
+                        del self._subscribers[channel]
+
+        return unsubscribe
+
+
+class EventBroker:
+    """Per-storm pub/sub channel for small state-change events."""
+
+    def __init__(self, backend=None):
+        self.backend = backend or InProcessBackend()
+
+    def set_backend(self, backend):
+        self.backend = backend
+
+    def publish(self, storm_id, event_type, data):
+        # Encoded once here, whatever the number of subscribers
+        message = dumps({
+            'type': event_type,
+            'stormId': storm_id,
+            'data': data,
+            'ts': time.time()
+        })
+        self.backend.publish(storm_id, message)
+
+    def subscribe(self, storm_id, callback):
+        return self.backend.subscribe(storm_id, callback)
+
+    def subscribe_all(self, callback):
+        return self.backend.subscribe(ALL_CHANNELS, callback)
+
+
+broker = EventBroker()
+
+
+def publish_storm_event(storm_id, event_type, data):
+    """Publish after a successful commit; delivery problems never fail the request."""
+    try:
+        broker.publish(storm_id, event_type, data)
+    except Exception:
+        logger.exception('Failed to publish %s for storm %s', event_type, storm_id)
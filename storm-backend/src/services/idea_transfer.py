@@ -0,0 +1,150 @@
+import csv
+import io
+import json
+import tempfile
+import uuid
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from src.json_provider import dumps
+from src.models.storm import db, Idea, StormArchive, next_revision
+from src.services.duplicates import index_idea_rows
+from src.services.results import result_row_to_dict, results_query
+
+IMPORT_CHUNK_SIZE = 500
+# Validated records beyond this size are spooled to disk
+SPOOL_MEMORY_BYTES = 1024 * 1024
+EXPORT_BATCH_SIZE = 500
+EXPORT_COLUMNS = [
+    'rank', 'ideaId', 'title', 'description', 'authorUsername',
+    'blueScore', 'redScore', 'netScore', 'voteCount',
+]
+
+
+class InvalidImport(ValueError):
+    pass
+
+
+def _ndjson_records(stream):
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise InvalidImport(f'Line {line_number}: invalid JSON')
+        if not isinstance(record, dict):
+            raise InvalidImport(f'Line {line_number}: expected an object')
+        yield line_number, record
+
+
+def _csv_records(stream):
+    reader = csv.DictReader(stream)
+    for record in reader:
+        yield reader.line_num, record
+
+
+def _validated_row(line_number, record):
+    """``(title, description, author username)`` of one record, or InvalidImport."""
+    title = record.get('title')
+    description = record.get('description')
+    author_username = record.get('authorUsername')
+    if title is not None and not isinstance(title, str):
+        raise InvalidImport(f'Line {line_number}: title must be a string')
+    if not (title or '').strip():
+        raise InvalidImport(f'Line {line_number}: title is required')
+    for name, value in (('description', description), ('authorUsername', author_username)):
+        if value is not None and not isinstance(value, str):
+            raise InvalidImport(f'Line {line_number}: {name} must be a string')
+    return title.strip()[:200], description or '', author_username or None
+
+
+def import_ideas(storm, author_id, author_username, raw_stream, fmt):
+    """Insert ideas read from an NDJSON or CSV byte stream.
+
+    Records need a ``title`` and may carry ``description`` and
+    ``authorUsername``. The whole stream is read and validated first,
+    without touching the database, and spooled to a temporary file, so the
+    upload is never held in memory and a malformed record fails the import
+    before anything is written. The ideas are then inserted in executemany
+    chunks, each in a short transaction of its own that bumps the storm
+    revision, so a slow upload never holds the (SQLite) write lock.
+    Commits; returns the number of ideas inserted.
+    """
+    text = io.TextIOWrapper(raw_stream, encoding='utf-8', newline='')
+    records = _csv_records(text) if fmt == 'csv' else _ndjson_records(text)
+    storm_id = storm.id
+
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES) as spool:
+        for line_number, record in records:
+            spool.write(dumps(_validated_row(line_number, record)).encode() + b'\n')
+        spool.seek(0)
+
+        # End the read transaction, so each chunk's write starts from a fresh one
+        db.session.commit()
+        count = 0
+        chunk = []
+        for line in spool:
+            chunk.append(json.loads(line))
+            if len(chunk) >= IMPORT_CHUNK_SIZE:
+                count += _insert_chunk(storm_id, author_id, author_username, chunk)
+                chunk = []
+        if chunk:
+            count += _insert_chunk(storm_id, author_id, author_username, chunk)
+    return count
+
+
+def _insert_chunk(storm_id, author_id, author_username, chunk):
+    revision = next_revision(storm_id)
+    now = datetime.utcnow()
+    rows = [
+        {
+            'id': str(uuid.uuid4()),
+            'title': title,
+            'description': description,
+            'storm_id': storm_id,
+            'author_id': author_id,
+            'author_username': row_author or author_username,
+            'revision': revision,
+            'created_at': now,
+            'updated_at': now,
+        }
+        for title, description, row_author in chunk
+    ]
+    db.session.execute(insert(Idea), rows)
+    index_idea_rows(rows)
+    db.session.commit()
+    return len(rows)
+
+
+def _ranked_rows(storm_id):
+    archive = db.session.get(StormArchive, storm_id)
+    if archive is not None:
+        # Its votes may have been dropped; the final scores are frozen in the archive
+        yield from archive.result_rows()
+        return
+    rows = results_query(storm_id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+    for rank, row in enumerate(rows, start=1):
+        yield result_row_to_dict(row, rank)
+
+
+def export_ideas(storm_id, fmt):
+    """Yield a storm's ideas with their scores, ranked, as NDJSON or CSV text."""
+    rows = _ranked_rows(storm_id)
+
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS, extrasaction='ignore')
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            if buffer.tell() >= 64 * 1024:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    else:
+        for row in rows:
+            yield dumps(row) + '\n'
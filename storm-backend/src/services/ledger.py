@@ -0,0 +1,102 @@
+import click
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from src.models.storm import db, Vote, TokenLedger
+
+
+class InsufficientTokens(Exception):
+    def __init__(self, color):
+        super().__init__(f'Insufficient {color} tokens')
+        self.color = color
+
+
+def open_ledger(storm_id, user_id):
+    """Create an empty ledger row for a new participant (no commit)."""
+    db.session.add(TokenLedger(storm_id=storm_id, user_id=user_id, blue_spent=0, red_spent=0))
+
+
+def _create_ledger_from_votes(storm_id, user_id):
+    """Lazily create a missing ledger row from the participant's votes.
+
+    Only needed for participants that joined before the ledger existed or
+    after a manual cleanup; a concurrent creation of the same row is fine.
+    """
+    blue, red = db.session.query(
+        func.coalesce(func.sum(Vote.blue_tokens), 0),
+        func.coalesce(func.sum(Vote.red_tokens), 0)
+    ).filter(Vote.storm_id == storm_id, Vote.user_id == user_id).one()
+    try:
+        with db.session.begin_nested():
+            db.session.add(TokenLedger(storm_id=storm_id, user_id=user_id, blue_spent=blue, red_spent=red))
+    except IntegrityError:
+        pass
+
+
+def reserve_tokens(storm, user_id, blue_delta, red_delta, _retry=True):
+    """Move a participant's spent tokens by the given deltas within budget.
+
+    The check and the increment are one conditional UPDATE, so two
+    concurrent votes from the same participant cannot both pass the check.
+    Negative deltas release tokens (e.g. from a replaced vote). Raises
+    InsufficientTokens when the budget would be exceeded.
+    """
+    budget = storm.token_budget
+    result = db.session.execute(
+        update(TokenLedger)
+        .where(
+            TokenLedger.storm_id == storm.id,
+            TokenLedger.user_id == user_id,
+            TokenLedger.blue_spent + blue_delta <= budget['maxBlue'],
+            TokenLedger.red_spent + red_delta <= budget['maxRed']
+        )
+        .values(
+            blue_spent=TokenLedger.blue_spent + blue_delta,
+            red_spent=TokenLedger.red_spent + red_delta
+        )
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 1:
+        return
+
+    ledger = db.session.get(TokenLedger, (storm.id, user_id), populate_existing=True)
+    if ledger is None:
+        if not _retry:
+            raise InsufficientTokens('blue' if blue_delta > 0 else 'red')
+        _create_ledger_from_votes(storm.id, user_id)
+        return reserve_tokens(storm, user_id, blue_delta, red_delta, _retry=False)
+
+    if ledger.blue_spent + blue_delta > budget['maxBlue']:
+        raise InsufficientTokens('blue')
+    raise InsufficientTokens('red')
+
+
+def rebuild_ledger(storm_id=None):
+    """Recompute ledger rows from ``votes`` (for one storm, or all). Commits."""
+    delete_query = TokenLedger.query
+    totals = select(
+        Vote.storm_id,
+        Vote.user_id,
+        func.sum(Vote.blue_tokens),
+        func.sum(Vote.red_tokens)
+    ).group_by(Vote.storm_id, Vote.user_id)
+    if storm_id:
+        delete_query = delete_query.filter(TokenLedger.storm_id == storm_id)
+        totals = totals.where(Vote.storm_id == storm_id)
+
+    delete_query.delete(synchronize_session=False)
+    result = db.session.execute(
+        insert(TokenLedger).from_select(
+            ['storm_id', 'user_id', 'blue_spent', 'red_spent'],
+            totals
+        )
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+@click.option('--storm', 'storm_id', default=None, help='Only rebuild this storm')
+def rebuild_ledger_command(storm_id):
+    """Rebuild the token ledger from the votes table."""
+    count = rebuild_ledger(storm_id)
+    click.echo(f'Rebuilt {count} ledger rows')
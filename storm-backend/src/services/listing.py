@@ -0,0 +1,126 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import func, select, tuple_
+
+from src.models.storm import db, Storm, Idea, Vote, StormArchive
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Aggregate subqueries, so counts never load the relationships.
+_idea_count = (
+    select(func.count(Idea.id))
+    .where(Idea.storm_id == Storm.id)
+    .correlate(Storm)
+    .scalar_subquery()
+)
+# Archived storms may have dropped their votes; their count was kept in the archive
+_vote_count = func.coalesce(
+    select(StormArchive.vote_count)
+    .where(StormArchive.storm_id == Storm.id)
+    .correlate(Storm)
+    .scalar_subquery(),
+    select(func.count(Vote.id))
+    .where(Vote.storm_id == Storm.id)
+    .correlate(Storm)
+    .scalar_subquery()
+)
+
+# Public field name -> SQL expression.
+LIST_FIELDS = {
+    'id': Storm.id,
+    'code': Storm.id,
+    'title': Storm.title,
+    'description': Storm.description,
+    'status': Storm.status,
+    'expiresAt': Storm.expires_at,
+    'ideationTimeLimit': Storm.ideation_time_limit,
+    'votingTimeLimit': Storm.voting_time_limit,
+    'moderatorId': Storm.moderator_id,
+    'createdAt': Storm.created_at,
+    'updatedAt': Storm.updated_at,
+    'archivedAt': Storm.archived_at,
+    'ideaCount': _idea_count,
+    'voteCount': _vote_count,
+}
+DEFAULT_FIELDS = ('id', 'code', 'title', 'status', 'createdAt', 'ideaCount', 'voteCount')
+
+
+class InvalidListingRequest(ValueError):
+    pass
+
+
+def parse_fields(raw):
+    if not raw:
+        return list(DEFAULT_FIELDS)
+    fields = [name.strip() for name in raw.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in LIST_FIELDS]
+    if unknown:
+        raise InvalidListingRequest(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def parse_limit(raw):
+    if raw is None or raw == '':
+        return None
+    try:
+        limit = int(raw)
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        raise InvalidListingRequest('limit must be a positive integer')
+    return limit
+
+
+def encode_cursor(created_at, storm_id):
+    raw = json.dumps([created_at.isoformat(), storm_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, storm_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), storm_id
+    except (ValueError, TypeError):
+        raise InvalidListingRequest('Invalid cursor')
+
+
+def list_storm_summaries(status=None, fields=None, limit=None, cursor=None):
+    """Return one page of storms, newest first, keyset-paginated on
+    ``(created_at, id)``."""
+    fields = fields or list(DEFAULT_FIELDS)
+    limit = min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+
+    columns = [LIST_FIELDS[name].label(name) for name in fields]
+    query = db.session.query(
+        Storm.created_at.label('_created_at'),
+        Storm.id.label('_id'),
+        *columns
+    )
+    if status:
+        query = query.filter(Storm.status == status)
+    if cursor:
+        created_at, storm_id = decode_cursor(cursor)
+        query = query.filter(tuple_(Storm.created_at, Storm.id) < tuple_(created_at, storm_id))
+
+    # Fetch one extra row to know whether another page exists.
+    rows = (
+        query.order_by(Storm.created_at.desc(), Storm.id.desc())
+        .limit(limit + 1)
+        .all()
+    )
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last._created_at, last._id)
+
+    return {
+        # Rows go straight to the JSON provider, which encodes the datetimes
+        'storms': [dict(zip(fields, row[2:])) for row in rows],
+        'nextCursor': next_cursor,
+    }
@@ -0,0 +1,538 @@
+"""In-memory engine for storms in the voting phase.
+
+With ``LIVE_VOTING=1``, the first vote on a storm in ``voting`` loads it
+into compact structures: one ``__slots__`` record per vote, and
+``array``-backed token tallies per idea and token spend per participant.
+From then on votes are checked against the budget and applied in memory
+under a per-storm lock, the results ranking is served from the tallies,
+and no vote request touches the database.
+
+Every accepted vote is first appended to a write-behind log (one JSON
+line, flushed to the OS before the vote is acknowledged, fsynced by the
+writer) and then persisted by a background writer that applies queued
+votes in batches every ``LIVE_VOTING_FLUSH_MS``: one transaction per
+batch inserts the votes and tombstones, updates the token ledger, bumps
+each storm's revision and records the last applied log sequence number.
+On start, log entries past that number are replayed, so votes
+acknowledged before a crash are not lost and none is applied twice.
+
+The snapshot and changes endpoints read the database: while a storm has
+votes not persisted yet they first wait for the writer (``sync``), which
+takes at most one flush interval, so they never serve a revision older
+than an acknowledged vote. Leaving the voting phase (moderator or
+scheduler) first closes the storm, refusing further votes, and drains its
+queued votes; it is unloaded once the new phase is committed.
+
+The engine owns its storms' votes, so it needs a single worker process:
+it refuses to start when the shared state is networked (several workers),
+and holds an exclusive lock on the log so that no other process (a
+second server, a ``flask storm`` command) replays or truncates it. Only
+the server entry points start it (see ``main.start_background_services``).
+"""
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from array import array
+from collections import defaultdict
+from datetime import datetime
+from threading import Condition, Lock, Thread
+
+from sqlalchemy import bindparam, delete, insert, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
+
+from src.models.storm import db, Idea, Sequence, Storm, TokenLedger, Tombstone, Vote, next_revision
+from src.services.cache import snapshot_cache
+from src.services.ledger import InsufficientTokens
+from src.services.shared_state import shared_state
+from src.services.voting import VoteError
+
+logger = logging.getLogger(__name__)
+
+LOG_SEQUENCE = 'live_vote_log'
+MAX_BATCH = 5000
+# The log is emptied once everything in it is persisted and it is this big
+ROTATE_BYTES = 1024 * 1024
+RETRY_DELAY = 1.0
+
+
+def default_log_path(database_uri, directory):
+    """The log of a database: next to a SQLite file, else one per URL in ``directory``."""
+    url = make_url(database_uri)
+    if url.get_backend_name() == 'sqlite' and url.database and url.database != ':memory:' \
+            and not url.database.startswith('file:'):
+        return url.database + '-live-votes.log'
+    digest = hashlib.sha1(database_uri.encode()).hexdigest()[:12]
+    return os.path.join(directory, f'live-votes-{digest}.log')
+
+
+class LiveStormClosed(Exception):
+    """The storm left the voting phase while the vote was waiting."""
+
+
+class LiveVote:
+    __slots__ = ('id', 'idea', 'user', 'blue', 'red', 'comment', 'created_at')
+
+    def __init__(self, id, idea, user, blue, red, comment, created_at):
+        self.id = id
+        self.idea = idea
+        self.user = user
+        self.blue = blue
+        self.red = red
+        self.comment = comment
+        self.created_at = created_at
+
+
+class LiveStorm:
+    """One storm's votes and tallies; ideas and participants are array indexes."""
+
+    __slots__ = ('id', 'max_blue', 'max_red', 'ideas', 'idea_index', 'blue', 'red', 'vote_count',
+                 'users', 'user_ids', 'blue_spent', 'red_spent', 'votes', 'lock', 'closed', 'last_seq')
+
+    def __init__(self, storm_id, budget, ideas):
+        self.id = storm_id
+        self.max_blue = budget['maxBlue']
+        self.max_red = budget['maxRed']
+        # (id, title, description, author id, author username), in ranking tie-break order
+        self.ideas = ideas
+        self.idea_index = {idea[0]: i for i, idea in enumerate(ideas)}
+        self.blue = array('q', bytes(8 * len(ideas)))
+        self.red = array('q', bytes(8 * len(ideas)))
+        self.vote_count = array('q', bytes(8 * len(ideas)))
+        self.users = {}
+        self.user_ids = []
+        self.blue_spent = array('q')
+        self.red_spent = array('q')
+        self.votes = {}  # (user index, idea index) -> LiveVote
+        self.lock = Lock()
+        self.closed = False
+        self.last_seq = 0  # log sequence number of the last vote accepted
+
+    def _user(self, user_id):
+        index = self.users.get(user_id)
+        if index is None:
+            index = self.users[user_id] = len(self.user_ids)
+            self.user_ids.append(user_id)
+            self.blue_spent.append(0)
+            self.red_spent.append(0)
+        return index
+
+    def _add(self, vote, sign):
+        self.blue[vote.idea] += sign * vote.blue
+        self.red[vote.idea] += sign * vote.red
+        self.vote_count[vote.idea] += sign
+        self.blue_spent[vote.user] += sign * vote.blue
+        self.red_spent[vote.user] += sign * vote.red
+
+    def _vote_dict(self, vote):
+        return {
+            'id': vote.id,
+            'ideaId': self.ideas[vote.idea][0],
+            'userId': self.user_ids[vote.user],
+            'blueTokens': vote.blue,
+            'redTokens': vote.red,
+            'comment': vote.comment,
+            'createdAt': vote.created_at,
+        }
+
+    def cast_votes(self, engine, user_id, allocations):
+        """Same contract as ``voting.cast_votes``, against memory; queued for persistence."""
+        idea_ids = [allocation['idea_id'] for allocation in allocations]
+        if len(set(idea_ids)) != len(idea_ids):
+            raise VoteError('Each idea can only be voted on once per request')
+
+        with self.lock:
+            if self.closed:
+                raise LiveStormClosed()
+            missing = [idea_id for idea_id in idea_ids if idea_id not in self.idea_index]
+            if missing:
+                raise VoteError(f"Unknown ideas for this storm: {', '.join(missing)}")
+            user = self._user(user_id)
+            existing = [vote for vote in (self.votes.get((user, self.idea_index[idea_id])) for idea_id in idea_ids)
+                        if vote is not None]
+            blue_delta = sum(a['blue_tokens'] for a in allocations) - sum(v.blue for v in existing)
+            red_delta = sum(a['red_tokens'] for a in allocations) - sum(v.red for v in existing)
+            if self.blue_spent[user] + blue_delta > self.max_blue:
+                raise InsufficientTokens('blue')
+            if self.red_spent[user] + red_delta > self.max_red:
+                raise InsufficientTokens('red')
+
+            now = datetime.utcnow()
+            votes = [
+                LiveVote(str(uuid.uuid4()), self.idea_index[a['idea_id']], user,
+                         a['blue_tokens'], a['red_tokens'], a['comment'], now)
+                for a in allocations
+            ]
+            replaced = {self.ideas[vote.idea][0]: vote.id for vote in existing}
+            # Logged before memory changes, and in the same order as them
+            self.last_seq = engine.append({
+                'storm': self.id,
+                'user': user_id,
+                'votes': [[v.id, self.ideas[v.idea][0], v.blue, v.red, v.comment, now.isoformat()]
+                          for v in votes],
+                'replaced': list(replaced.values()),
+                'blue': blue_delta,
+                'red': red_delta,
+            })
+            for vote in existing:
+                self._add(vote, -1)
+            for vote in votes:
+                self._add(vote, 1)
+                self.votes[(user, vote.idea)] = vote
+        return [self._vote_dict(vote) for vote in votes], replaced
+
+    def result_rows(self):
+        """Ranked rows shaped like ``results.result_row_to_dict``."""
+        with self.lock:
+            blue, red, count = list(self.blue), list(self.red), list(self.vote_count)
+        order = sorted(range(len(self.ideas)), key=lambda i: (red[i] - blue[i], i))
+        return [
+            {
+                'ideaId': self.ideas[i][0],
+                'title': self.ideas[i][1],
+                'description': self.ideas[i][2],
+                'authorId': self.ideas[i][3],
+                'authorUsername': self.ideas[i][4],
+                'blueScore': blue[i],
+                'redScore': red[i],
+                'netScore': blue[i] - red[i],
+                'voteCount': count[i],
+                'rank': rank,
+            }
+            for rank, i in enumerate(order, start=1)
+        ]
+
+
+def load_live_storm(storm_id):
+    """Load a storm in the voting phase from the database, or None if it is not voting."""
+    storm = db.session.get(Storm, storm_id)
+    if storm is None or storm.status != 'voting':
+        return None
+    ideas = db.session.execute(
+        select(Idea.id, Idea.title, Idea.description, Idea.author_id, Idea.author_username)
+        .where(Idea.storm_id == storm_id)
+        .order_by(Idea.created_at, Idea.id)
+    ).all()
+    live = LiveStorm(storm_id, storm.token_budget, [tuple(idea) for idea in ideas])
+    for vote_id, idea_id, user_id, blue, red, comment, created_at in db.session.execute(
+        select(Vote.id, Vote.idea_id, Vote.user_id, Vote.blue_tokens, Vote.red_tokens,
+               Vote.comment, Vote.created_at)
+        .where(Vote.storm_id == storm_id)
+    ):
+        vote = LiveVote(vote_id, live.idea_index[idea_id], live._user(user_id),
+                        blue or 0, red or 0, comment, created_at)
+        live._add(vote, 1)
+        live.votes[(vote.user, vote.idea)] = vote
+    return live
+
+
+def apply_log_entries(entries):
+    """Persist queued votes in the current session and commit. One transaction.
+
+    Returns the ids of the storms whose votes changed.
+    """
+    inserted = {}
+    deleted = []
+    tombstones = defaultdict(list)
+    ledger = defaultdict(lambda: [0, 0])
+    for entry in entries:
+        for vote_id in entry['replaced']:
+            # A vote replaced within the same batch never reaches the table
+            if inserted.pop(vote_id, None) is None:
+                deleted.append(vote_id)
+            tombstones[entry['storm']].append(vote_id)
+        for vote_id, idea_id, blue, red, comment, created_at in entry['votes']:
+            inserted[vote_id] = {
+                'id': vote_id, 'idea_id': idea_id, 'storm_id': entry['storm'], 'user_id': entry['user'],
+                'blue_tokens': blue, 'red_tokens': red, 'comment': comment,
+                'created_at': datetime.fromisoformat(created_at),
+            }
+        totals = ledger[(entry['storm'], entry['user'])]
+        totals[0] += entry['blue']
+        totals[1] += entry['red']
+
+    revisions = {storm_id: next_revision(storm_id) for storm_id in {entry['storm'] for entry in entries}}
+    if tombstones:
+        db.session.execute(insert(Tombstone), [
+            {'storm_id': storm_id, 'entity': 'vote', 'entity_id': vote_id, 'revision': revisions[storm_id]}
+            for storm_id, vote_ids in tombstones.items() for vote_id in vote_ids
+        ])
+    if deleted:
+        db.session.execute(delete(Vote).where(Vote.id.in_(deleted)),
+                           execution_options={'synchronize_session': False})
+    if inserted:
+        db.session.execute(insert(Vote), [
+            dict(row, revision=revisions[row['storm_id']]) for row in inserted.values()
+        ])
+    ledger_table = TokenLedger.__table__
+    db.session.execute(
+        ledger_table.update()
+        .where(ledger_table.c.storm_id == bindparam('l_storm'), ledger_table.c.user_id == bindparam('l_user'))
+        .values(blue_spent=ledger_table.c.blue_spent + bindparam('l_blue'),
+                red_spent=ledger_table.c.red_spent + bindparam('l_red')),
+        [{'l_storm': storm_id, 'l_user': user_id, 'l_blue': blue, 'l_red': red}
+         for (storm_id, user_id), (blue, red) in ledger.items()]
+    )
+
+    _record_applied(entries[-1]['seq'])
+    db.session.commit()
+    for storm_id in revisions:
+        snapshot_cache.invalidate(storm_id)
+    return list(revisions)
+
+
+def _record_applied(seq):
+    sequence = db.session.get(Sequence, LOG_SEQUENCE)
+    if sequence is None:
+        db.session.add(Sequence(name=LOG_SEQUENCE, next_value=seq))
+    else:
+        sequence.next_value = seq
+
+
+def read_log(path, after):
+    """Entries of the log at ``path`` with a sequence number above ``after``."""
+    entries = []
+    if not os.path.exists(path):
+        return entries
+    with open(path, 'rb') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Only the last line can be torn, by a crash in the middle of a write
+                logger.warning('Skipping an incomplete write-behind log line')
+                continue
+            if entry['seq'] > after:
+                entries.append(entry)
+    return entries
+
+
+class LiveEngine:
+    def __init__(self):
+        self.enabled = False
+        self.log_path = None
+        self.flush_interval = 0.05
+        self._storms = {}
+        self._load_lock = Lock()
+        self._cond = Condition()  # guards the log, _pending, _seq and _applied
+        self._log = None
+        self._pending = []
+        self._seq = 0
+        self._applied = 0
+        self._stopping = False
+        self._thread = None
+        self._app = None
+        self._persisted_hooks = []
+
+    def configure(self, database_uri, log_dir, environ=None):
+        environ = os.environ if environ is None else environ
+        self.enabled = environ.get('LIVE_VOTING', '0') == '1'
+        self.log_path = environ.get('LIVE_VOTING_LOG') or default_log_path(database_uri, log_dir)
+        self.flush_interval = int(environ.get('LIVE_VOTING_FLUSH_MS', '50')) / 1000
+
+    @property
+    def running(self):
+        """Votes go through the engine: it is enabled and started."""
+        return self._thread is not None
+
+    def start(self, app):
+        """Lock and replay the log, then start the writer. Call with the engine configured."""
+        if not self.enabled or self._thread is not None:
+            return
+        if shared_state.distributed:
+            logger.warning('LIVE_VOTING needs a single worker; disabled with a networked shared state')
+            self.enabled = False
+            return
+        log = open(self.log_path, 'ab')
+        try:
+            fcntl.flock(log.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            log.close()
+            raise RuntimeError(f'{self.log_path} is locked by another process; '
+                               'LIVE_VOTING needs a single server process')
+        self._log = log
+        self._app = app
+        try:
+            with app.app_context():
+                self.recover()
+        except Exception:
+            self._log = None
+            log.close()
+            raise
+        self._stopping = False
+        self._thread = Thread(target=self._run, name='live-vote-writer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Persist everything queued and stop the writer."""
+        if self._thread is None:
+            return
+        self.flush()
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._thread = None
+        self._log.close()
+        self._storms.clear()
+
+    def on_persisted(self, fn):
+        """Register ``fn(storm_id)`` to run after queued votes of a storm reach the database."""
+        self._persisted_hooks.append(fn)
+        return fn
+
+    def _persist(self, entries):
+        try:
+            storm_ids = apply_log_entries(entries)
+        except IntegrityError:
+            # Retrying cannot help: find the conflicting entries and drop them
+            db.session.rollback()
+            if len(entries) == 1:
+                logger.error('Dropping write-behind log entry %d (storm %s, user %s): it conflicts with the database',
+                             entries[0]['seq'], entries[0]['storm'], entries[0]['user'], exc_info=True)
+                _record_applied(entries[0]['seq'])
+                db.session.commit()
+                return
+            storm_ids = None
+        if storm_ids is None:
+            logger.warning('%d queued votes conflict with the database; persisting them one by one', len(entries))
+            for entry in entries:
+                self._persist([entry])
+            return
+        for storm_id in storm_ids:
+            for hook in self._persisted_hooks:
+                hook(storm_id)
+
+    def recover(self):
+        sequence = db.session.get(Sequence, LOG_SEQUENCE)
+        applied = sequence.next_value if sequence is not None else 0
+        entries = read_log(self.log_path, applied)
+        for start in range(0, len(entries), MAX_BATCH):
+            self._persist(entries[start:start + MAX_BATCH])
+        if entries:
+            logger.info('Replayed %d votes from the write-behind log', len(entries))
+            applied = entries[-1]['seq']
+        self._seq = self._applied = applied
+        # Everything in it is in the database now
+        self._log.truncate(0)
+
+    def storm(self, storm_id):
+        """The loaded storm, loading it if it is in the voting phase; None otherwise.
+
+        A storm being closed is returned closed until ``release_storm``, so
+        votes arriving while its phase change commits are refused instead
+        of loading it again from the database, which still says ``voting``.
+        """
+        live = self._storms.get(storm_id)
+        if live is not None:
+            return live
+        with self._load_lock:
+            live = self._storms.get(storm_id)
+            if live is None:
+                live = load_live_storm(storm_id)
+                # Release the read transaction; the request may go on without the database
+                db.session.rollback()
+                if live is not None:
+                    self._storms[storm_id] = live
+        return live
+
+    def close_storm(self, storm_id):
+        """Stop taking votes for a storm leaving the voting phase and persist its queue.
+
+        The caller changes the phase, commits or rolls back, then calls
+        ``release_storm``.
+        """
+        if not self.running:
+            return
+        with self._load_lock:
+            live = self._storms.get(storm_id)
+            if live is None:
+                # Not loaded yet: leave a closed placeholder so it is not loaded meanwhile
+                live = self._storms[storm_id] = LiveStorm(storm_id, {'maxBlue': 0, 'maxRed': 0}, [])
+        with live.lock:
+            live.closed = True
+        self.flush()
+
+    def release_storm(self, storm_id):
+        """Forget a closed storm once its phase change is committed or rolled back."""
+        with self._load_lock:
+            live = self._storms.get(storm_id)
+            if live is not None and live.closed:
+                del self._storms[storm_id]
+
+    def append(self, entry):
+        with self._cond:
+            self._seq += 1
+            entry['seq'] = self._seq
+            self._log.write(json.dumps(entry, separators=(',', ':')).encode() + b'\n')
+            self._log.flush()
+            self._pending.append(entry)
+            return self._seq
+
+    def flush(self, timeout=30):
+        """Wait until every vote accepted so far is in the database."""
+        return self._wait_applied(None, timeout)
+
+    def sync(self, storm_id, timeout=5):
+        """Wait until the votes accepted for a storm are in the database.
+
+        Readers of the database (snapshot, changes) call this first, so they
+        never answer from before a vote that was already acknowledged.
+        """
+        live = self._storms.get(storm_id)
+        if live is None:
+            return True
+        return self._wait_applied(live.last_seq, timeout)
+
+    def _wait_applied(self, target, timeout):
+        if self._thread is None:
+            return True
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            target = self._seq if target is None else target
+            if self._applied >= target:
+                return True
+            self._cond.notify_all()
+            while self._applied < target:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._pending:
+                    if self._stopping:
+                        return
+                    self._cond.wait(self.flush_interval)
+                batch = self._pending[:MAX_BATCH]
+            if not batch:
+                continue
+            try:
+                os.fsync(self._log.fileno())
+                with self._app.app_context():
+                    self._persist(batch)
+            except Exception:
+                logger.exception('Failed to persist %d votes, retrying', len(batch))
+                with self._app.app_context():
+                    db.session.rollback()
+                time.sleep(RETRY_DELAY)
+                continue
+            with self._cond:
+                del self._pending[:len(batch)]
+                self._applied = batch[-1]['seq']
+                self._cond.notify_all()
+                if not self._pending and self._log.tell() > ROTATE_BYTES:
+                    self._log.truncate(0)
+                    self._log.seek(0)
+            # Let votes accumulate into the next batch
+            time.sleep(self.flush_interval)
+
+
+live_engine = LiveEngine()
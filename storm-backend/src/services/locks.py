@@ -0,0 +1,77 @@
+"""Per-storm write serialization.
+
+Vote writes read the participant's current votes, work out the token
+deltas and then write; ``storm_write_lock`` makes that sequence exclusive
+per storm while writes to different storms still run in parallel:
+
+* on PostgreSQL it takes a row lock on the storm (``SELECT ... FOR
+  UPDATE``), held until the caller's transaction commits or rolls back,
+  so it also covers other worker processes;
+* on SQLite with a network shared state (several workers), it takes the
+  storm's lock on the state server, which covers every worker;
+* otherwise, on SQLite, which has a single database-wide write lock anyway,
+  it takes one of a fixed set of in-process locks picked by hashing the
+  storm id. That keeps concurrent requests of a worker from failing on
+  each other's write lock and orders them fairly; across processes the
+  token ledger's conditional UPDATE and the unique vote index remain the
+  guard.
+
+Take the lock before the transaction writes anything and commit inside
+the ``with`` block, so the change is visible before the lock is released.
+"""
+import time
+import zlib
+from contextlib import contextmanager
+from threading import RLock
+
+from sqlalchemy import select
+
+from src.models.storm import db, Storm
+from src.services.metrics import Histogram, registry
+from src.services.shared_state import LockTimeout, shared_state
+
+STRIPES = 256
+# Lease on a shared lock; a write transaction is far shorter
+SHARED_LOCK_TTL = 30
+_stripes = [RLock() for _ in range(STRIPES)]
+
+lock_wait = registry.register(Histogram(
+    'storm_write_lock_wait_seconds', 'Time spent waiting for a storm write lock'))
+
+
+@contextmanager
+def storm_write_lock(storm_id):
+    start = time.perf_counter()
+    if db.session.get_bind().dialect.name == 'postgresql':
+        db.session.execute(select(Storm.id).where(Storm.id == storm_id).with_for_update())
+        lock_wait.observe(time.perf_counter() - start)
+        yield
+        return
+
+    if shared_state.distributed:
+        name = f'storm-write:{storm_id}'
+        token = shared_state.acquire(name, ttl=SHARED_LOCK_TTL, wait=0)
+        if token is None:
+            db.session.rollback()
+            token = shared_state.acquire(name, ttl=SHARED_LOCK_TTL, wait=SHARED_LOCK_TTL)
+            if token is None:
+                raise LockTimeout(f'Timed out waiting for the write lock of storm {storm_id}')
+        try:
+            lock_wait.observe(time.perf_counter() - start)
+            yield
+        finally:
+            shared_state.release(name, token)
+        return
+
+    lock = _stripes[zlib.crc32(storm_id.encode()) % STRIPES]
+    if not lock.acquire(blocking=False):
+        # End the (read-only) transaction before waiting, so a queued
+        # request does not pin a pooled connection, and the reads under
+        # the lock see the previous writer's commit.
+        db.session.rollback()
+        lock.acquire()
+    try:
+        lock_wait.observe(time.perf_counter() - start)
+        yield
+    finally:
+        lock.release()
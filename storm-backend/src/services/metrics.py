@@ -0,0 +1,216 @@
+"""Request, SQL and cache metrics in Prometheus text format.
+
+Metrics are plain in-process counters, gauges and fixed-bucket
+histograms: an observation is a bisect and two additions under a lock,
+cheap enough to leave on in production. Anything that only grows is a
+``counter`` named ``*_total``, so ``rate()`` copes with worker restarts.
+With several gunicorn workers each process reports its own numbers;
+scrape every worker (or aggregate upstream).
+"""
+import logging
+import time
+from bisect import bisect_left
+from threading import Lock
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger('storm.slow_query')
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 250, 1000)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in zip(names, values)
+    )
+    return '{' + pairs + '}'
+
+
+class Counter:
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = list(self._values.items())
+        for label_values, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labels, label_values)} {value}')
+        return lines
+
+
+class Gauge:
+    """Value read from a callback at scrape time."""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, read):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+
+    def expose(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}',
+                f'{self.name} {self.read()}']
+
+
+class CounterFunc(Gauge):
+    """Monotonic total kept elsewhere (e.g. cache stats), read at scrape time."""
+
+    kind = 'counter'
+
+
+class Histogram:
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # per-bucket counts (last slot is +Inf), then sum
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        for label_values, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                labels = _format_labels(self.labels + ('le',), label_values + (bound,))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f'{self.name}_sum{labels} {total}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def expose(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.expose())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+requests_total = registry.register(Counter(
+    'storm_http_requests_total', 'HTTP requests by route', labels=('method', 'route', 'status')))
+request_duration = registry.register(Histogram(
+    'storm_http_request_duration_seconds', 'HTTP request duration by route',
+    labels=('method', 'route', 'status')))
+request_queries = registry.register(Histogram(
+    'storm_http_request_sql_queries', 'SQL statements executed per request',
+    labels=('route',), buckets=COUNT_BUCKETS))
+request_sql_time = registry.register(Histogram(
+    'storm_http_request_sql_seconds', 'Time spent in SQL per request',
+    labels=('route',)))
+query_duration = registry.register(Histogram(
+    'storm_sql_query_duration_seconds', 'SQL statement duration', labels=('operation',)))
+slow_queries = registry.register(Counter(
+    'storm_sql_slow_queries_total', 'SQL statements slower than the slow-query threshold',
+    labels=('operation',)))
+
+_settings = {'slow_query_seconds': 0.2}
+
+
+def _param_shape(parameters, executemany):
+    """Types of the bound parameters, never their values."""
+    def shape(params):
+        if isinstance(params, dict):
+            return '{' + ', '.join(f'{key}: {type(value).__name__}' for key, value in params.items()) + '}'
+        return '(' + ', '.join(type(value).__name__ for value in params) + ')'
+
+    if executemany and parameters:
+        return f'{len(parameters)} x {shape(parameters[0])}'
+    return shape(parameters or ())
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the statement's execution context, not the connection: a
+    # statement that fails never reaches after_cursor_execute, and its
+    # start time goes away with the context
+    if context is not None:
+        context.storm_query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, 'storm_query_start', None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    operation = statement.lstrip()[:6].upper()
+    query_duration.observe(elapsed, operation)
+
+    if has_request_context():
+        g.storm_sql_count = g.get('storm_sql_count', 0) + 1
+        g.storm_sql_seconds = g.get('storm_sql_seconds', 0.0) + elapsed
+
+    if elapsed >= _settings['slow_query_seconds']:
+        slow_queries.inc(operation)
+        slow_query_logger.warning(
+            'Slow query (%.1f ms) on %s: %s params=%s',
+            elapsed * 1000,
+            request.endpoint if has_request_context() else '-',
+            ' '.join(statement.split()),
+            _param_shape(parameters, executemany)
+        )
+
+
+def _start_timer():
+    g.storm_request_start = time.perf_counter()
+
+
+def _record_request(response):
+    start = g.pop('storm_request_start', None)
+    if start is None:
+        return response
+    route = request.endpoint or 'unmatched'
+    requests_total.inc(request.method, route, response.status_code)
+    request_duration.observe(time.perf_counter() - start, request.method, route, response.status_code)
+    request_queries.observe(g.get('storm_sql_count', 0), route)
+    request_sql_time.observe(g.get('storm_sql_seconds', 0.0), route)
+    return response
+
+
+def init_metrics(app, slow_query_ms=200):
+    """Time every request and SQL statement of the app."""
+    _settings['slow_query_seconds'] = slow_query_ms / 1000
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
@@ -0,0 +1,208 @@
+"""Phase transitions and the auto-advance scheduler.
+
+A storm's ``expires_at`` is the deadline of its current phase, set when
+the phase starts from ``ideation_time_limit``/``voting_time_limit``
+(minutes; no limit means no deadline). Every transition is a
+compare-and-set UPDATE on (status, expires_at), so a moderator and any
+number of scheduler threads, in any number of workers, can race on the
+same storm and exactly one of them advances it.
+
+The scheduler keeps a heap of upcoming deadlines instead of scanning the
+storms table. It is filled from the database on start and then every
+``refill_interval`` seconds with the deadlines falling in the next two
+intervals (an index range read on ``expires_at``), which also picks up
+deadlines set by other workers; deadlines set in this worker are pushed
+directly by ``schedule``.
+"""
+import heapq
+import logging
+import time
+from datetime import datetime, timedelta
+from threading import Condition, Thread
+
+from sqlalchemy import select, update
+
+from src.models.storm import db, Storm
+from src.services import events
+from src.services.cache import snapshot_cache
+from src.services.events import publish_storm_event
+from src.services.live import live_engine
+
+logger = logging.getLogger(__name__)
+
+NEXT_STATUS = {'ideation': 'voting', 'voting': 'results'}
+RETRY_DELAY = timedelta(seconds=5)
+_ANY_DEADLINE = object()
+
+
+def phase_deadline(status, ideation_time_limit, voting_time_limit, start):
+    """Deadline of a phase starting at ``start``, or None when it is not time-limited."""
+    minutes = {'ideation': ideation_time_limit, 'voting': voting_time_limit}.get(status)
+    return start + timedelta(minutes=minutes) if minutes else None
+
+
+def advance_storm_phase(storm_id, from_status, deadline=_ANY_DEADLINE):
+    """Move a storm from ``from_status`` to the next phase and bump its revision.
+
+    Only applies if the storm is still in ``from_status`` (and, when
+    ``deadline`` is given, still has that deadline). Returns the new
+    ``(status, expires_at, updated_at)``, or None if someone else got
+    there first. The caller commits (or rolls back), then calls
+    ``live_engine.release_storm``.
+    """
+    to_status = NEXT_STATUS.get(from_status)
+    if to_status is None:
+        return None
+    if from_status == 'voting':
+        # Votes still queued in memory must be in before the results are
+        live_engine.close_storm(storm_id)
+    limits = db.session.execute(
+        select(Storm.ideation_time_limit, Storm.voting_time_limit).where(Storm.id == storm_id)
+    ).first()
+    if limits is None:
+        return None
+
+    now = datetime.utcnow()
+    stmt = update(Storm).where(Storm.id == storm_id, Storm.status == from_status)
+    if deadline is not _ANY_DEADLINE:
+        stmt = stmt.where(Storm.expires_at == deadline)
+    return db.session.execute(
+        stmt.values(
+            status=to_status,
+            expires_at=phase_deadline(to_status, *limits, now),
+            updated_at=now,
+            revision=Storm.revision + 1
+        )
+        .returning(Storm.status, Storm.expires_at, Storm.updated_at)
+        .execution_options(synchronize_session=False)
+    ).first()
+
+
+def phase_advanced_event(storm_id, status, expires_at, updated_at):
+    """Drop the cached snapshot and notify subscribers of a committed transition."""
+    snapshot_cache.invalidate(storm_id)
+    publish_storm_event(storm_id, events.PHASE_ADVANCED, {
+        'status': status,
+        'expiresAt': expires_at,
+        'updatedAt': updated_at
+    })
+
+
+class PhaseScheduler:
+    """Background thread advancing storms whose phase deadline has passed."""
+
+    def __init__(self, refill_interval=30):
+        self.refill_interval = refill_interval
+        self._heap = []  # (fire at, storm id, status, deadline)
+        self._armed = {}  # storm id -> (status, deadline); heap entries not matching are stale
+        self._cond = Condition()
+        self._thread = None
+        self._stopping = False
+        self._app = None
+
+    def start(self, app):
+        self._app = app
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._stopping = False
+            self._thread = Thread(target=self._run, name='phase-scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout)
+
+    def schedule(self, storm_id, status, deadline):
+        """Arm (or re-arm, or disarm) the timer of a storm's current phase."""
+        with self._cond:
+            if deadline is None or status not in NEXT_STATUS:
+                self._armed.pop(storm_id, None)
+                return
+            if self._armed.get(storm_id) == (status, deadline):
+                return
+            self._armed[storm_id] = (status, deadline)
+            self._push(deadline, storm_id, status, deadline)
+
+    def __len__(self):
+        return len(self._armed)
+
+    def _push(self, fire_at, storm_id, status, deadline):
+        entry = (fire_at, storm_id, status, deadline)
+        heapq.heappush(self._heap, entry)
+        if self._heap[0] is entry:
+            self._cond.notify()
+
+    def _refill(self):
+        horizon = datetime.utcnow() + timedelta(seconds=2 * self.refill_interval)
+        rows = db.session.execute(
+            select(Storm.id, Storm.status, Storm.expires_at)
+            .where(Storm.expires_at <= horizon, Storm.status.in_(NEXT_STATUS))
+        ).all()
+        db.session.rollback()
+        for storm_id, status, deadline in rows:
+            self.schedule(storm_id, status, deadline)
+
+    def _pop_due(self):
+        now = datetime.utcnow()
+        due = []
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now:
+                _, storm_id, status, deadline = heapq.heappop(self._heap)
+                if self._armed.get(storm_id) == (status, deadline):
+                    del self._armed[storm_id]
+                    due.append((storm_id, status, deadline))
+        return due
+
+    def _fire(self, storm_id, status, deadline):
+        try:
+            advanced = advance_storm_phase(storm_id, status, deadline)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            live_engine.release_storm(storm_id)
+            logger.exception('Auto-advance of storm %s failed; retrying', storm_id)
+            with self._cond:
+                if storm_id not in self._armed:
+                    self._armed[storm_id] = (status, deadline)
+                    self._push(datetime.utcnow() + RETRY_DELAY, storm_id, status, deadline)
+            return
+        live_engine.release_storm(storm_id)
+        if advanced is None:
+            return  # advanced by a moderator or another worker
+        phase_advanced_event(storm_id, *advanced)
+        self.schedule(storm_id, advanced.status, advanced.expires_at)
+
+    def _run(self):
+        next_refill = 0
+        while True:
+            if time.monotonic() >= next_refill:
+                with self._app.app_context():
+                    try:
+                        self._refill()
+                    except Exception:
+                        logger.exception('Loading phase deadlines failed')
+                next_refill = time.monotonic() + self.refill_interval
+
+            due = self._pop_due()
+            if due:
+                with self._app.app_context():
+                    for storm_id, status, deadline in due:
+                        self._fire(storm_id, status, deadline)
+
+            with self._cond:
+                if self._stopping:
+                    return
+                timeout = next_refill - time.monotonic()
+                if self._heap:
+                    until_next = (self._heap[0][0] - datetime.utcnow()).total_seconds()
+                    timeout = min(timeout, until_next)
+                if timeout > 0:
+                    self._cond.wait(timeout)
+
+
+phase_scheduler = PhaseScheduler()
@@ -0,0 +1,172 @@
+"""Rate limiting and admission control for the storm write endpoints.
+
+Each limited endpoint belongs to a rule (``join``, ``idea``, ``vote``,
+``advance``). A rule has two token buckets: one per client (the caller's
+session or, before a client has joined, its remote address together with
+the storm) and one per storm, so neither a single client nor a single
+busy room can monopolise the workers. A whole classroom or office often
+joins from one address (NAT, proxy), so the pre-join client bucket is
+sized like the storm's: a room joining at once is only limited per
+storm. A request that finds either bucket empty gets ``429`` with a
+``Retry-After`` header.
+
+Independently, when more than ``max_in_flight`` limited requests are
+already being processed by this worker, new ones are shed with ``429``
+straight away instead of queueing behind the database.
+
+Buckets live in a store; the default keeps them in process memory.
+A shared store (``set_store``) only needs
+``take(key, rate, capacity) -> (allowed, retry_after_seconds)``.
+
+Limits are ``rate/burst`` pairs (tokens per second / bucket size), set
+with ``RATE_LIMIT_<RULE>_<SCOPE>`` environment variables, e.g.
+``RATE_LIMIT_JOIN_STORM=5/50``. ``RATE_LIMIT_ENABLED=0`` turns it off.
+"""
+import functools
+import math
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from flask import jsonify, request
+
+from src.services.auth import current_principal
+from src.services.metrics import Counter, Gauge, registry
+
+DEFAULT_LIMITS = {
+    # rule: {scope: (tokens per second, burst)}
+    'join': {'client': (5, 50), 'storm': (5, 50)},
+    'idea': {'client': (1, 10), 'storm': (20, 100)},
+    'vote': {'client': (5, 20), 'storm': (100, 300)},
+    'advance': {'client': (0.2, 3), 'storm': (0.5, 3)},
+}
+DEFAULT_MAX_IN_FLIGHT = 64
+
+
+class MemoryStore:
+    """Token buckets in process memory, least recently used dropped past ``maxsize``."""
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = Lock()
+
+    def take(self, key, rate, capacity):
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - last) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                retry_after = 0
+            else:
+                retry_after = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return retry_after == 0, retry_after
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+def parse_limit(raw):
+    rate, burst = raw.split('/')
+    return float(rate), int(burst)
+
+
+class RateLimiter:
+    def __init__(self, store=None, limits=None, max_in_flight=DEFAULT_MAX_IN_FLIGHT, enabled=True):
+        self.store = store or MemoryStore()
+        self.limits = limits or DEFAULT_LIMITS
+        self.max_in_flight = max_in_flight
+        self.enabled = enabled
+        self.in_flight = 0
+        self._in_flight_lock = Lock()
+
+    def set_store(self, store):
+        self.store = store
+
+    def configure(self, environ=None):
+        """Read limits and switches from ``RATE_LIMIT_*`` environment variables."""
+        environ = os.environ if environ is None else environ
+        self.enabled = environ.get('RATE_LIMIT_ENABLED', '1') != '0'
+        self.max_in_flight = int(environ.get('RATE_LIMIT_MAX_IN_FLIGHT', DEFAULT_MAX_IN_FLIGHT))
+        self.limits = {
+            rule: {
+                scope: parse_limit(environ[f'RATE_LIMIT_{rule.upper()}_{scope.upper()}'])
+                if f'RATE_LIMIT_{rule.upper()}_{scope.upper()}' in environ else limit
+                for scope, limit in scopes.items()
+            }
+            for rule, scopes in DEFAULT_LIMITS.items()
+        }
+
+    def check(self, rule, client_key, storm_key):
+        """Return seconds to wait before retrying, or 0 if the request may proceed."""
+        limits = self.limits[rule]
+        for scope, key in (('client', client_key), ('storm', storm_key)):
+            if key is None:
+                continue
+            rate, burst = limits[scope]
+            allowed, retry_after = self.store.take(f'{rule}:{scope}:{key}', rate, burst)
+            if not allowed:
+                rejected.inc(rule, scope)
+                return retry_after
+        return 0
+
+    def _enter(self):
+        with self._in_flight_lock:
+            if self.in_flight >= self.max_in_flight:
+                return False
+            self.in_flight += 1
+            return True
+
+    def _leave(self):
+        with self._in_flight_lock:
+            self.in_flight -= 1
+
+    def limit(self, rule):
+        """Decorate a view so it is rate limited under ``rule`` and subject to load shedding."""
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return view(*args, **kwargs)
+
+                principal = current_principal()
+                storm_key = kwargs.get('storm_id') or (principal.storm_id if principal else None)
+                client_key = principal.session_id if principal else f'{request.remote_addr}:{storm_key}'
+                retry_after = self.check(rule, client_key, storm_key)
+                if retry_after:
+                    return too_many_requests(retry_after)
+
+                if not self._enter():
+                    rejected.inc(rule, 'overload')
+                    return too_many_requests(1)
+                try:
+                    return view(*args, **kwargs)
+                finally:
+                    self._leave()
+            return wrapper
+        return decorator
+
+
+def too_many_requests(retry_after):
+    response = jsonify({'error': 'Too many requests, please retry later'})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+rejected = registry.register(Counter(
+    'storm_rate_limited_total', 'Requests rejected with 429', labels=('rule', 'scope')))
+
+rate_limiter = RateLimiter()
+rate_limiter.configure()
+rate_limited = rate_limiter.limit
+
+registry.register(Gauge(
+    'storm_limited_requests_in_flight', 'Rate-limited requests being processed',
+    lambda: rate_limiter.in_flight))
@@ -0,0 +1,114 @@
+from collections import OrderedDict
+from threading import Lock
+
+from sqlalchemy import func
+
+from src.models.storm import db, Idea, Vote, StormArchive
+from src.services.live import live_engine
+
+# Storms in the ``results`` phase can no longer change, so their rollup is
+# computed once and kept here (bounded, least recently used evicted first).
+FINISHED_CACHE_SIZE = 256
+_finished_results = OrderedDict()
+_finished_lock = Lock()
+
+
+def results_query(storm_id):
+    """Per-idea score rollup computed by a single GROUP BY over votes."""
+    blue = func.coalesce(func.sum(Vote.blue_tokens), 0)
+    red = func.coalesce(func.sum(Vote.red_tokens), 0)
+    net = blue - red
+    return (
+        db.session.query(
+            Idea.id,
+            Idea.title,
+            Idea.description,
+            Idea.author_id,
+            Idea.author_username,
+            blue.label('blue_score'),
+            red.label('red_score'),
+            net.label('net_score'),
+            func.count(Vote.id).label('vote_count'),
+        )
+        .outerjoin(Vote, Vote.idea_id == Idea.id)
+        .filter(Idea.storm_id == storm_id)
+        .group_by(Idea.id)
+        .order_by(net.desc(), Idea.created_at, Idea.id)
+    )
+
+
+def result_row_to_dict(row, rank):
+    return {
+        'ideaId': row.id,
+        'title': row.title,
+        'description': row.description,
+        'authorId': row.author_id,
+        'authorUsername': row.author_username,
+        'blueScore': int(row.blue_score),
+        'redScore': int(row.red_score),
+        'netScore': int(row.net_score),
+        'voteCount': row.vote_count,
+        'rank': rank,
+    }
+
+
+@live_engine.on_persisted
+def forget_finished_results(storm_id):
+    """Drop a cached rollup whose storm got votes persisted after it was computed."""
+    with _finished_lock:
+        _finished_results.pop(storm_id, None)
+
+
+def _finished_snapshot(storm_id):
+    with _finished_lock:
+        rows = _finished_results.get(storm_id)
+        if rows is not None:
+            _finished_results.move_to_end(storm_id)
+            return rows
+
+    archive = db.session.get(StormArchive, storm_id)
+    if archive is not None:
+        rows = archive.result_rows()
+    else:
+        rows = [result_row_to_dict(row, rank) for rank, row in enumerate(results_query(storm_id), start=1)]
+
+    with _finished_lock:
+        _finished_results[storm_id] = rows
+        _finished_results.move_to_end(storm_id)
+        while len(_finished_results) > FINISHED_CACHE_SIZE:
+            _finished_results.popitem(last=False)
+    return rows
+
+
+def get_storm_results(storm, limit=None, offset=0):
+    """Return ranked per-idea scores for a storm.
+
+    ``limit``/``offset`` page through the ranking; ranks are always absolute
+    positions in the full ranking, not in the current page.
+    """
+    live = live_engine.storm(storm.id) if live_engine.running and storm.status == 'voting' else None
+    if live is not None and live.closed:
+        live = None  # leaving the voting phase: its votes are all in the database
+    if storm.status == 'results' or live is not None:
+        rows = live.result_rows() if live is not None else _finished_snapshot(storm.id)
+        total = len(rows)
+        end = offset + limit if limit is not None else None
+        page = rows[offset:end]
+    else:
+        query = results_query(storm.id)
+        total = db.session.query(func.count(Idea.id)).filter(Idea.storm_id == storm.id).scalar()
+        if offset:
+            query = query.offset(offset)
+        if limit is not None:
+            query = query.limit(limit)
+        page = [result_row_to_dict(row, rank) for rank, row in enumerate(query, start=offset + 1)]
+
+    return {
+        'stormId': storm.id,
+        'status': storm.status,
+        'total': total,
+        'offset': offset,
+        'limit': limit,
+        'results': page,
+    }
+
@@ -0,0 +1,152 @@
+"""Archival of finished storms and purge of their participant sessions.
+
+A storm that has been in the ``results`` phase for a while is frozen into
+a ``StormArchive`` row (compressed snapshot plus final results). Its token
+ledger is dropped and, optionally, its raw votes and tombstones too. The
+storm row and its ideas stay, so the storm keeps its code, listing entry
+and idea export. ``get_storm``, results and delta sync read archived
+storms from the archive.
+
+Both jobs work in small batches, one transaction each, with a pause in
+between, so on SQLite the write lock is never held for long while live
+storms are being used. Run them from cron with ``flask storm archive``
+and ``flask storm purge-sessions``.
+"""
+import logging
+import time
+import zlib
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import delete, func, select, update
+
+from src.json_provider import dumps_bytes
+from src.models.storm import db, Storm, Vote, AnonymousUser, Tombstone, TokenLedger, StormArchive, next_revision
+from src.services.cache import snapshot_cache
+from src.services.results import result_row_to_dict, results_query
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_AFTER_DAYS = 7
+SESSION_RETENTION_DAYS = 30
+BATCH_SIZE = 500
+BATCH_PAUSE = 0.05  # seconds between batches, lets live writers take the lock
+
+
+def archive_storm(storm_id, drop_votes=False):
+    """Freeze one finished storm. Returns False if it is not archivable. The caller commits."""
+    storm = Storm.eager_query().filter_by(id=storm_id).first()
+    if storm is None or storm.status != 'results' or storm.archived_at is not None:
+        return False
+
+    results = [result_row_to_dict(row, rank) for rank, row in enumerate(results_query(storm_id), start=1)]
+    vote_count = len(storm.votes)
+
+    # Stamp the storm first so the stored snapshot carries its final revision
+    now = datetime.utcnow()
+    revision = next_revision(storm_id)
+    db.session.execute(
+        update(Storm).where(Storm.id == storm_id).values(archived_at=now, updated_at=Storm.updated_at)
+    )
+    db.session.refresh(storm, ['revision', 'archived_at', 'updated_at'])
+
+    db.session.add(StormArchive(
+        storm_id=storm_id,
+        revision=revision,
+        snapshot=zlib.compress(dumps_bytes(storm.to_dict())),
+        results=zlib.compress(dumps_bytes(results)),
+        vote_count=vote_count,
+        votes_dropped=drop_votes,
+        archived_at=now
+    ))
+
+    db.session.execute(delete(TokenLedger).where(TokenLedger.storm_id == storm_id))
+    if drop_votes:
+        db.session.execute(delete(Vote).where(Vote.storm_id == storm_id))
+        db.session.execute(delete(Tombstone).where(Tombstone.storm_id == storm_id))
+    return True
+
+
+def archive_finished_storms(older_than, drop_votes=False, limit=None, pause=BATCH_PAUSE):
+    """Archive storms that reached ``results`` before ``older_than``. Returns how many."""
+    query = (
+        select(Storm.id)
+        .where(Storm.status == 'results', Storm.archived_at.is_(None), Storm.updated_at < older_than)
+        .order_by(Storm.updated_at)
+    )
+    if limit is not None:
+        query = query.limit(limit)
+    storm_ids = db.session.execute(query).scalars().all()
+    db.session.rollback()
+
+    archived = 0
+    for storm_id in storm_ids:
+        try:
+            if archive_storm(storm_id, drop_votes=drop_votes):
+                db.session.commit()
+                snapshot_cache.invalidate(storm_id)
+                archived += 1
+            else:
+                db.session.rollback()
+        except Exception:
+            db.session.rollback()
+            logger.exception('Archiving storm %s failed', storm_id)
+        # Drop the loaded storm graph before the next one
+        db.session.expunge_all()
+        if pause:
+            time.sleep(pause)
+    return archived
+
+
+def purge_sessions(older_than, batch_size=BATCH_SIZE, pause=BATCH_PAUSE):
+    """Delete participants of storms archived before ``older_than``.
+
+    Their sessions can no longer do anything, and the archive snapshot
+    keeps the participant list. Returns the number of rows deleted.
+    """
+    expired = (
+        select(AnonymousUser.session_id)
+        .join(Storm, Storm.id == AnonymousUser.storm_id)
+        .where(Storm.archived_at < older_than)
+        .limit(batch_size)
+    )
+    purged = 0
+    while True:
+        session_ids = db.session.execute(expired).scalars().all()
+        if not session_ids:
+            db.session.rollback()
+            return purged
+        db.session.execute(delete(AnonymousUser).where(AnonymousUser.session_id.in_(session_ids)))
+        db.session.commit()
+        purged += len(session_ids)
+        if pause:
+            time.sleep(pause)
+
+
+def archive_stats():
+    """(archived storms, compressed bytes) for reporting."""
+    return db.session.execute(
+        select(func.count(StormArchive.storm_id),
+               func.coalesce(func.sum(func.length(StormArchive.snapshot) + func.length(StormArchive.results)), 0))
+    ).one()
+
+
+@click.option('--older-than-days', default=ARCHIVE_AFTER_DAYS, show_default=True,
+              help='Archive storms that have been in the results phase this long')
+@click.option('--drop-votes', is_flag=True, help='Delete the raw votes once archived')
+@click.option('--limit', type=int, default=None, help='Archive at most this many storms')
+def archive_command(older_than_days, drop_votes, limit):
+    """Freeze finished storms into compact archives."""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    count = archive_finished_storms(cutoff, drop_votes=drop_votes, limit=limit)
+    total, size = archive_stats()
+    click.echo(f'Archived {count} storms ({total} archived, {size} bytes compressed)')
+
+
+@click.option('--older-than-days', default=SESSION_RETENTION_DAYS, show_default=True,
+              help='Purge participants of storms archived this long ago')
+@click.option('--batch-size', default=BATCH_SIZE, show_default=True)
+def purge_sessions_command(older_than_days, batch_size):
+    """Delete participant sessions of long-archived storms."""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    click.echo(f'Purged {purge_sessions(cutoff, batch_size=batch_size)} sessions')
@@ -0,0 +1,86 @@
+"""Full-text search over a storm's ideas.
+
+Uses whatever the database offers, set up by migration 6:
+
+* SQLite: the ``ideas_fts`` FTS5 table, kept in step with ``ideas`` by
+  triggers and ranked with bm25;
+* PostgreSQL: the generated ``ideas.search_vector`` column (GIN index),
+  ranked with ts_rank;
+* otherwise (or SQLite without FTS5): a LIKE scan of the storm's ideas.
+
+Every word of the query must match; on SQLite words also match as
+prefixes, so results follow the user while they type.
+
+``ideas_fts`` indexes ideas by their ``search_id`` column (migration 7),
+not by rowid, so VACUUM does not break it.
+"""
+import re
+
+import click
+from sqlalchemy import and_, inspect, or_, text
+
+from src.models.storm import db, Idea
+
+MAX_QUERY_WORDS = 16
+_WORD = re.compile(r'\w+', re.UNICODE)
+_fts_available = {}
+
+
+def query_words(q):
+    return _WORD.findall(q or '')[:MAX_QUERY_WORDS]
+
+
+def _has_fts(bind):
+    key = str(bind.url)
+    if key not in _fts_available:
+        _fts_available[key] = inspect(bind).has_table('ideas_fts')
+    return _fts_available[key]
+
+
+def search_ideas(storm_id, q, limit=50, offset=0):
+    """Return ``[(idea, score)]`` best match first; lower scores are better on SQLite."""
+    words = query_words(q)
+    if not words:
+        return []
+
+    bind = db.session.get_bind()
+    if bind.dialect.name == 'sqlite' and _has_fts(bind):
+        match = ' '.join(f'"{word}"*' for word in words)
+        rows = db.session.execute(text(
+            'SELECT ideas.id, bm25(ideas_fts) AS score FROM ideas_fts'
+            ' JOIN ideas ON ideas.search_id = ideas_fts.rowid'
+            ' WHERE ideas_fts MATCH :match AND ideas.storm_id = :storm_id'
+            ' ORDER BY score LIMIT :limit OFFSET :offset'
+        ), {'match': match, 'storm_id': storm_id, 'limit': limit, 'offset': offset}).all()
+    elif bind.dialect.name == 'postgresql':
+        rows = db.session.execute(text(
+            "SELECT id, ts_rank(search_vector, plainto_tsquery('simple', :q)) AS score FROM ideas"
+            " WHERE storm_id = :storm_id AND search_vector @@ plainto_tsquery('simple', :q)"
+            ' ORDER BY score DESC LIMIT :limit OFFSET :offset'
+        ), {'q': ' '.join(words), 'storm_id': storm_id, 'limit': limit, 'offset': offset}).all()
+    else:
+        conditions = [
+            or_(Idea.title.ilike(f'%{word}%'), Idea.description.ilike(f'%{word}%'))
+            for word in words
+        ]
+        ideas = (
+            Idea.query.filter(Idea.storm_id == storm_id, and_(*conditions))
+            .order_by(Idea.created_at, Idea.id)
+            .limit(limit).offset(offset).all()
+        )
+        return [(idea, None) for idea in ideas]
+
+    if not rows:
+        return []
+    ideas = {idea.id: idea for idea in Idea.query.filter(Idea.id.in_([row.id for row in rows]))}
+    return [(ideas[row.id], row.score) for row in rows if row.id in ideas]
+
+
+def rebuild_search_command():
+    """Rebuild the idea full-text index from the ideas table."""
+    if db.engine.dialect.name != 'sqlite' or not _has_fts(db.engine):
+        click.echo('Nothing to rebuild')
+        return
+    with db.engine.begin() as conn:
+        conn.execute(text("INSERT INTO ideas_fts (ideas_fts) VALUES ('rebuild')"))
+    click.echo('Rebuilt ideas_fts')
@@ -0,0 +1,319 @@
+"""State shared between worker processes: pub/sub, cache, rate limit buckets, counters and locks.
+
+One backend object provides all of it:
+
+* ``publish(channel, message)`` / ``subscribe(channel, callback)`` for the
+  event broker;
+* ``get(key)`` / ``set(key, value)`` / ``delete(key)`` for the snapshot cache;
+* ``take(key, rate, capacity)`` for the rate limiter's token buckets;
+* ``incr(key, amount)`` / ``counter(key)`` for counters, incremented
+  atomically and starting at 0;
+* ``acquire(name, ttl, wait)`` / ``release(name, token)`` for locks, which
+  are leases: a holder that dies releases its lock after ``ttl`` seconds.
+
+``MemoryState`` keeps everything in this process, which is all a single
+worker needs. ``NetworkState`` talks to ``python -m src.services.state_server``
+so that several workers, on one machine or several, see the same events,
+cache entries, buckets, counters and locks. ``SHARED_STATE_URL=tcp://host:port``
+selects it (see ``connect``); ``use_shared_state`` plugs the backend into
+the broker, the snapshot cache and the rate limiter.
+"""
+import base64
+import json
+import logging
+import socket
+import threading
+import time
+import uuid
+import zlib
+from collections import defaultdict
+from contextlib import contextmanager
+from threading import Lock, RLock
+from urllib.parse import urlparse
+
+from src.services.cache import LRUCache, snapshot_cache
+from src.services.events import InProcessBackend, broker
+from src.services.ratelimit import MemoryStore, rate_limiter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 7390
+DEFAULT_LOCK_TTL = 30
+STRIPES = 256
+# Requests that may be repeated after a lost reply: applying them twice
+# leaves the same state (an acquire by the holder of the lock succeeds)
+IDEMPOTENT = frozenset(('get', 'set', 'delete', 'counter', 'acquire', 'release', 'stats'))
+
+
+class LockTimeout(Exception):
+    """A shared lock could not be acquired in time."""
+
+
+def encode(obj):
+    """One protocol line: JSON with bytes base64-wrapped, so ``decode`` restores them."""
+    def default(value):
+        if isinstance(value, (bytes, bytearray)):
+            return {'$b': base64.b64encode(value).decode()}
+        raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+    return json.dumps(obj, default=default, separators=(',', ':')).encode() + b'\n'
+
+
+def decode(line):
+    return json.loads(line, object_hook=lambda d: base64.b64decode(d['$b']) if '$b' in d else d)
+
+
+class MemoryState:
+    """Shared state for a single process."""
+
+    distributed = False
+
+    def __init__(self, cache=None, buckets=None):
+        self._pubsub = InProcessBackend()
+        self._cache = cache or LRUCache()
+        self._buckets = buckets or MemoryStore()
+        self._counters = defaultdict(int)
+        self._counters_lock = Lock()
+        self._locks = [RLock() for _ in range(STRIPES)]
+
+    def publish(self, channel, message):
+        self._pubsub.publish(channel, message)
+
+    def subscribe(self, channel, callback):
+        return self._pubsub.subscribe(channel, callback)
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, value):
+        self._cache.set(key, value)
+
+    def delete(self, key):
+        self._cache.delete(key)
+
+    @property
+    def evictions(self):
+        return self._cache.evictions
+
+    def __len__(self):
+        return len(self._cache)
+
+    def take(self, key, rate, capacity):
+        return self._buckets.take(key, rate, capacity)
+
+    def incr(self, key, amount=1):
+        with self._counters_lock:
+            self._counters[key] += amount
+            return self._counters[key]
+
+    def counter(self, key):
+        return self._counters.get(key, 0)
+
+    def acquire(self, name, ttl=DEFAULT_LOCK_TTL, wait=None):
+        # ttl is moot in process: a holder cannot die without the lock
+        lock = self._locks[zlib.crc32(name.encode()) % STRIPES]
+        if wait is None:
+            acquired = lock.acquire()
+        else:
+            acquired = lock.acquire(timeout=wait) if wait > 0 else lock.acquire(blocking=False)
+        return lock if acquired else None
+
+    def release(self, name, token):
+        token.release()
+
+
+class NetworkState:
+    """Client of the state server.
+
+    Requests go over one connection per thread. A connection the server
+    has closed (e.g. it restarted) is replaced before a request is sent on
+    it; a request that fails after it was sent is only repeated when it is
+    idempotent, since the server may have applied it (a rate limit
+    ``take`` must not be charged twice). Events arrive on a separate
+    connection read by a background thread, which fans them out to this
+    process's subscribers and resubscribes after a reconnect; events
+    published while it is disconnected are lost, like with any pub/sub bus.
+    """
+
+    distributed = True
+
+    def __init__(self, host, port=DEFAULT_PORT, timeout=5.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._local = threading.local()
+        self._pubsub = InProcessBackend()
+        self._channels = set()
+        self._sub_lock = Lock()
+        self._sub_socket = None
+        self._sub_thread = None
+
+    def _connect(self, timeout):
+        sock = socket.create_connection((self.host, self.port), timeout=timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    @staticmethod
+    def _closed_by_server(sock):
+        try:
+            sock.setblocking(False)
+            return sock.recv(1, socket.MSG_PEEK) == b''
+        except BlockingIOError:
+            return False  # open, nothing to read
+        except OSError:
+            return True
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._closed_by_server(conn[0]):
+            conn[0].close()
+            conn = None
+        if conn is None:
+            sock = self._connect(self.timeout)
+            conn = self._local.conn = (sock, sock.makefile('rb'))
+        return conn
+
+    def _call(self, op, *args, timeout=None):
+        attempts = 2 if op in IDEMPOTENT else 1
+        for attempt in range(1, attempts + 1):
+            conn = None
+            try:
+                conn = self._connection()
+                sock, reader = conn
+                sock.settimeout(self.timeout if timeout is None else timeout)
+                sock.sendall(encode([op, *args]))
+                line = reader.readline()
+                if not line:
+                    raise ConnectionError('state server closed the connection')
+                break
+            except OSError:
+                self._local.conn = None
+                if conn is not None:
+                    conn[0].close()
+                if attempt == attempts:
+                    raise
+        ok, result = decode(line)
+        if not ok:
+            raise RuntimeError(f'state server: {result}')
+        return result
+
+    def publish(self, channel, message):
+        self._call('publish', channel, message)
+
+    def subscribe(self, channel, callback):
+        unsubscribe = self._pubsub.subscribe(channel, callback)
+        with self._sub_lock:
+            if channel not in self._channels:
+                self._channels.add(channel)
+                if self._sub_socket is not None:
+                    self._sub_socket.sendall(encode(['subscribe', channel]))
+            if self._sub_thread is None:
+                self._sub_thread = threading.Thread(target=self._listen, name='shared-state-events', daemon=True)
+                self._sub_thread.start()
+        return unsubscribe
+
+    def _listen(self):
+        while True:
+            try:
+                sock = self._connect(self.timeout)
+                sock.settimeout(None)
+                with self._sub_lock:
+                    for channel in self._channels:
+                        sock.sendall(encode(['subscribe', channel]))
+                    self._sub_socket = sock
+                for line in sock.makefile('rb'):
+                    _, channel, message = decode(line)
+                    # Deliver to local subscribers of the channel, or of everything
+                    self._pubsub.publish(channel, message)
+            except OSError:
+                logger.warning('Lost the state server event connection, reconnecting', exc_info=True)
+            with self._sub_lock:
+                self._sub_socket = None
+            time.sleep(1)
+
+    def get(self, key):
+        return self._call('get', key)
+
+    def set(self, key, value):
+        self._call('set', key, value)
+
+    def delete(self, key):
+        self._call('delete', key)
+
+    def take(self, key, rate, capacity):
+        allowed, retry_after = self._call('take', key, rate, capacity)
+        return allowed, retry_after
+
+    def incr(self, key, amount=1):
+        return self._call('incr', key, amount)
+
+    def counter(self, key):
+        return self._call('counter', key)
+
+    def acquire(self, name, ttl=DEFAULT_LOCK_TTL, wait=None):
+        token = uuid.uuid4().hex
+        wait = ttl if wait is None else wait
+        # The server holds the request until the lock is free or ``wait`` runs out
+        if self._call('acquire', name, token, ttl, wait, timeout=wait + self.timeout):
+            return token
+        return None
+
+    def release(self, name, token):
+        self._call('release', name, token)
+
+
+class SharedState:
+    """The process-wide shared state, whichever backend is in use."""
+
+    def __init__(self, backend=None):
+        self.backend = backend or MemoryState()
+
+    def set_backend(self, backend):
+        self.backend = backend
+
+    @property
+    def distributed(self):
+        return self.backend.distributed
+
+    def incr(self, key, amount=1):
+        """Add ``amount`` to the counter ``key`` and return its new value."""
+        return self.backend.incr(key, amount)
+
+    def counter(self, key):
+        return self.backend.counter(key)
+
+    def acquire(self, name, ttl=DEFAULT_LOCK_TTL, wait=None):
+        return self.backend.acquire(name, ttl=ttl, wait=wait)
+
+    def release(self, name, token):
+        self.backend.release(name, token)
+
+    @contextmanager
+    def lock(self, name, ttl=DEFAULT_LOCK_TTL, wait=None):
+        token = self.acquire(name, ttl=ttl, wait=wait)
+        if token is None:
+            raise LockTimeout(f'Could not acquire {name}')
+        try:
+            yield
+        finally:
+            self.release(name, token)
+
+
+def connect(url=None):
+    """Backend for ``url``: ``tcp://host:port`` for the state server, in process when empty."""
+    if not url or url == 'memory://':
+        return MemoryState()
+    parsed = urlparse(url)
+    if parsed.scheme != 'tcp' or not parsed.hostname:
+        raise ValueError(f'Unsupported SHARED_STATE_URL {url!r}, expected tcp://host:port')
+    return NetworkState(parsed.hostname, parsed.port or DEFAULT_PORT)
+
+
+def use_shared_state(backend):
+    """Route storm events, cached snapshots and rate limit buckets through ``backend``."""
+    shared_state.set_backend(backend)
+    broker.set_backend(backend)
+    snapshot_cache.set_backend(backend)
+    rate_limiter.set_store(backend)
+
+
+shared_state = SharedState()
@@ -0,0 +1,200 @@
+"""Shared state server for running several workers.
+
+    python -m src.services.state_server [--host 127.0.0.1] [--port 7390]
+
+Holds the events, cache entries, rate limit buckets, counters and locks
+that ``NetworkState`` clients share (see ``shared_state``). The protocol
+is one JSON array per line: a request ``[op, *args]`` is answered by
+``[true, result]`` or ``[false, error]``, in order, on the same
+connection. After ``["subscribe", channel]`` a connection also receives
+``["message", channel, message]`` lines for that channel (``*`` for all).
+
+Everything lives in this process's memory: restarting it drops cached
+snapshots (they are rebuilt from the database), bucket levels, counters
+and locks.
+There is no authentication, so bind it to a private interface.
+"""
+import argparse
+import asyncio
+import logging
+import time
+from collections import defaultdict, deque
+
+from src.services.cache import LRUCache
+from src.services.events import ALL_CHANNELS
+from src.services.ratelimit import MemoryStore
+from src.services.shared_state import DEFAULT_PORT, decode, encode
+
+logger = logging.getLogger('storm.state_server')
+
+# A subscriber this far behind is disconnected rather than buffered without bound
+MAX_SUBSCRIBER_BUFFER = 8 * 1024 * 1024
+SWEEP_INTERVAL = 60
+
+
+class StateServer:
+    def __init__(self, cache_size=100000, cache_ttl=300):
+        self.cache = LRUCache(maxsize=cache_size, ttl=cache_ttl)
+        self.buckets = MemoryStore()
+        self.counters = defaultdict(int)
+        self.locks = {}  # name -> (token, lease expiry)
+        self.waiters = defaultdict(deque)  # name -> futures resolved on release
+        self.subscribers = defaultdict(set)  # channel -> stream writers
+
+    async def handle(self, reader, writer):
+        channels = set()
+        held = {}  # lock token -> name, released if the connection drops
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                op, *args = decode(line)
+                if op == 'subscribe':
+                    self.subscribers[args[0]].add(writer)
+                    channels.add(args[0])
+                    continue
+                try:
+                    result = await self.dispatch(op, args, held)
+                    reply = [True, result]
+                except Exception as e:
+                    logger.exception('Failed %s request', op)
+                    reply = [False, str(e)]
+                writer.write(encode(reply))
+                await writer.drain()
+        except (ConnectionError, ValueError) as e:
+            logger.info('Dropping connection: %s', e)
+        finally:
+            for channel in channels:
+                self.subscribers[channel].discard(writer)
+                if not self.subscribers[channel]:
+                    del self.subscribers[channel]
+            for token, name in held.items():
+                self.release(name, token)
+            writer.close()
+
+    async def dispatch(self, op, args, held):
+        if op == 'get':
+            return self.cache.get(args[0])
+        if op == 'set':
+            self.cache.set(args[0], args[1])
+            return None
+        if op == 'delete':
+            self.cache.delete(args[0])
+            return None
+        if op == 'take':
+            return list(self.buckets.take(*args))
+        if op == 'incr':
+            self.counters[args[0]] += args[1]
+            return self.counters[args[0]]
+        if op == 'counter':
+            return self.counters.get(args[0], 0)
+        if op == 'publish':
+            return self.publish(*args)
+        if op == 'acquire':
+            name, token = args[0], args[1]
+            acquired = await self.acquire(*args)
+            if acquired:
+                held[token] = name
+            return acquired
+        if op == 'release':
+            held.pop(args[1], None)
+            return self.release(*args)
+        if op == 'stats':
+            return {
+                'cacheSize': len(self.cache),
+                'cacheEvictions': self.cache.evictions,
+                'buckets': len(self.buckets),
+                'counters': len(self.counters),
+                'locks': len(self.locks),
+                'subscribers': sum(len(writers) for writers in self.subscribers.values()),
+            }
+        raise ValueError(f'Unknown operation {op!r}')
+
+    def publish(self, channel, message):
+        writers = self.subscribers.get(channel, set()) | self.subscribers.get(ALL_CHANNELS, set())
+        line = encode(['message', channel, message])
+        for writer in writers:
+            if writer.transport.get_write_buffer_size() > MAX_SUBSCRIBER_BUFFER:
+                logger.warning('Disconnecting a subscriber that stopped reading')
+                writer.close()
+                continue
+            writer.write(line)
+        return len(writers)
+
+    async def acquire(self, name, token, ttl, wait):
+        deadline = time.monotonic() + wait
+        while True:
+            now = time.monotonic()
+            holder = self.locks.get(name)
+            # A holder asking again (a retried request) keeps its lock
+            if holder is None or holder[1] <= now or holder[0] == token:
+                self.locks[name] = (token, now + ttl)
+                return True
+            if now >= deadline:
+                return False
+            released = asyncio.get_running_loop().create_future()
+            self.waiters[name].append(released)
+            try:
+                # Wake on release, or when the holder's lease runs out
+                await asyncio.wait_for(released, min(deadline, holder[1]) - now)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                waiters = self.waiters.get(name)
+                if waiters is not None:
+                    if released in waiters:
+                        waiters.remove(released)
+                    if not waiters:
+                        del self.waiters[name]
+
+    def release(self, name, token):
+        holder = self.locks.get(name)
+        if holder is None or holder[0] != token:
+            return False
+        del self.locks[name]
+        waiters = self.waiters.get(name, ())
+        while waiters:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                break
+        return True
+
+    async def sweep(self):
+        """Forget lapsed locks nobody asked for again."""
+        while True:
+            await asyncio.sleep(SWEEP_INTERVAL)
+            now = time.monotonic()
+            for name in [name for name, (_, expires_at) in self.locks.items() if expires_at <= now]:
+                del self.locks[name]
+
+
+async def serve(host, port, cache_size, cache_ttl):
+    state = StateServer(cache_size=cache_size, cache_ttl=cache_ttl)
+    server = await asyncio.start_server(state.handle, host, port)
+    logger.info('State server listening on %s:%s', host, port)
+    sweeper = asyncio.create_task(state.sweep())
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        sweeper.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Shared state server for storm workers')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--cache-size', type=int, default=100000, help='Cached entries kept (LRU)')
+    parser.add_argument('--cache-ttl', type=int, default=300, help='Seconds a cache entry lives')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    try:
+        asyncio.run(serve(args.host, args.port, args.cache_size, args.cache_ttl))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+import json
+
+from src.models.storm import db, Storm, Idea, Vote, AnonymousUser, Tombstone, StormArchive
+
+
+def get_storm_version(storm_id):
+    """Return ``(revision, status, updated_at, archived_at)`` without loading the storm, or None."""
+    return (
+        db.session.query(Storm.revision, Storm.status, Storm.updated_at, Storm.archived_at)
+        .filter(Storm.id == storm_id)
+        .first()
+    )
+
+
+def get_changes(storm_id, since, version):
+    """Everything created, updated or deleted in a storm after revision ``since``."""
+    if version.archived_at is not None and since < version.revision:
+        return _archived_changes(storm_id, since, version)
+
+    ideas = Idea.query.filter(Idea.storm_id == storm_id, Idea.revision > since).all()
+    votes = Vote.query.filter(Vote.storm_id == storm_id, Vote.revision > since).all()
+    participants = AnonymousUser.query.filter(
+        AnonymousUser.storm_id == storm_id,
+        AnonymousUser.revision > since
+    ).all()
+    tombstones = (
+        db.session.query(Tombstone.entity, Tombstone.entity_id)
+        .filter(Tombstone.storm_id == storm_id, Tombstone.revision > since)
+        .all()
+    )
+
+    deleted = {'ideas': [], 'votes': []}
+    for entity, entity_id in tombstones:
+        deleted[entity + 's'].append(entity_id)
+
+    return {
+        'stormId': storm_id,
+        'since': since,
+        'version': version.revision,
+        'status': version.status,
+        'updatedAt': version.updated_at,
+        'ideas': [idea.to_dict() for idea in ideas],
+        'votes': [vote.to_dict() for vote in votes],
+        'participants': [user.to_dict() for user in participants],
+        'deleted': deleted,
+    }
+
+
+def _archived_changes(storm_id, since, version):
+    """Archived storms may have dropped their votes and tombstones, so a
+    client behind the archive gets the whole frozen storm with ``reset``
+    set and should replace its state rather than merge."""
+    archive = db.session.get(StormArchive, storm_id)
+    storm = json.loads(archive.snapshot_bytes())
+    return {
+        'stormId': storm_id,
+        'since': since,
+        'version': version.revision,
+        'status': version.status,
+        'updatedAt': version.updated_at,
+        'reset': True,
+        'ideas': storm['ideas'],
+        'votes': storm['votes'],
+        'participants': storm['participants'],
+        'deleted': {'ideas': [], 'votes': []},
+    }
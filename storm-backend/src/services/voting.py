@@ -0,0 +1,116 @@
+import uuid
+from datetime import datetime
+
+from sqlalchemy import delete, insert
+
+from src.models.storm import db, Idea, Vote, Tombstone, next_revision
+from src.services.ledger import reserve_tokens
+from src.services.metrics import Counter, registry
+
+votes_accepted = registry.register(Counter(
+    'storm_votes_total', 'Votes accepted, by write path', labels=('path',)))
+
+
+class VoteError(Exception):
+    """A vote request that fails validation (maps to HTTP 400)."""
+
+
+def parse_allocation(data, idea_id=None):
+    """Validate one ``{ideaId, blueTokens, redTokens, comment}`` entry."""
+    if not isinstance(data, dict):
+        raise VoteError('Each vote must be an object')
+
+    idea_id = idea_id or data.get('ideaId')
+    blue_tokens = data.get('blueTokens', 0)
+    red_tokens = data.get('redTokens', 0)
+    comment = data.get('comment', '')
+
+    if not idea_id:
+        raise VoteError('ideaId is required')
+    for value in (blue_tokens, red_tokens):
+        if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+            raise VoteError('Token counts must be non-negative integers')
+    if not isinstance(comment, str) or not comment.strip():
+        raise VoteError('Comment is required')
+    if blue_tokens > 0 and red_tokens > 0:
+        raise VoteError('Cannot use both blue and red tokens on the same idea')
+
+    return {
+        'idea_id': idea_id,
+        'blue_tokens': blue_tokens,
+        'red_tokens': red_tokens,
+        'comment': comment,
+    }
+
+
+def cast_votes(storm, user_id, allocations, check_ideas=True):
+    """Replace the participant's votes on the given ideas in one transaction.
+
+    The whole set is checked against the token budget at once (tokens of
+    the replaced votes are released first), then applied with one bulk
+    delete and one bulk insert. Nothing is committed; on VoteError or
+    InsufficientTokens the caller rolls back and no vote is changed.
+
+    Returns ``(votes, replaced)`` with votes as API dicts and ``replaced``
+    mapping each idea whose previous vote was replaced to that vote's id.
+    """
+    idea_ids = [allocation['idea_id'] for allocation in allocations]
+    if len(set(idea_ids)) != len(idea_ids):
+        raise VoteError('Each idea can only be voted on once per request')
+
+    if check_ideas:
+        found = {
+            idea_id for (idea_id,) in db.session.query(Idea.id).filter(
+                Idea.storm_id == storm.id,
+                Idea.id.in_(idea_ids)
+            )
+        }
+        missing = [idea_id for idea_id in idea_ids if idea_id not in found]
+        if missing:
+            raise VoteError(f"Unknown ideas for this storm: {', '.join(missing)}")
+
+    existing_votes = (
+        db.session.query(Vote.id, Vote.idea_id, Vote.blue_tokens, Vote.red_tokens)
+        .filter(Vote.user_id == user_id, Vote.idea_id.in_(idea_ids))
+        .all()
+    )
+
+    blue_delta = sum(a['blue_tokens'] for a in allocations) - sum(v.blue_tokens for v in existing_votes)
+    red_delta = sum(a['red_tokens'] for a in allocations) - sum(v.red_tokens for v in existing_votes)
+    reserve_tokens(storm, user_id, blue_delta, red_delta)
+
+    revision = next_revision(storm.id)
+    replaced = {vote.idea_id: vote.id for vote in existing_votes}
+    replaced_vote_ids = list(replaced.values())
+    if replaced_vote_ids:
+        db.session.execute(insert(Tombstone), [
+            {'storm_id': storm.id, 'entity': 'vote', 'entity_id': vote_id, 'revision': revision}
+            for vote_id in replaced_vote_ids
+        ])
+        db.session.execute(
+            delete(Vote).where(Vote.id.in_(replaced_vote_ids)),
+            execution_options={'synchronize_session': False}
+        )
+
+    now = datetime.utcnow()
+    rows = [
+        dict(allocation, id=str(uuid.uuid4()), storm_id=storm.id, user_id=user_id,
+             revision=revision, created_at=now)
+        for allocation in allocations
+    ]
+    db.session.execute(insert(Vote), rows)
+
+    votes = [
+        {
+            'id': row['id'],
+            'ideaId': row['idea_id'],
+            'userId': user_id,
+            'blueTokens': row['blue_tokens'],
+            'redTokens': row['red_tokens'],
+            'comment': row['comment'],
+            'createdAt': now
+        }
+        for row in rows
+    ]
+    return votes, replaced
+
@@ -0,0 +1,73 @@
+"""Fixtures: the storm API on a fresh SQLite file per test.
+
+The app is built like the benchmarks build it (``benchmarks/stress_votes.py``):
+only the storm blueprint, no background services, rate limiting off
+unless a test turns it on.
+"""
+import pytest
+from flask import Flask
+
+import src.config  # noqa: F401  (WAL and busy timeout for SQLite connections)
+from src.json_provider import StormJSONProvider
+from src.migrations import upgrade
+from src.models.user import db
+from src.routes.storm import storm_bp
+from src.services.ratelimit import rate_limiter
+
+BLUE_TOKENS, RED_TOKENS = 5, 3
+
+
+def build_app(uri, engine_options=None):
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'test'
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options or {}
+    app.json = StormJSONProvider(app)
+    app.register_blueprint(storm_bp, url_prefix='/api')
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        upgrade(db.engine)
+    return app
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setattr(rate_limiter, 'enabled', False)
+    app = build_app(f'sqlite:///{tmp_path / "storm.db"}')
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+@pytest.fixture
+def new_storm(app):
+    """``new_storm(**fields) -> (storm id, moderator client)``"""
+    def create(**fields):
+        moderator = app.test_client()
+        response = moderator.post('/api/storms', json=dict(
+            {'title': 'test storm', 'blueTokens': BLUE_TOKENS, 'redTokens': RED_TOKENS}, **fields))
+        assert response.status_code == 201, response.get_json()
+        return response.get_json()['storm']['id'], moderator
+    return create
+
+
+@pytest.fixture
+def join(app):
+    """``join(storm id, username) -> participant client``"""
+    def join_storm(storm_id, username):
+        client = app.test_client()
+        response = client.post(f'/api/storms/{storm_id}/join', json={'username': username})
+        assert response.status_code == 200, response.get_json()
+        return client
+    return join_storm
+
+
+@pytest.fixture
+def add_idea():
+    """``add_idea(client, storm id, title) -> idea id``"""
+    def add(client, storm_id, title):
+        response = client.post(f'/api/storms/{storm_id}/ideas', json={'title': title})
+        assert response.status_code == 201, response.get_json()
+        return response.get_json()['id']
+    return add
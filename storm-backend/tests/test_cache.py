@@ -0,0 +1,92 @@
+import json
+
+import pytest
+
+from src.models.user import db
+from src.models.storm import Storm, next_revision
+from src.services import cache
+from src.services.cache import LRUCache, SnapshotCache, snapshot_cache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_lru_drops_the_least_recently_used(clock):
+    lru = LRUCache(maxsize=2)
+    lru.set('a', 1)
+    lru.set('b', 2)
+    assert lru.get('a') == 1  # b is now the oldest
+    lru.set('c', 3)
+
+    assert lru.get('b') is None
+    assert (lru.get('a'), lru.get('c')) == (1, 3)
+    assert lru.evictions == 1
+
+
+def test_lru_entries_expire(clock):
+    lru = LRUCache(ttl=10)
+    lru.set('a', 1)
+    clock[0] += 10
+    assert lru.get('a') == 1
+    clock[0] += 0.1
+    assert lru.get('a') is None
+    assert len(lru) == 0
+
+
+def test_snapshot_of_another_revision_is_a_miss():
+    snapshots = SnapshotCache()
+    snapshots.set('s1', 3, b'{"revision": 3}')
+
+    assert snapshots.get('s1', 3) == b'{"revision": 3}'
+    assert snapshots.get('s1', 4) is None
+    assert (snapshots.hits, snapshots.misses) == (1, 1)
+
+    snapshots.invalidate('s1')
+    assert snapshots.get('s1', 3) is None
+
+
+def test_repeated_reads_are_served_from_the_cache(app, new_storm, monkeypatch):
+    monkeypatch.setattr(snapshot_cache, 'backend', LRUCache())
+    storm_id, moderator = new_storm()
+    before = snapshot_cache.stats()
+
+    first = moderator.get(f'/api/storms/{storm_id}')
+    second = moderator.get(f'/api/storms/{storm_id}')
+
+    assert first.status_code == second.status_code == 200
+    assert first.data == second.data
+    after = snapshot_cache.stats()
+    assert after['misses'] - before['misses'] == 1
+    assert after['hits'] - before['hits'] == 1
+
+
+def test_writes_are_visible_on_the_next_read(app, new_storm, join, add_idea, monkeypatch):
+    monkeypatch.setattr(snapshot_cache, 'backend', LRUCache())
+    storm_id, moderator = new_storm()
+    moderator.get(f'/api/storms/{storm_id}')
+
+    idea_id = add_idea(join(storm_id, 'alice'), storm_id, 'fresh')
+
+    storm = moderator.get(f'/api/storms/{storm_id}').get_json()
+    assert [idea['id'] for idea in storm['ideas']] == [idea_id]
+
+
+def test_change_without_invalidation_is_not_served_stale(app, new_storm, monkeypatch):
+    # A writer that forgets to invalidate (or another worker's cache) still
+    # bumps the revision, and the snapshot of the old revision is not used
+    monkeypatch.setattr(snapshot_cache, 'backend', LRUCache())
+    storm_id, moderator = new_storm()
+    cached = json.loads(moderator.get(f'/api/storms/{storm_id}').data)
+
+    with app.app_context():
+        db.session.get(Storm, storm_id).title = 'renamed'
+        next_revision(storm_id)
+        db.session.commit()
+
+    storm = json.loads(moderator.get(f'/api/storms/{storm_id}').data)
+    assert storm['title'] == 'renamed'
+    assert storm['revision'] == cached['revision'] + 1
@@ -0,0 +1,153 @@
+import os
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from flask import Flask
+from sqlalchemy import create_engine, func, text
+
+from conftest import BLUE_TOKENS, build_app
+from src.config import configure_database, database_uri, engine_options
+from src.models.user import db
+from src.models.storm import Vote
+from src.services.locks import STRIPES, storm_write_lock
+from src.services.ratelimit import rate_limiter
+
+# How long the first transaction keeps the storm locked
+HOLD_SECONDS = 0.5
+
+
+def test_database_url_defaults_to_the_sqlite_file(tmp_path):
+    path = tmp_path / 'database' / 'app.db'
+    assert database_uri({}, str(path)) == f'sqlite:///{path}'
+    assert path.parent.is_dir()
+
+
+def test_heroku_postgres_scheme_is_rewritten():
+    assert database_uri({'DATABASE_URL': 'postgres://u:p@host/storm'}, '/unused') == 'postgresql://u:p@host/storm'
+
+
+def test_pool_settings_come_from_the_environment():
+    options = engine_options('postgresql://host/storm', {'DB_POOL_SIZE': '3', 'DB_POOL_PRE_PING': 'off'})
+    assert options['pool_size'] == 3
+    assert options['max_overflow'] == 20
+    assert options['pool_pre_ping'] is False
+    assert 'connect_args' not in options
+    assert engine_options('sqlite:///file.db', {})['connect_args'] == {'check_same_thread': False}
+    # In-memory SQLite lives in one connection; the default pool is kept
+    assert engine_options('sqlite://', {}) == {}
+
+
+def test_sqlite_connections_use_wal_and_the_busy_timeout(tmp_path):
+    app = Flask(__name__)
+    configure_database(app, str(tmp_path / 'app.db'), environ={'SQLITE_BUSY_TIMEOUT_MS': '1234'})
+    engine = create_engine(app.config['SQLALCHEMY_DATABASE_URI'], **app.config['SQLALCHEMY_ENGINE_OPTIONS'])
+    try:
+        with engine.connect() as conn:
+            assert conn.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+            assert conn.execute(text('PRAGMA busy_timeout')).scalar() == 1234
+    finally:
+        engine.dispose()
+        configure_database(app, str(tmp_path / 'app.db'), environ={})
+
+
+@pytest.fixture
+def postgres_app(monkeypatch):
+    """The storm API on PostgreSQL, in a schema of its own dropped afterwards."""
+    url = os.environ.get('TEST_POSTGRES_URL')
+    if not url:
+        pytest.skip('TEST_POSTGRES_URL is not set')
+    monkeypatch.setattr(rate_limiter, 'enabled', False)
+    schema = f'storm_test_{uuid.uuid4().hex[:12]}'
+    admin = create_engine(url)
+    with admin.begin() as conn:
+        conn.execute(text(f'CREATE SCHEMA {schema}'))
+    try:
+        app = build_app(url, {'connect_args': {'options': f'-csearch_path={schema}'}, 'pool_size': 20})
+        yield app
+        with app.app_context():
+            db.engine.dispose()
+    finally:
+        with admin.begin() as conn:
+            conn.execute(text(f'DROP SCHEMA {schema} CASCADE'))
+        admin.dispose()
+
+
+def hold_lock(app, storm_id, locked, order):
+    """Take the storm's write lock, keep it a while, then commit."""
+    with app.app_context():
+        with storm_write_lock(storm_id):
+            locked.set()
+            time.sleep(HOLD_SECONDS)
+            order.append('first committed')
+            db.session.commit()
+
+
+def lock_after(app, storm_id, locked, order):
+    locked.wait(10)
+    with app.app_context():
+        with storm_write_lock(storm_id):
+            order.append('second locked')
+            db.session.commit()
+
+
+@pytest.fixture(params=['sqlite', pytest.param('postgresql', marks=pytest.mark.postgres)])
+def app(request, app):
+    """The lock tests run on SQLite (striped in-process locks) and on PostgreSQL (row locks)."""
+    if request.param == 'postgresql':
+        return request.getfixturevalue('postgres_app')
+    return app
+
+
+def storm_on_another_stripe(new_storm, storm_id):
+    """A new storm whose SQLite in-process lock is not ``storm_id``'s."""
+    while True:
+        other_id, _ = new_storm()
+        if zlib.crc32(other_id.encode()) % STRIPES != zlib.crc32(storm_id.encode()) % STRIPES:
+            return other_id
+
+
+def test_lock_serializes_writers_of_a_storm(app, new_storm):
+    storm_id, _ = new_storm()
+    locked, order = threading.Event(), []
+
+    holder = threading.Thread(target=hold_lock, args=(app, storm_id, locked, order))
+    holder.start()
+    lock_after(app, storm_id, locked, order)
+    holder.join()
+
+    # The second writer waited for the first transaction's commit
+    assert order == ['first committed', 'second locked']
+
+
+def test_lock_leaves_other_storms_alone(app, new_storm):
+    storm_id, _ = new_storm()
+    other_id = storm_on_another_stripe(new_storm, storm_id)
+    locked, order = threading.Event(), []
+
+    holder = threading.Thread(target=hold_lock, args=(app, storm_id, locked, order))
+    holder.start()
+    lock_after(app, other_id, locked, order)
+    holder.join()
+
+    assert order == ['second locked', 'first committed']
+
+
+def test_concurrent_votes_stay_within_budget(app, new_storm, join, add_idea):
+    storm_id, moderator = new_storm()
+    alice = join(storm_id, 'alice')
+    idea_ids = [add_idea(alice, storm_id, f'idea {i}') for i in range(8)]
+    moderator.post(f'/api/storms/{storm_id}/advance-phase')
+
+    def vote(idea_id):
+        return alice.post(f'/api/ideas/{idea_id}/vote', json={'blueTokens': 2, 'comment': 'go'}).status_code
+
+    with ThreadPoolExecutor(len(idea_ids)) as pool:
+        statuses = list(pool.map(vote, idea_ids))
+
+    assert statuses.count(201) == BLUE_TOKENS // 2
+    with app.app_context():
+        assert db.session.query(func.sum(Vote.blue_tokens)).filter_by(storm_id=storm_id).scalar() <= BLUE_TOKENS
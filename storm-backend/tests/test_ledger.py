@@ -0,0 +1,97 @@
+import threading
+
+import pytest
+
+from conftest import BLUE_TOKENS, RED_TOKENS
+from src.models.user import db
+from src.models.storm import Storm, TokenLedger
+from src.services.ledger import InsufficientTokens, open_ledger, reserve_tokens
+
+USER = 'session-test'
+
+
+@pytest.fixture
+def storm_id(app, new_storm):
+    storm_id, _ = new_storm()
+    with app.app_context():
+        open_ledger(storm_id, USER)
+        db.session.commit()
+    return storm_id
+
+
+def spent(storm_id, user_id=USER):
+    ledger = db.session.get(TokenLedger, (storm_id, user_id), populate_existing=True)
+    return ledger.blue_spent, ledger.red_spent
+
+
+def test_reserve_within_budget_moves_spent_tokens(app, storm_id):
+    with app.app_context():
+        storm = db.session.get(Storm, storm_id)
+        reserve_tokens(storm, USER, 2, 1)
+        reserve_tokens(storm, USER, BLUE_TOKENS - 2, 0)
+        db.session.commit()
+        assert spent(storm_id) == (BLUE_TOKENS, 1)
+
+        # Negative deltas release tokens, e.g. from a replaced vote
+        reserve_tokens(storm, USER, -3, -1)
+        db.session.commit()
+        assert spent(storm_id) == (BLUE_TOKENS - 3, 0)
+
+
+@pytest.mark.parametrize('blue, red, color', [(BLUE_TOKENS, 0, 'blue'), (0, RED_TOKENS, 'red')])
+def test_reserve_over_budget_changes_nothing(app, storm_id, blue, red, color):
+    with app.app_context():
+        storm = db.session.get(Storm, storm_id)
+        reserve_tokens(storm, USER, 1, 1)
+        with pytest.raises(InsufficientTokens) as error:
+            reserve_tokens(storm, USER, blue, red)
+        assert error.value.color == color
+        assert spent(storm_id) == (1, 1)
+
+
+def test_missing_ledger_is_rebuilt_from_votes(app, new_storm, join, add_idea):
+    storm_id, moderator = new_storm()
+    alice = join(storm_id, 'alice')
+    idea_id = add_idea(alice, storm_id, 'idea')
+    moderator.post(f'/api/storms/{storm_id}/advance-phase')
+    vote = alice.post(f'/api/ideas/{idea_id}/vote', json={'blueTokens': 4, 'comment': 'a'}).get_json()
+
+    with app.app_context():
+        TokenLedger.query.delete()
+        db.session.commit()
+        storm = db.session.get(Storm, storm_id)
+        with pytest.raises(InsufficientTokens):
+            reserve_tokens(storm, vote['userId'], BLUE_TOKENS - 3, 0)
+        reserve_tokens(storm, vote['userId'], BLUE_TOKENS - 4, 0)
+        db.session.commit()
+        assert spent(storm_id, vote['userId']) == (BLUE_TOKENS, 0)
+
+
+def test_concurrent_reservations_cannot_overspend(app, storm_id):
+    # Each reservation alone fits the budget; no two fit together
+    threads = 8
+    amount = BLUE_TOKENS // 2 + 1
+    start = threading.Barrier(threads)
+    outcomes = []
+
+    def reserve():
+        with app.app_context():
+            storm = db.session.get(Storm, storm_id)
+            start.wait()
+            try:
+                reserve_tokens(storm, USER, amount, 0)
+                db.session.commit()
+                outcomes.append('reserved')
+            except InsufficientTokens:
+                db.session.rollback()
+                outcomes.append('refused')
+
+    workers = [threading.Thread(target=reserve) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert sorted(outcomes) == ['refused'] * (threads - 1) + ['reserved']
+    with app.app_context():
+        assert spent(storm_id) == (amount, 0)
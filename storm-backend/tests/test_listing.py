@@ -0,0 +1,26 @@
+import pytest
+
+
+def test_storms_are_listed_newest_first_one_page_at_a_time(app, new_storm):
+    created = [new_storm(title=f'storm {i}')[0] for i in range(5)]
+    client = app.test_client()
+
+    first = client.get('/api/storms', query_string={'limit': 3}).get_json()
+    second = client.get('/api/storms', query_string={'limit': 3, 'cursor': first['nextCursor']}).get_json()
+
+    assert [storm['id'] for storm in first['storms'] + second['storms']] == created[::-1]
+    assert second['nextCursor'] is None
+
+
+@pytest.mark.parametrize('query', [
+    {'limit': 'abc'},
+    {'limit': '0'},
+    {'limit': '-5'},
+    {'cursor': 'not a cursor'},
+    {'fields': 'id,password'},
+])
+def test_invalid_listing_request_is_400(app, query):
+    response = app.test_client().get('/api/storms', query_string=query)
+
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
@@ -0,0 +1,276 @@
+import json
+import random
+import threading
+import time
+
+import pytest
+
+from conftest import BLUE_TOKENS, RED_TOKENS
+from src.models.user import db
+from src.models.storm import Sequence, TokenLedger, Vote
+from src.services.live import LOG_SEQUENCE, LiveEngine, live_engine
+from src.services.results import result_row_to_dict, results_query
+
+
+def configure(engine, log_path):
+    engine.enabled = True
+    engine.log_path = str(log_path)
+    engine.flush_interval = 0.01
+
+
+@pytest.fixture
+def live(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(live_engine, 'enabled', False)
+    monkeypatch.setattr(live_engine, 'log_path', None)
+    monkeypatch.setattr(live_engine, 'flush_interval', 0.05)
+    configure(live_engine, tmp_path / 'live.log')
+    live_engine.start(app)
+    yield live_engine
+    live_engine.stop()
+
+
+@pytest.fixture
+def voting_storm(new_storm, join, add_idea):
+    """``voting_storm(participants, ideas) -> (storm id, moderator, participant clients, idea ids)``"""
+    def create(participants=3, ideas=4):
+        storm_id, moderator = new_storm()
+        clients = [join(storm_id, f'user {i}') for i in range(participants)]
+        idea_ids = [add_idea(clients[0], storm_id, f'idea {i}') for i in range(ideas)]
+        assert moderator.post(f'/api/storms/{storm_id}/advance-phase').status_code == 200
+        return storm_id, moderator, clients, idea_ids
+    return create
+
+
+def vote(client, idea_id, blue=0, red=0):
+    return client.post(f'/api/ideas/{idea_id}/vote', json={'blueTokens': blue, 'redTokens': red, 'comment': 'c'})
+
+
+def database_state(storm_id):
+    votes = {
+        (user_id, idea_id): (vote_id, blue, red)
+        for vote_id, user_id, idea_id, blue, red in db.session.query(
+            Vote.id, Vote.user_id, Vote.idea_id, Vote.blue_tokens, Vote.red_tokens
+        ).filter_by(storm_id=storm_id)
+    }
+    ledger = {
+        user_id: (blue, red)
+        for user_id, blue, red in db.session.query(
+            TokenLedger.user_id, TokenLedger.blue_spent, TokenLedger.red_spent
+        ).filter_by(storm_id=storm_id)
+        if blue or red
+    }
+    ranking = [result_row_to_dict(row, rank) for rank, row in enumerate(results_query(storm_id), start=1)]
+    return votes, ledger, ranking
+
+
+def live_state(live_storm):
+    votes = {
+        (live_storm.user_ids[vote.user], live_storm.ideas[vote.idea][0]): (vote.id, vote.blue, vote.red)
+        for vote in live_storm.votes.values()
+    }
+    ledger = {
+        user_id: (live_storm.blue_spent[index], live_storm.red_spent[index])
+        for user_id, index in live_storm.users.items()
+        if live_storm.blue_spent[index] or live_storm.red_spent[index]
+    }
+    return votes, ledger, live_storm.result_rows()
+
+
+def test_votes_are_served_from_memory(app, live, voting_storm):
+    storm_id, _, [alice, *_], idea_ids = voting_storm()
+
+    response = vote(alice, idea_ids[0], blue=2)
+
+    assert response.status_code == 201
+    live_storm = live._storms[storm_id]
+    assert live_storm.blue[live_storm.idea_index[idea_ids[0]]] == 2
+    results = app.test_client().get(f'/api/storms/{storm_id}/results').get_json()
+    assert results['results'][0]['ideaId'] == idea_ids[0]
+    assert results['results'][0]['blueScore'] == 2
+
+
+def test_concurrent_votes_cannot_overspend(app, live, voting_storm):
+    storm_id, _, [alice, *_], idea_ids = voting_storm(participants=1, ideas=8)
+    start = threading.Barrier(len(idea_ids))
+    statuses = []
+
+    def cast(idea_id):
+        start.wait()
+        statuses.append(vote(alice, idea_id, blue=2).status_code)
+
+    threads = [threading.Thread(target=cast, args=(idea_id,)) for idea_id in idea_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(statuses) == [201] * (BLUE_TOKENS // 2) + [400] * (len(idea_ids) - BLUE_TOKENS // 2)
+    assert live.flush()
+    with app.app_context():
+        votes, ledger, _ = database_state(storm_id)
+        assert sum(blue for _, blue, _ in votes.values()) == 2 * (BLUE_TOKENS // 2)
+        assert list(ledger.values()) == [(2 * (BLUE_TOKENS // 2), 0)]
+
+
+def test_database_matches_memory_after_flush(app, live, voting_storm):
+    storm_id, _, clients, idea_ids = voting_storm(participants=5, ideas=6)
+    rng = random.Random(7)
+    accepted = 0
+    for _ in range(200):
+        # Replacing votes at random, some over budget
+        if rng.random() < 0.6:
+            response = vote(rng.choice(clients), rng.choice(idea_ids), blue=rng.randint(1, 3))
+        else:
+            response = vote(rng.choice(clients), rng.choice(idea_ids), red=rng.randint(1, 2))
+        assert response.status_code in (201, 400)
+        accepted += response.status_code == 201
+    assert accepted > 50
+
+    assert live.flush()
+    with app.app_context():
+        assert database_state(storm_id) == live_state(live._storms[storm_id])
+        for blue, red in database_state(storm_id)[1].values():
+            assert blue <= BLUE_TOKENS and red <= RED_TOKENS
+
+
+def test_snapshot_waits_for_acknowledged_votes(app, live, voting_storm):
+    storm_id, _, [alice, *_], idea_ids = voting_storm()
+    live.flush_interval = 0.2
+
+    accepted = vote(alice, idea_ids[0], blue=1).get_json()
+    snapshot = alice.get(f'/api/storms/{storm_id}').get_json()
+
+    assert accepted['id'] in {vote['id'] for vote in snapshot['votes']}
+
+
+def stall_and_crash(engine):
+    """Stop the writer thread and drop the queue without persisting, like a killed process."""
+    with engine._cond:
+        engine._pending.clear()
+        engine._stopping = True
+        engine._cond.notify_all()
+    engine._thread.join()
+    engine._thread = None
+    engine._log.close()  # the process is gone: its lock on the log goes too
+    engine._storms.clear()
+
+
+def test_unflushed_log_is_replayed_after_a_crash(app, live, voting_storm, tmp_path):
+    storm_id, _, clients, idea_ids = voting_storm(participants=3, ideas=3)
+    assert live.flush()
+    live.flush_interval = 3600
+    time.sleep(0.1)  # the writer is now idle until the crash
+
+    acknowledged = {}
+    for i in range(30):
+        client = clients[i % 3]
+        response = vote(client, idea_ids[i % 3], blue=1 + i % 2)
+        assert response.status_code == 201
+        body = response.get_json()
+        acknowledged[(body['userId'], body['ideaId'])] = body['id']
+    with app.app_context():
+        assert Vote.query.filter_by(storm_id=storm_id).count() == 0
+
+    stall_and_crash(live)
+    with open(live.log_path, 'ab') as log:
+        log.write(b'{"storm": "torn by the crash", "us')
+
+    recovered = LiveEngine()
+    configure(recovered, live.log_path)
+    recovered.start(app)
+    try:
+        with app.app_context():
+            votes, ledger, _ = database_state(storm_id)
+            assert {key: vote_id for key, (vote_id, _, _) in votes.items()} == acknowledged
+            assert ledger == {
+                user_id: (sum(blue for (user, _), (_, blue, _) in votes.items() if user == user_id), 0)
+                for user_id in {user for user, _ in votes}
+            }
+            applied = db.session.get(Sequence, LOG_SEQUENCE).next_value
+        # Everything is in the database, so the log was emptied
+        assert open(live.log_path, 'rb').read() == b''
+    finally:
+        recovered.stop()
+
+    # Replaying again applies nothing twice
+    again = LiveEngine()
+    configure(again, live.log_path)
+    again.start(app)
+    again.stop()
+    with app.app_context():
+        assert database_state(storm_id)[0] == votes
+        assert db.session.get(Sequence, LOG_SEQUENCE).next_value == applied
+
+
+def test_second_process_cannot_take_the_log(app, live):
+    other = LiveEngine()
+    configure(other, live.log_path)
+    with pytest.raises(RuntimeError, match='locked by another process'):
+        other.start(app)
+
+
+def test_closed_storm_refuses_votes_until_released(app, live, voting_storm):
+    storm_id, _, [alice, *_], idea_ids = voting_storm()
+
+    # Closed before its first vote: the database still says voting, but the
+    # storm must not be loaded from it while the phase change commits
+    with app.app_context():
+        live.close_storm(storm_id)
+    assert vote(alice, idea_ids[0], blue=1).status_code == 409
+
+    # Phase change rolled back: votes load the storm again
+    live.release_storm(storm_id)
+    assert vote(alice, idea_ids[0], blue=1).status_code == 201
+
+
+def test_advance_during_votes_keeps_every_acknowledged_vote(app, live, voting_storm):
+    storm_id, moderator, clients, idea_ids = voting_storm(participants=6, ideas=2)
+    acknowledged = {}
+    refused = []
+    started = threading.Barrier(len(clients) + 1)
+
+    def keep_voting(client):
+        started.wait()
+        for i in range(10000):
+            response = vote(client, idea_ids[i % 2], blue=1)
+            if response.status_code != 201:
+                refused.append((response.status_code, response.get_json()['error']))
+                return
+            body = response.get_json()
+            acknowledged[(body['userId'], body['ideaId'])] = body['id']
+
+    threads = [threading.Thread(target=keep_voting, args=(client,)) for client in clients]
+    for thread in threads:
+        thread.start()
+    started.wait()
+    time.sleep(0.2)
+    assert moderator.post(f'/api/storms/{storm_id}/advance-phase').status_code == 200
+    for thread in threads:
+        thread.join()
+
+    # Voters stop on 409 (closing) or 400 (results phase), never on an error
+    assert len(refused) == len(clients)
+    assert {status for status, _ in refused} <= {400, 409}
+    assert storm_id not in live._storms
+    with app.app_context():
+        votes, _, ranking = database_state(storm_id)
+    assert {key: vote_id for key, (vote_id, _, _) in votes.items()} == acknowledged
+    results = app.test_client().get(f'/api/storms/{storm_id}/results').get_json()
+    assert results['status'] == 'results'
+    assert results['results'] == ranking
+
+
+def test_database_readers_wait_for_acknowledged_votes(app, live, voting_storm):
+    storm_id, moderator, [alice, bob, *_], idea_ids = voting_storm()
+    live.flush_interval = 1
+    time.sleep(0.05)  # the writer is waiting: votes now sit in memory until a reader syncs
+
+    assert vote(alice, idea_ids[0], blue=2).status_code == 201
+    analytics = moderator.get(f'/api/storms/{storm_id}/analytics?resamples=0').get_json()
+    assert analytics['voteCount'] == 1
+
+    assert vote(bob, idea_ids[1], red=1).status_code == 201
+    exported = moderator.get(f'/api/storms/{storm_id}/ideas:export').get_data(as_text=True)
+    scores = {row['ideaId']: row for row in map(json.loads, exported.splitlines())}
+    assert scores[idea_ids[0]]['blueScore'] == 2
+    assert scores[idea_ids[1]]['redScore'] == 1
@@ -0,0 +1,25 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from src.models.user import db
+from src.services.metrics import init_metrics, query_duration
+
+
+def timed(operation):
+    counts, _ = query_duration._series.get((operation,), ([0], 0.0))
+    return sum(counts)
+
+
+def test_failed_statements_leave_no_timer_behind(app):
+    init_metrics(app)
+    with app.app_context(), db.engine.connect() as conn:
+        before = timed('SELECT')
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                conn.execute(text('SELECT * FROM no_such_table'))
+        conn.execute(text('SELECT 1'))
+
+        assert not [key for key in conn.info if key.startswith('storm')]
+        # Only the statement that ran was timed
+        assert timed('SELECT') == before + 1
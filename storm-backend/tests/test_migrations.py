@@ -0,0 +1,123 @@
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import IntegrityError
+
+from src import migrations
+from src.migrations import MIGRATIONS, upgrade
+from src.models.user import db
+
+ALL_VERSIONS = [version for version, _, _ in MIGRATIONS]
+
+# Tables as they were before the first migration: no revision columns,
+# no archive column, no indexes and duplicate votes allowed
+LEGACY_SCHEMA = [
+    'CREATE TABLE storms (id VARCHAR(20) PRIMARY KEY, title VARCHAR(200) NOT NULL, status VARCHAR(20),'
+    ' expires_at TIMESTAMP, created_at TIMESTAMP)',
+    'CREATE TABLE ideas (id VARCHAR(50) PRIMARY KEY, storm_id VARCHAR(20), title VARCHAR(200), description TEXT)',
+    'CREATE TABLE votes (id VARCHAR(50) PRIMARY KEY, storm_id VARCHAR(20), idea_id VARCHAR(50), user_id VARCHAR(50),'
+    ' blue_tokens INTEGER, red_tokens INTEGER, created_at TIMESTAMP)',
+    'CREATE TABLE anonymous_users (session_id VARCHAR(50) PRIMARY KEY, storm_id VARCHAR(20))',
+    'CREATE TABLE token_ledger (storm_id VARCHAR(20), user_id VARCHAR(50), blue_spent INTEGER, red_spent INTEGER,'
+    ' PRIMARY KEY (storm_id, user_id))',
+    'CREATE TABLE sequences (name VARCHAR(50) PRIMARY KEY, next_value BIGINT)',
+]
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "legacy.db"}')
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def legacy_engine(engine):
+    with engine.begin() as conn:
+        for statement in LEGACY_SCHEMA:
+            conn.execute(text(statement))
+        conn.execute(text("INSERT INTO storms (id, title) VALUES ('s1', 'storm')"))
+        conn.execute(text("INSERT INTO ideas (id, storm_id, title) VALUES ('i1', 's1', 'idea'), ('i2', 's1', 'other')"))
+        # u1 voted twice on i1 (an old race); only the newer vote may survive
+        conn.execute(text(
+            'INSERT INTO votes (id, storm_id, idea_id, user_id, blue_tokens, red_tokens, created_at) VALUES'
+            " ('old', 's1', 'i1', 'u1', 3, 0, '2024-01-01 10:00:00'),"
+            " ('new', 's1', 'i1', 'u1', 1, 0, '2024-01-01 10:05:00'),"
+            " ('red', 's1', 'i2', 'u1', 0, 2, '2024-01-01 10:01:00')"
+        ))
+        conn.execute(text("INSERT INTO token_ledger VALUES ('s1', 'u1', 4, 2)"))
+    return engine
+
+
+def recorded_versions(engine):
+    with engine.connect() as conn:
+        return sorted(row[0] for row in conn.execute(text('SELECT version FROM schema_migrations')))
+
+
+def test_legacy_database_is_upgraded(legacy_engine):
+    assert upgrade(legacy_engine) == ALL_VERSIONS
+    assert recorded_versions(legacy_engine) == ALL_VERSIONS
+
+    inspector = inspect(legacy_engine)
+    for table in ('storms', 'ideas', 'votes', 'anonymous_users'):
+        assert 'revision' in {column['name'] for column in inspector.get_columns(table)}
+    assert 'archived_at' in {column['name'] for column in inspector.get_columns('storms')}
+    assert 'ix_votes_storm_id_revision' in {index['name'] for index in inspector.get_indexes('votes')}
+
+    with legacy_engine.begin() as conn:
+        assert sorted(row[0] for row in conn.execute(text('SELECT id FROM votes'))) == ['new', 'red']
+        # The ledger is rebuilt from the surviving votes
+        assert conn.execute(text('SELECT blue_spent, red_spent FROM token_ledger')).one() == (1, 2)
+        assert conn.execute(text("SELECT next_value FROM sequences WHERE name = 'storm_code'")).scalar() == 0
+        # Existing ideas are indexed for search under their new search_id
+        assert conn.execute(text(
+            "SELECT ideas.id FROM ideas_fts JOIN ideas ON ideas.search_id = ideas_fts.rowid"
+            " WHERE ideas_fts MATCH 'other'"
+        )).scalar() == 'i2'
+
+    with pytest.raises(IntegrityError), legacy_engine.begin() as conn:
+        conn.execute(text("INSERT INTO votes (id, storm_id, idea_id, user_id) VALUES ('again', 's1', 'i1', 'u1')"))
+
+
+def test_upgrade_is_idempotent(legacy_engine):
+    upgrade(legacy_engine)
+    assert upgrade(legacy_engine) == []
+    assert recorded_versions(legacy_engine) == ALL_VERSIONS
+
+
+def test_fresh_schema_only_records_migrations(engine):
+    # create_all already builds the current schema; the migrations must accept it
+    with engine.begin() as conn:
+        db.metadata.create_all(conn)
+    assert upgrade(engine) == ALL_VERSIONS
+    assert upgrade(engine) == []
+
+
+def test_only_pending_migrations_run(legacy_engine, monkeypatch):
+    upgrade(legacy_engine)
+    ran = []
+    monkeypatch.setattr(migrations, 'MIGRATIONS', MIGRATIONS + [
+        (ALL_VERSIONS[-1] + 1, 'new index', lambda conn: ran.append('new index')),
+    ])
+
+    assert upgrade(legacy_engine) == [ALL_VERSIONS[-1] + 1]
+    assert ran == ['new index']
+    assert upgrade(legacy_engine) == []
+    assert ran == ['new index']
+
+
+def test_failed_migration_is_not_recorded(legacy_engine, monkeypatch):
+    upgrade(legacy_engine)
+    version = ALL_VERSIONS[-1] + 1
+
+    def broken(conn):
+        conn.execute(text("UPDATE storms SET title = 'half done'"))
+        raise RuntimeError('broken migration')
+
+    monkeypatch.setattr(migrations, 'MIGRATIONS', MIGRATIONS + [(version, 'broken', broken)])
+
+    with pytest.raises(RuntimeError):
+        upgrade(legacy_engine)
+    assert version not in recorded_versions(legacy_engine)
+    with legacy_engine.connect() as conn:
+        # Rolled back with the migration's transaction
+        assert conn.execute(text('SELECT title FROM storms')).scalar() == 'storm'
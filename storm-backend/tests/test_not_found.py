@@ -0,0 +1,39 @@
+import pytest
+
+VOTE = {'blueTokens': 1, 'comment': 'c'}
+
+
+@pytest.mark.parametrize('method, path, body', [
+    ('get', '/api/storms/UNKNOWN', None),
+    ('get', '/api/storms/UNKNOWN/results', None),
+    ('get', '/api/storms/UNKNOWN/analytics', None),
+    ('get', '/api/storms/UNKNOWN/changes', None),
+    ('get', '/api/storms/UNKNOWN/ideas', None),
+    ('get', '/api/storms/UNKNOWN/ideas:export', None),
+    ('post', '/api/storms/UNKNOWN/join', {'username': 'alice'}),
+])
+def test_unknown_storm_is_404(app, method, path, body):
+    response = getattr(app.test_client(), method)(path, json=body)
+
+    assert response.status_code == 404
+    assert 'error' in response.get_json()
+
+
+@pytest.mark.parametrize('method, path, body', [
+    ('put', '/api/ideas/unknown', {'title': 'renamed'}),
+    ('delete', '/api/ideas/unknown', None),
+    ('post', '/api/ideas/unknown/vote', VOTE),
+])
+def test_unknown_idea_is_404(app, new_storm, method, path, body):
+    _, moderator = new_storm()
+
+    response = getattr(moderator, method)(path, json=body)
+
+    assert response.status_code == 404
+    assert 'error' in response.get_json()
+
+
+def test_existing_storm_is_not_404(app, new_storm):
+    storm_id, moderator = new_storm()
+    for path in ('', '/results', '/analytics', '/changes', '/ideas', '/ideas:export'):
+        assert moderator.get(f'/api/storms/{storm_id}{path}').status_code == 200, path
@@ -0,0 +1,17 @@
+from sqlalchemy import text
+
+from src.models.user import db
+from src.query_plans import full_table_scans
+
+
+def test_hot_queries_use_an_index(app):
+    with app.app_context():
+        assert full_table_scans() == []
+
+
+def test_a_missing_index_is_reported(app):
+    with app.app_context():
+        db.session.execute(text('DROP INDEX ix_ideas_storm_id_revision'))
+        db.session.commit()
+
+        assert ('storm ideas', 'ideas') in [(name, table) for name, table, _ in full_table_scans()]
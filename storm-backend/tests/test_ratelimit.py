@@ -0,0 +1,119 @@
+import pytest
+
+from src.services import ratelimit
+from src.services.ratelimit import DEFAULT_LIMITS, MemoryStore, RateLimiter, parse_limit, rate_limiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_bucket_allows_its_burst_then_refills(clock):
+    store = MemoryStore()
+    assert [store.take('k', 2, 3)[0] for _ in range(4)] == [True, True, True, False]
+
+    allowed, retry_after = store.take('k', 2, 3)
+    assert not allowed
+    assert retry_after == pytest.approx(0.5)
+
+    clock[0] += 0.5
+    assert store.take('k', 2, 3) == (True, 0)
+    assert not store.take('k', 2, 3)[0]
+
+
+def test_bucket_never_refills_past_its_burst(clock):
+    store = MemoryStore()
+    store.take('k', 1, 2)
+    clock[0] += 3600
+    assert [store.take('k', 1, 2)[0] for _ in range(3)] == [True, True, False]
+
+
+def test_buckets_are_independent_and_bounded(clock):
+    store = MemoryStore(maxsize=2)
+    assert store.take('a', 1, 1)[0]
+    assert not store.take('a', 1, 1)[0]
+    assert store.take('b', 1, 1)[0]
+
+    store.take('c', 1, 1)  # drops the least recently used bucket, a
+    assert len(store) == 2
+    assert store.take('a', 1, 1)[0]
+
+
+def test_check_takes_from_the_client_and_the_storm_bucket(clock):
+    limiter = RateLimiter(limits={'vote': {'client': (1, 2), 'storm': (1, 3)}})
+
+    assert limiter.check('vote', 'alice', 's1') == 0
+    assert limiter.check('vote', 'alice', 's1') == 0
+    # alice's bucket is empty, the storm still has one token
+    assert limiter.check('vote', 'alice', 's1') == pytest.approx(1)
+    assert limiter.check('vote', 'bob', 's1') == 0
+    # now the storm's bucket is empty for everyone
+    assert limiter.check('vote', 'carol', 's1') > 0
+    assert limiter.check('vote', 'carol', 's2') == 0
+
+
+def test_limits_come_from_the_environment():
+    limiter = RateLimiter()
+    limiter.configure({'RATE_LIMIT_VOTE_CLIENT': '2.5/7', 'RATE_LIMIT_MAX_IN_FLIGHT': '8'})
+
+    assert limiter.enabled
+    assert limiter.limits['vote']['client'] == (2.5, 7)
+    assert limiter.limits['vote']['storm'] == DEFAULT_LIMITS['vote']['storm']
+    assert limiter.max_in_flight == 8
+    assert parse_limit('5/50') == (5.0, 50)
+
+    limiter.configure({'RATE_LIMIT_ENABLED': '0'})
+    assert not limiter.enabled
+
+
+@pytest.fixture
+def limited(monkeypatch):
+    """Turn the app's rate limiter on with fresh buckets and ``limits``."""
+    def configure(limits, max_in_flight=64):
+        monkeypatch.setattr(rate_limiter, 'enabled', True)
+        monkeypatch.setattr(rate_limiter, 'store', MemoryStore())
+        monkeypatch.setattr(rate_limiter, 'limits', dict(DEFAULT_LIMITS, **limits))
+        monkeypatch.setattr(rate_limiter, 'max_in_flight', max_in_flight)
+    return configure
+
+
+def test_joins_from_one_address_are_limited_per_storm(app, new_storm, limited):
+    first, _ = new_storm()
+    second, _ = new_storm()
+    limited({'join': {'client': (0.001, 3), 'storm': (0.001, 100)}})
+
+    def join_status(storm_id):
+        return app.test_client().post(f'/api/storms/{storm_id}/join', json={'username': 'x'}).status_code
+
+    assert [join_status(first) for _ in range(4)] == [200, 200, 200, 429]
+    # Same address, another storm: its own bucket
+    assert join_status(second) == 200
+
+
+def test_rejected_request_says_when_to_retry(app, new_storm, join, add_idea, limited):
+    storm_id, _ = new_storm()
+    alice = join(storm_id, 'alice')
+    limited({'idea': {'client': (0.5, 1), 'storm': (20, 100)}})
+
+    assert alice.post(f'/api/storms/{storm_id}/ideas', json={'title': 'one'}).status_code == 201
+    response = alice.post(f'/api/storms/{storm_id}/ideas', json={'title': 'two'})
+
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '2'
+    # Another participant of the storm is not affected
+    add_idea(join(storm_id, 'bob'), storm_id, 'three')
+
+
+def test_overload_sheds_limited_requests(app, new_storm, join, limited):
+    storm_id, _ = new_storm()
+    alice = join(storm_id, 'alice')
+    limited({}, max_in_flight=0)
+
+    response = alice.post(f'/api/storms/{storm_id}/ideas', json={'title': 'idea'})
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '1'
+    # Reads are never limited
+    assert alice.get(f'/api/storms/{storm_id}').status_code == 200
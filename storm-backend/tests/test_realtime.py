@@ -0,0 +1,85 @@
+import pytest
+
+from src.routes.realtime import init_realtime, socketio
+from src.services.events import (
+    IDEA_CREATED, IDEA_UPDATED, PARTICIPANT_JOINED, PHASE_ADVANCED, VOTE_CAST, InProcessBackend, broker,
+)
+
+# Simulated clients watching one storm in the fan-out test
+WATCHERS = 150
+
+
+@pytest.fixture
+def realtime(app, monkeypatch):
+    # A fresh backend per test, so relays registered for earlier apps are gone
+    monkeypatch.setattr(broker, 'backend', InProcessBackend())
+    init_realtime(app)
+
+
+def watch(app, storm_id):
+    client = socketio.test_client(app)
+    assert client.emit('subscribe', {'stormId': storm_id}, callback=True) == {'subscribed': storm_id}
+    return client
+
+
+def storm_events(client):
+    return [packet['args'][0] for packet in client.get_received() if packet['name'] == 'storm_event']
+
+
+def test_changes_reach_subscribers(app, realtime, new_storm, join, add_idea):
+    storm_id, moderator = new_storm()
+    watcher = watch(app, storm_id)
+    participant = join(storm_id, 'alice')
+    storm_events(watcher)  # drop the join event
+
+    idea_id = add_idea(participant, storm_id, 'more coffee')
+    moderator.post(f'/api/storms/{storm_id}/advance-phase')
+    vote = participant.post(f'/api/ideas/{idea_id}/vote', json={'blueTokens': 2, 'comment': 'yes'}).get_json()
+
+    events = storm_events(watcher)
+    assert [event['type'] for event in events] == [IDEA_CREATED, PHASE_ADVANCED, VOTE_CAST]
+    assert all(event['stormId'] == storm_id for event in events)
+    assert events[0]['data']['id'] == idea_id
+    assert events[0]['data']['title'] == 'more coffee'
+    assert events[1]['data']['status'] == 'voting'
+    assert events[2]['data'] == {'vote': vote, 'replacedVoteId': None}
+
+
+def test_replacing_vote_names_the_replaced_vote(app, realtime, new_storm, join, add_idea):
+    storm_id, moderator = new_storm()
+    participant = join(storm_id, 'alice')
+    idea_id = add_idea(participant, storm_id, 'idea')
+    moderator.post(f'/api/storms/{storm_id}/advance-phase')
+    first = participant.post(f'/api/ideas/{idea_id}/vote', json={'blueTokens': 1, 'comment': 'a'}).get_json()
+    watcher = watch(app, storm_id)
+
+    participant.post(f'/api/storms/{storm_id}/votes:batch', json={
+        'votes': [{'ideaId': idea_id, 'blueTokens': 2, 'comment': 'b'}]
+    })
+
+    [event] = storm_events(watcher)
+    assert event['data']['replacedVoteId'] == first['id']
+
+
+def test_events_stay_in_their_storm(app, realtime, new_storm, join, add_idea):
+    storm_id, _ = new_storm()
+    other_id, _ = new_storm()
+    watcher = watch(app, other_id)
+
+    add_idea(join(storm_id, 'alice'), storm_id, 'idea')
+
+    assert storm_events(watcher) == []
+
+
+def test_every_subscriber_gets_each_change_once(app, realtime, new_storm, join, add_idea):
+    storm_id, moderator = new_storm()
+    watchers = [watch(app, storm_id) for _ in range(WATCHERS)]
+    participant = join(storm_id, 'alice')
+    idea_id = add_idea(participant, storm_id, 'idea')
+    participant.put(f'/api/ideas/{idea_id}', json={'title': 'better idea'})
+    moderator.post(f'/api/storms/{storm_id}/advance-phase')
+    participant.post(f'/api/ideas/{idea_id}/vote', json={'blueTokens': 1, 'comment': 'yes'})
+
+    expected = [PARTICIPANT_JOINED, IDEA_CREATED, IDEA_UPDATED, PHASE_ADVANCED, VOTE_CAST]
+    for watcher in watchers:
+        assert [event['type'] for event in storm_events(watcher)] == expected
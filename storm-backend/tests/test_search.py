@@ -0,0 +1,41 @@
+from sqlalchemy import text
+
+from src.models.user import db
+
+
+def search(client, storm_id, q):
+    response = client.get(f'/api/storms/{storm_id}/ideas', query_string={'q': q})
+    assert response.status_code == 200, response.get_json()
+    return sorted(idea['title'] for idea in response.get_json()['ideas'])
+
+
+def test_search_finds_ideas_by_word_prefix(app, new_storm, add_idea):
+    storm_id, moderator = new_storm()
+    add_idea(moderator, storm_id, 'more coffee machines')
+    add_idea(moderator, storm_id, 'fewer meetings')
+
+    assert search(moderator, storm_id, 'coff') == ['more coffee machines']
+    assert search(moderator, storm_id, 'meetings coffee') == []
+
+
+def test_search_survives_renumbered_rowids(app, new_storm, add_idea):
+    storm_id, moderator = new_storm()
+    titles = [f'idea {word}' for word in ('apple', 'banana', 'cherry', 'damson', 'elder')]
+    idea_ids = [add_idea(moderator, storm_id, title) for title in titles]
+    for idea_id in idea_ids[:3]:
+        assert moderator.delete(f'/api/ideas/{idea_id}').status_code == 204
+
+    # What VACUUM or a dump and reload may do to a table without an INTEGER PRIMARY KEY
+    with app.app_context():
+        db.session.execute(text('UPDATE ideas SET rowid = rowid + 100'))
+        db.session.commit()
+
+    assert search(moderator, storm_id, 'damson') == ['idea damson']
+    assert search(moderator, storm_id, 'elder') == ['idea elder']
+    assert search(moderator, storm_id, 'apple') == []
+
+    # Ideas added and edited after the VACUUM are found too
+    add_idea(moderator, storm_id, 'idea fig')
+    moderator.put(f'/api/ideas/{idea_ids[3]}', json={'title': 'idea grape'})
+    assert search(moderator, storm_id, 'idea') == ['idea elder', 'idea fig', 'idea grape']
+    assert search(moderator, storm_id, 'damson') == []
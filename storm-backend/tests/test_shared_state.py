@@ -0,0 +1,233 @@
+"""Shared state between worker processes.
+
+The counter tests run against the in-process backend and a real state
+server. The multi-worker tests start the state server and two
+single-process gunicorn servers (A and B) on one SQLite file, keep a
+Socket.IO client subscribed to a storm on B, and check that every vote
+posted to A reaches that client within ``MAX_LATENCY`` and is already in
+B's storm snapshot.
+"""
+import json
+import os
+import queue
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+import pytest
+import simple_websocket
+
+from src.services.shared_state import MemoryState, NetworkState
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VOTES = 40
+MAX_LATENCY = 0.5
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, proc, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f'process on port {port} exited with {proc.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'nothing listening on port {port} after {timeout}s')
+
+
+def stop(proc):
+    proc.terminate()
+    proc.wait(timeout=30)
+
+
+@pytest.fixture
+def state_server():
+    """``tcp://`` URL of a state server running for the test."""
+    port = free_port()
+    proc = subprocess.Popen([sys.executable, '-m', 'src.services.state_server', '--port', str(port)],
+                            cwd=BACKEND_DIR, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port, proc)
+        yield f'tcp://127.0.0.1:{port}'
+    finally:
+        stop(proc)
+
+
+def increment_concurrently(make_state, threads=8, times=250):
+    def run():
+        state = make_state()
+        for _ in range(times):
+            state.incr('votes')
+
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return threads * times
+
+
+def test_memory_counters_are_atomic():
+    state = MemoryState()
+    assert state.counter('votes') == 0
+    assert state.incr('votes', 5) == 5
+
+    expected = 5 + increment_concurrently(lambda: state)
+
+    assert state.counter('votes') == expected
+    assert state.counter('other') == 0
+
+
+def test_network_counters_are_shared_and_atomic(state_server):
+    port = int(state_server.rsplit(':', 1)[1])
+    reader = NetworkState('127.0.0.1', port)
+    assert reader.counter('votes') == 0
+
+    # Each thread a client of its own, like separate workers
+    expected = increment_concurrently(lambda: NetworkState('127.0.0.1', port))
+
+    assert reader.counter('votes') == expected
+    assert reader.incr('votes', -expected) == 0
+    assert reader._call('stats')['counters'] == 1
+
+
+def start_worker(port, env):
+    env = dict(env, GUNICORN_BIND=f'127.0.0.1:{port}', WEB_CONCURRENCY='1', WEB_ACCESS_LOG='/dev/null')
+    proc = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+                            cwd=BACKEND_DIR, env=env, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port, proc)
+    except RuntimeError:
+        stop(proc)
+        raise
+    return proc
+
+
+def call(port, method, path, body=None, token=None):
+    request = urllib.request.Request(f'http://127.0.0.1:{port}/api{path}', method=method,
+                                     data=json.dumps(body).encode() if body is not None else None)
+    request.add_header('Content-Type', 'application/json')
+    if token:
+        request.add_header('Authorization', f'Bearer {token}')
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.loads(response.read() or b'null')
+
+
+class StormEvents:
+    """Minimal Socket.IO (Engine.IO 4) client collecting one storm's events with their arrival time."""
+
+    def __init__(self, port, storm_id):
+        self.events = queue.Queue()
+        self.ws = simple_websocket.Client.connect(f'ws://127.0.0.1:{port}/socket.io/?EIO=4&transport=websocket')
+        assert self.ws.receive().startswith('0')  # Engine.IO open
+        self.ws.send('40')  # connect to the default namespace
+        assert self.ws.receive().startswith('40')
+        self.ws.send('421' + json.dumps(['subscribe', {'stormId': storm_id}]))
+        assert self.ws.receive().startswith('431')  # ack of the subscription
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        try:
+            while True:
+                packet = self.ws.receive()
+                if packet == '2':
+                    self.ws.send('3')  # pong
+                elif packet.startswith('42'):
+                    name, event = json.loads(packet[2:])
+                    if name == 'storm_event':
+                        self.events.put((time.perf_counter(), event))
+        except simple_websocket.ConnectionClosed:
+            pass
+
+    def wait_for_vote(self, vote_id, timeout):
+        deadline = time.perf_counter() + timeout
+        while True:
+            try:
+                arrived, event = self.events.get(timeout=max(0, deadline - time.perf_counter()))
+            except queue.Empty:
+                return None
+            if event['type'] == 'vote_cast' and event['data']['vote']['id'] == vote_id:
+                return arrived
+
+    def close(self):
+        self.ws.close()
+
+
+@pytest.fixture
+def workers(tmp_path):
+    """``workers(shared state url or None) -> (port of A, port of B)``"""
+    procs = []
+
+    def start(state_url):
+        env = dict(os.environ, DATABASE_URL=f'sqlite:///{tmp_path / "storm.db"}',
+                   PHASE_SCHEDULER='0', RATE_LIMIT_ENABLED='0')
+        env.pop('SOCKETIO_MESSAGE_QUEUE', None)
+        env.pop('SHARED_STATE_URL', None)
+        if state_url:
+            env['SHARED_STATE_URL'] = state_url
+        port_a, port_b = free_port(), free_port()
+        procs.append(start_worker(port_a, env))  # A creates the schema before B starts
+        procs.append(start_worker(port_b, env))
+        return port_a, port_b
+
+    yield start
+    for proc in reversed(procs):
+        stop(proc)
+
+
+def voting_storm(port):
+    """A storm in voting with two ideas, created through ``port``: ``(storm id, voter token, idea ids)``"""
+    created = call(port, 'POST', '/storms', {'title': 'multi-worker'})
+    storm_id, moderator = created['storm']['id'], created['token']
+    voter = call(port, 'POST', f'/storms/{storm_id}/join', {'username': 'voter'})['token']
+    ideas = [call(port, 'POST', f'/storms/{storm_id}/ideas', {'title': f'idea {i}'}, voter)['id']
+             for i in range(2)]
+    call(port, 'POST', f'/storms/{storm_id}/advance-phase', token=moderator)
+    return storm_id, voter, ideas
+
+
+def vote(port, idea_id, voter, comment):
+    return call(port, 'POST', f'/ideas/{idea_id}/vote',
+                {'blueTokens': 1, 'redTokens': 0, 'comment': comment}, voter)
+
+
+def test_vote_on_one_worker_reaches_the_other(state_server, workers):
+    port_a, port_b = workers(state_server)
+    storm_id, voter, ideas = voting_storm(port_a)
+    call(port_b, 'GET', f'/storms/{storm_id}')  # B has the snapshot cached
+    events = StormEvents(port_b, storm_id)
+    try:
+        for i in range(VOTES):
+            start = time.perf_counter()
+            # One blue token on alternating ideas: each vote replaces the previous one there
+            cast = vote(port_a, ideas[i % 2], voter, f'vote {i}')
+
+            arrived = events.wait_for_vote(cast['id'], MAX_LATENCY)
+            assert arrived is not None, f'vote {i} never reached worker B'
+            assert arrived - start <= MAX_LATENCY
+            snapshot = call(port_b, 'GET', f'/storms/{storm_id}')
+            assert cast['id'] in {v['id'] for v in snapshot['votes']}
+    finally:
+        events.close()
+
+
+def test_workers_without_shared_state_do_not_see_each_other(workers):
+    port_a, port_b = workers(None)
+    storm_id, voter, ideas = voting_storm(port_a)
+    events = StormEvents(port_b, storm_id)
+    try:
+        cast = vote(port_a, ideas[0], voter, 'unseen')
+        assert events.wait_for_vote(cast['id'], MAX_LATENCY) is None
+    finally:
+        events.close()
@@ -0,0 +1,60 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from src.models.user import db
+from src.models.storm import Storm
+
+
+@contextmanager
+def count_queries():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+
+def make_voting_storm(new_storm, join, add_idea, ideas=3, participants=2):
+    storm_id, moderator = new_storm()
+    clients = [join(storm_id, f'user {i}') for i in range(participants)]
+    idea_ids = [add_idea(clients[i % participants], storm_id, f'idea {i}') for i in range(ideas)]
+    moderator.post(f'/api/storms/{storm_id}/advance-phase')
+    for client in clients:
+        response = client.post(f'/api/ideas/{idea_ids[0]}/vote', json={'blueTokens': 1, 'comment': 'yes'})
+        assert response.status_code == 201
+    return storm_id, idea_ids, clients
+
+
+def test_snapshot_lists_every_child(app, new_storm, join, add_idea):
+    storm_id, idea_ids, _ = make_voting_storm(new_storm, join, add_idea)
+
+    storm = app.test_client().get(f'/api/storms/{storm_id}').get_json()
+
+    assert sorted(idea['id'] for idea in storm['ideas']) == sorted(idea_ids)
+    assert len(storm['votes']) == 2
+    assert {vote['ideaId'] for vote in storm['votes']} == {idea_ids[0]}
+    # The moderator joins their own storm
+    assert len(storm['participants']) == 3
+    assert {'user 0', 'user 1'} <= {user['username'] for user in storm['participants']}
+    # Participants who wrote an idea or voted
+    assert storm['participantCount'] == 2
+
+
+def test_eager_query_count_does_not_grow_with_storms(app, new_storm, join, add_idea):
+    counts = []
+    for _ in range(3):
+        make_voting_storm(new_storm, join, add_idea)
+        with app.app_context():
+            with count_queries() as statements:
+                storms = [storm.to_dict() for storm in Storm.eager_query().all()]
+            counts.append(len(statements))
+            assert all(storm['ideas'] and storm['votes'] and storm['participants'] for storm in storms)
+
+    # One query for the storms, one per batch-loaded relationship
+    assert counts == [4, 4, 4]
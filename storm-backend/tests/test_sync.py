@@ -0,0 +1,68 @@
+def changes(client, storm_id, since, etag=None):
+    headers = {'If-None-Match': etag} if etag else {}
+    return client.get(f'/api/storms/{storm_id}/changes?since={since}', headers=headers)
+
+
+def test_delta_holds_only_what_changed_since(app, new_storm, join, add_idea):
+    storm_id, _ = new_storm()
+    alice = join(storm_id, 'alice')
+    first = add_idea(alice, storm_id, 'first')
+    since = changes(alice, storm_id, 0).get_json()['version']
+
+    second = add_idea(alice, storm_id, 'second')
+    join(storm_id, 'bob')
+    delta = changes(alice, storm_id, since).get_json()
+
+    assert delta['since'] == since
+    assert delta['version'] > since
+    assert [idea['id'] for idea in delta['ideas']] == [second]
+    assert first not in {idea['id'] for idea in delta['ideas']}
+    assert [user['username'] for user in delta['participants']] == ['bob']
+    assert delta['deleted'] == {'ideas': [], 'votes': []}
+
+
+def test_deleted_idea_leaves_a_tombstone(app, new_storm, join, add_idea):
+    storm_id, _ = new_storm()
+    alice = join(storm_id, 'alice')
+    idea_id = add_idea(alice, storm_id, 'short-lived')
+    since = changes(alice, storm_id, 0).get_json()['version']
+
+    assert alice.delete(f'/api/ideas/{idea_id}').status_code == 204
+    delta = changes(alice, storm_id, since).get_json()
+
+    assert delta['ideas'] == []
+    assert delta['deleted']['ideas'] == [idea_id]
+    # A client that never saw the idea gets neither the idea nor a stale copy
+    assert idea_id not in {idea['id'] for idea in changes(alice, storm_id, 0).get_json()['ideas']}
+
+
+def test_replaced_vote_leaves_a_tombstone(app, new_storm, join, add_idea):
+    storm_id, moderator = new_storm()
+    alice = join(storm_id, 'alice')
+    idea_id = add_idea(alice, storm_id, 'idea')
+    moderator.post(f'/api/storms/{storm_id}/advance-phase')
+    old = alice.post(f'/api/ideas/{idea_id}/vote', json={'blueTokens': 1, 'comment': 'a'}).get_json()
+    since = changes(alice, storm_id, 0).get_json()['version']
+
+    new = alice.post(f'/api/ideas/{idea_id}/vote', json={'blueTokens': 3, 'comment': 'b'}).get_json()
+    delta = changes(alice, storm_id, since).get_json()
+
+    assert [vote['id'] for vote in delta['votes']] == [new['id']]
+    assert delta['deleted']['votes'] == [old['id']]
+
+
+def test_unchanged_storm_answers_304(app, new_storm, join, add_idea):
+    storm_id, _ = new_storm()
+    alice = join(storm_id, 'alice')
+    response = changes(alice, storm_id, 0)
+    etag = response.headers['ETag'].strip('"')
+
+    assert changes(alice, storm_id, 0, etag=etag).status_code == 304
+
+    add_idea(alice, storm_id, 'news')
+    assert changes(alice, storm_id, 0, etag=etag).status_code == 200
+
+
+def test_since_must_not_be_negative(app, new_storm):
+    storm_id, moderator = new_storm()
+    assert changes(moderator, storm_id, -1).status_code == 400
@@ -0,0 +1,4 @@
+"""Production entry point: ``gunicorn -c gunicorn.conf.py wsgi:app``."""
+from main import app, socketio, start_background_services  # noqa: F401
+
+start_background_services()
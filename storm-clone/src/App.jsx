@@ -19,6 +19,51 @@ function App() {
     checkSession()
   }, [])
 
+  // Apply pushed deltas instead of re-fetching the whole storm
+  const stormId = currentStorm?.id
+  useEffect(() => {
+    if (!stormId) return undefined
+    const refresh = () => ApiService.getStorm(stormId).then(setCurrentStorm).catch(console.error)
+    return ApiService.subscribeToStorm(stormId, (event) => {
+      if (event.type === 'ideas_imported') {
+        // Bulk imports are not sent as individual deltas
+        refresh()
+        return
+      }
+      applyStormEvent(event)
+    }, refresh)
+  }, [stormId])
+
+  const applyStormEvent = ({ type, data }) => {
+    setCurrentStorm(prev => {
+      if (!prev) return prev
+      switch (type) {
+        case 'idea_created':
+          if (prev.ideas.some(idea => idea.id === data.id)) return prev
+          return { ...prev, ideas: [...prev.ideas, data] }
+        case 'idea_updated':
+          return { ...prev, ideas: prev.ideas.map(idea => idea.id === data.id ? data : idea) }
+        case 'idea_deleted':
+          return { ...prev, ideas: prev.ideas.filter(idea => idea.id !== data.ideaId) }
+        case 'vote_cast': {
+          const votes = prev.votes.filter(vote =>
+            vote.id !== data.replacedVoteId &&
+            vote.id !== data.vote.id &&
+            !(vote.ideaId === data.vote.ideaId && vote.userId === data.vote.userId)
+          )
+          return { ...prev, votes: [...votes, data.vote] }
+        }
+        case 'participant_joined':
+          if ((prev.participants || []).some(p => p.sessionId === data.sessionId)) return prev
+          return { ...prev, participants: [...(prev.participants || []), data] }
+        case 'phase_advanced':
+          return { ...prev, status: data.status, expiresAt: data.expiresAt, updatedAt: data.updatedAt }
+        default:
+          return prev
+      }
+    })
+  }
+
   const checkSession = async () => {
     try {
       const sessionData = await ApiService.getSession()
@@ -1,19 +1,31 @@
+import { io } from 'socket.io-client'
+
 const API_BASE_URL = process.env.NODE_ENV === 'production' ? '' : 'http://localhost:5001'
 
+// Bodies fetch sends as they are (file uploads, form data, bytes); the
+// browser sets their Content-Type (and the multipart boundary) itself
+const isRawBody = (body) =>
+  body instanceof Blob ||
+  body instanceof FormData ||
+  body instanceof URLSearchParams ||
+  body instanceof ArrayBuffer ||
+  ArrayBuffer.isView(body)
+
 class ApiService {
   async request(endpoint, options = {} ) {
     const url = `${API_BASE_URL}/api${endpoint}`
+    const rawBody = isRawBody(options.body)
     
     const config = {
+      credentials: 'include', // Include cookies for session management
+      ...options,
       headers: {
-        'Content-Type': 'application/json',
+        ...(rawBody ? {} : { 'Content-Type': 'application/json' }),
         ...options.headers,
       },
-      credentials: 'include', // Include cookies for session management
-      ...options,
     }
 
-    if (options.body && typeof options.body === 'object') {
+    if (options.body && typeof options.body === 'object' && !rawBody) {
       config.body = JSON.stringify(options.body)
     }
 
@@ -49,6 +61,19 @@ class ApiService {
     return this.request(`/storms/${stormId}`)
   }
 
+  async getResults(stormId, { top, limit, offset } = {}) {
+    const params = new URLSearchParams()
+    if (top !== undefined) params.set('top', top)
+    if (limit !== undefined) params.set('limit', limit)
+    if (offset !== undefined) params.set('offset', offset)
+    const query = params.toString()
+    return this.request(`/storms/${stormId}/results${query ? `?${query}` : ''}`)
+  }
+
+  async getChanges(stormId, since = 0) {
+    return this.request(`/storms/${stormId}/changes?since=${since}`)
+  }
+
   async joinStorm(stormId, username) {
     return this.request(`/storms/${stormId}/join`, {
       method: 'POST',
@@ -70,6 +95,19 @@ class ApiService {
     })
   }
 
+  // file: a File/Blob of NDJSON (one {title, description} per line) or CSV
+  async importIdeas(stormId, file, format = 'ndjson') {
+    return this.request(`/storms/${stormId}/ideas:import?format=${format}`, {
+      method: 'POST',
+      headers: { 'Content-Type': format === 'csv' ? 'text/csv' : 'application/x-ndjson' },
+      body: file,
+    })
+  }
+
+  exportIdeasUrl(stormId, format = 'ndjson') {
+    return `${API_BASE_URL}/api/storms/${stormId}/ideas:export?format=${format}`
+  }
+
   async updateIdea(ideaId, ideaData) {
     return this.request(`/ideas/${ideaId}`, {
       method: 'PUT',
@@ -91,6 +129,35 @@ class ApiService {
     })
   }
 
+  // votes: [{ ideaId, blueTokens, redTokens, comment }], applied all or nothing
+  async submitVotes(stormId, votes) {
+    return this.request(`/storms/${stormId}/votes:batch`, {
+      method: 'POST',
+      body: { votes },
+    })
+  }
+
+  // Real-time events: calls onEvent({ type, stormId, data, ts }) for every
+  // change pushed on the storm's channel. When the server refuses the
+  // connection (it is at its live client limit), calls onStale every
+  // pollInterval ms instead so the caller can re-fetch. Returns an
+  // unsubscribe function.
+  subscribeToStorm(stormId, onEvent, onStale, pollInterval = 5000) {
+    const socket = io(API_BASE_URL || undefined, { withCredentials: true })
+    let poll = null
+    socket.on('connect', () => socket.emit('subscribe', { stormId }))
+    socket.on('storm_event', onEvent)
+    socket.on('connect_error', () => {
+      // Refused by the server: the client will not retry on its own
+      if (!socket.active && !poll && onStale) poll = setInterval(onStale, pollInterval)
+    })
+    return () => {
+      clearInterval(poll)
+      socket.emit('unsubscribe', { stormId })
+      socket.disconnect()
+    }
+  }
+
   // Session methods
   async getSession() {
     return this.request('/session')
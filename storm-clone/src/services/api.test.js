@@ -0,0 +1,64 @@
+// node --test: what the API client hands to fetch, read back as the browser would send it
+import { afterEach, beforeEach, test } from 'node:test'
+import assert from 'node:assert/strict'
+
+import api from './api.js'
+
+let sent
+const realFetch = globalThis.fetch
+
+beforeEach(() => {
+  sent = []
+  globalThis.fetch = async (url, config) => {
+    sent.push(new Request(url, config))
+    return new Response(JSON.stringify({ imported: 2 }), {
+      status: 201,
+      headers: { 'Content-Type': 'application/json' },
+    })
+  }
+})
+
+afterEach(() => {
+  globalThis.fetch = realFetch
+})
+
+test('importIdeas uploads the file bytes to ideas:import', async () => {
+  const lines = '{"title": "more coffee"}\n{"title": "fewer meetings", "description": "é"}\n'
+  const file = new File([lines], 'ideas.ndjson')
+
+  assert.deepEqual(await api.importIdeas('storm-1', file), { imported: 2 })
+
+  const [request] = sent
+  assert.equal(request.method, 'POST')
+  assert.match(request.url, /\/api\/storms\/storm-1\/ideas:import\?format=ndjson$/)
+  assert.equal(request.headers.get('Content-Type'), 'application/x-ndjson')
+  assert.deepEqual(new Uint8Array(await request.arrayBuffer()), new TextEncoder().encode(lines))
+})
+
+test('importIdeas sends CSV with its content type', async () => {
+  const csv = 'title,description\nmore coffee,\n'
+  await api.importIdeas('storm-1', new Blob([csv]), 'csv')
+
+  const [request] = sent
+  assert.match(request.url, /format=csv$/)
+  assert.equal(request.headers.get('Content-Type'), 'text/csv')
+  assert.equal(await request.text(), csv)
+})
+
+test('form data keeps the multipart boundary fetch generates', async () => {
+  const form = new FormData()
+  form.append('file', new File(['title\nidea\n'], 'ideas.csv'))
+  await api.request('/upload', { method: 'POST', body: form })
+
+  const [request] = sent
+  assert.match(request.headers.get('Content-Type'), /^multipart\/form-data; boundary=/)
+  assert.match(await request.text(), /title\r?\nidea/)
+})
+
+test('plain objects are still sent as JSON', async () => {
+  await api.joinStorm('storm-1', 'alice')
+
+  const [request] = sent
+  assert.equal(request.headers.get('Content-Type'), 'application/json')
+  assert.deepEqual(await request.json(), { username: 'alice' })
+})